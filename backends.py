@@ -0,0 +1,49 @@
+import importlib
+import importlib.util
+
+
+"""
+Lazy loading of optional dependencies (NumPy, Pillow and Shapely).
+
+Checking whether a backend is available only looks up its module spec, and 
+the backend itself is imported on first use. This keeps startup fast and 
+lets modules that merely might need NumPy or Pillow be imported for free.
+"""
+
+_available = {}
+_modules = {}
+
+# Helper for checking whether a module can be imported, without importing it
+def is_available(module_name):
+    if module_name not in _available:
+        try:
+            _available[module_name] = importlib.util.find_spec(module_name) is not None
+        except (ImportError, ValueError):
+            _available[module_name] = False
+    return _available[module_name]
+
+# Helper for importing a module the first time it is needed
+def load(module_name):
+    if module_name not in _modules:
+        _modules[module_name] = importlib.import_module(module_name)
+    return _modules[module_name]
+
+def has_numpy():
+    return is_available("numpy")
+
+def has_pil():
+    return is_available("PIL")
+
+def has_shapely():
+    return is_available("shapely")
+
+def numpy():
+    return load("numpy")
+
+# Returns the PIL Image and ImageDraw modules
+def pil():
+    return load("PIL.Image"), load("PIL.ImageDraw")
+
+# Returns the Shapely geometry and ops modules
+def shapely():
+    return load("shapely.geometry"), load("shapely.ops")
@@ -0,0 +1,144 @@
+import os
+import sys
+import glob
+import argparse
+import multiprocessing
+import defaults
+import fileLoader
+import normalization
+import pngExport
+import stripExport
+import heatmap
+import backends
+
+
+"""
+Headless batch renderer for focal point/yaw range files.
+
+Renders each input file to a PNG with the same geometry and display colors 
+as 'Save PNG' in the viewer, spreading files across a pool of worker 
+processes. No display or Tk is needed, only Pillow.
+
+Usage:
+
+python batchRender.py FocalPointFiles/*.txt --test-points points.txt --output-dir renders --jobs 8
+
+With --size, images larger than the viewer's 1024 x 1024 are rendered and
+written in strips (see stripExport.py) so they do not have to fit in memory.
+"""
+
+# Helper for expanding glob patterns that the shell did not expand (e.g. on Windows)
+def expand_input_files(patterns):
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if len(matches) == 0:
+            print("WARNING: No files match", pattern)
+        filenames.extend(matches)
+    return filenames
+
+# Helper for choosing where the PNG for an input file is written
+def output_filename(filename, output_dir):
+    base = os.path.splitext(os.path.basename(filename))[0] + ".png"
+    return os.path.join(output_dir if output_dir is not None else os.path.dirname(filename), base)
+
+# Renders a single FP/yaw file; runs in a worker process
+#
+# Returns (input filename, output filename, error message or None).
+def render_file(job):
+    filename, output, points, flipped, exact, merge_mode, heatmap_count, size, normalize, display_settings = job
+    try:
+        errors = []
+        fps_and_yaws = fileLoader.read_file(filename, errors)
+        for line_counter, message in errors:
+            print("INVALID FORMAT (" + filename + "):", message)
+        if normalize:
+            fps_and_yaws, stats = normalization.normalize_fps_and_yaws(fps_and_yaws)
+            print(filename + ":", stats.summary())
+
+        if size is None:
+            pngExport.render_image(fps_and_yaws, points, flipped, display_settings, exact=exact, 
+                                   merge_mode=merge_mode, heatmap_count=heatmap_count).save(output)
+        else:
+            stripExport.export_png(output, stripExport.build_scene(size, fps_and_yaws, points, flipped, 
+                                                                   display_settings, exact=exact, 
+                                                                   merge_mode=merge_mode, 
+                                                                   heatmap_count=heatmap_count))
+        return filename, output, None
+    except Exception as e:
+        return filename, output, str(e)
+
+# Helper for rendering many files across a process pool
+#
+# Returns the number of files that failed to render.
+def render_files(filenames, output_dir=None, points=None, flipped=True, display_settings=None, jobs=None, 
+                 exact=False, merge_mode="none", heatmap_count=None, size=None, normalize=False):
+    points = [] if points is None else points
+    display_settings = defaults.DISPLAY_SETTINGS if display_settings is None else display_settings
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    render_jobs = [(filename, output_filename(filename, output_dir), points, flipped, exact, merge_mode, 
+                    heatmap_count, size, normalize, display_settings) for filename in filenames]
+
+    failures = 0
+    with multiprocessing.Pool(processes=jobs) as pool:
+        for filename, output, error in pool.imap_unordered(render_file, render_jobs):
+            if error is None:
+                print("Rendered", filename, "->", output)
+            else:
+                failures += 1
+                print("FAILED:", filename + ":", error)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render FP/yaw files to PNG images without opening the viewer.")
+    parser.add_argument("files", nargs="+", help="FP/yaw files (text or binary) or glob patterns")
+    parser.add_argument("--test-points", action="append", default=[], 
+                        help="file with one 'x,z' test point per line; may be given more than once")
+    parser.add_argument("--output-dir", help="directory for the PNGs (default: next to each input file)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--no-flip", action="store_true", help="render with 'Flip Yaws' turned off")
+    parser.add_argument("--exact", action="store_true", help="compute yaws with the game's table-based arctangent")
+    parser.add_argument("--union", action="store_true", 
+                        help="draw the union of the wedges instead of every wedge (faster with Shapely)")
+    parser.add_argument("--heatmap", choices=heatmap.COUNT_MODES, 
+                        help="draw how many focal points or yaw ranges accept each position (needs NumPy)")
+    parser.add_argument("--colormap", choices=sorted(heatmap.COLORMAPS), 
+                        default=defaults.DISPLAY_SETTINGS["heatmap_colormap"],
+                        help="heatmap colormap")
+    parser.add_argument("--threshold", type=int, default=defaults.DISPLAY_SETTINGS["heatmap_threshold"], 
+                        help="smallest count drawn in the heatmap")
+    parser.add_argument("--size", type=int, 
+                        help="width and height of the images in pixels, up to " + str(stripExport.MAX_EXPORT_SIZE) 
+                             + " (default: 1024)")
+    parser.add_argument("--normalize", action="store_true", 
+                        help="merge duplicate focal points and overlapping yaw ranges before rendering")
+    args = parser.parse_args(argv)
+
+    if not backends.has_pil():
+        print("ERROR: Pillow is required to render PNG images.")
+        return 1
+    if args.heatmap is not None and not backends.has_numpy():
+        print("ERROR: NumPy is required to render heatmaps.")
+        return 1
+    if args.size is not None and not 1 <= args.size <= stripExport.MAX_EXPORT_SIZE:
+        print("ERROR: The image size must be between 1 and " + str(stripExport.MAX_EXPORT_SIZE) + " pixels.")
+        return 1
+    display_settings = dict(defaults.DISPLAY_SETTINGS, heatmap_colormap=args.colormap, 
+                            heatmap_threshold=args.threshold)
+
+    points = []
+    for test_point_file in args.test_points:
+        points.extend(fileLoader.read_test_points(test_point_file))
+
+    filenames = expand_input_files(args.files)
+    failures = render_files(filenames, args.output_dir, points, flipped=defaults.FLIPPED and not args.no_flip, 
+                            display_settings=display_settings, jobs=args.jobs, exact=args.exact, 
+                            merge_mode="union" if args.union else "none", heatmap_count=args.heatmap, 
+                            size=args.size, normalize=args.normalize)
+    print("Rendered", len(filenames) - failures, "of", len(filenames), "file(s).")
+    return 1 if failures > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
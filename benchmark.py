@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+import globalVars as gV
+import backends
+import fileLoader
+import binaryFormat
+import pngExport
+import stripExport
+import polygonMerge
+import raster
+import wedgeIndex
+import fpStore
+import tileCache
+from geometry import find_polygon
+from yawIndex import build_yaw_indices
+from classifier import classify_points
+
+
+"""
+Benchmark suite for the plotter.
+
+Generates synthetic FP/yaw data sets of increasing size (focal points spread 
+over the map, each with between 1 and a maximum number of yaw ranges, about 
+a quarter of them wrapping around 65535 -> 0) plus random test points, and 
+times the main stages of the program on them:
+
+ - read_file / save_file (text and binary)
+ - building an FPStore, and the memory per yaw range of everything the viewer 
+   keeps per range (store, yaw indices, culling arrays, wedge index) compared 
+   to a list of tuples
+ - find_polygon for every (focal point, yaw range) pair
+ - get_valid_invalid_points
+ - raster coverage (NumPy) and PNG export (Pillow), also at 4096 x 4096 in strips
+ - building the hover wedge index and querying it for every test point
+ - draw_screen, on a hidden Tk canvas if a display is available and on a 
+   recording canvas (no Tk, Python-side cost only) otherwise
+
+Results are written as JSON so runs from different versions can be compared:
+
+python benchmark.py --scales 100,1000,10000 --max-ranges 1,10,100 --output bench.json
+"""
+
+# Stages that do work per (focal point, yaw range) pair are skipped above this many pairs by default
+DEFAULT_MAX_WEDGES = 200000
+
+# The raster stage does work per focal point over the whole screen and is skipped above this many by default
+DEFAULT_MAX_RASTER_FPS = 1000
+
+# Size of the strip rendered PNG export benchmark
+LARGE_EXPORT_SIZE = 4096
+
+# Canvas stand-in used to time draw_screen when no display is available
+#
+# Every canvas method is accepted and only counted, so the timing covers
+# geometry, classification and item submission on the Python side.
+class RecordingCanvas:
+    def __init__(self):
+        self.calls = {}
+        self._next_item = 0
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self._next_item += 1
+            return self._next_item
+        return record
+
+# Helper for generating random focal points with 1 to 'max_ranges' yaw ranges each
+def generate_fps_and_yaws(fp_count, max_ranges, seed=0):
+    rng = random.Random(seed)
+    fps_and_yaws = []
+    for i in range(fp_count):
+        fp = (rng.uniform(-8192, 8192), rng.uniform(-8192, 8192))
+        yaw_ranges = []
+        for j in range(rng.randint(1, max_ranges)):
+            start = rng.randint(0, 65535)
+            if rng.random() < 0.25:
+                # Wrap-around range: the end comes before the start
+                end = rng.randint(0, start)
+            else:
+                end = rng.randint(start, 65535)
+            yaw_ranges.append((start, end))
+        fps_and_yaws.append((fp, yaw_ranges))
+    return fps_and_yaws
+
+# Helper for generating random test points inside the map
+def generate_test_points(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(-8192, 8192), rng.uniform(-8192, 8192)) for i in range(count)]
+
+# Helper for timing a function, returning the best of 'repeats' runs in seconds
+def time_best(function, repeats):
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Helper for estimating the bytes of Python objects making up a list of ((x, z), [(start, end), ...]) records
+#
+# Small integers are shared by the interpreter, so yaws below 257 are not counted.
+def record_list_size(fps_and_yaws):
+    size = sys.getsizeof(fps_and_yaws)
+    for record in fps_and_yaws:
+        fp, yaw_ranges = record
+        size += sys.getsizeof(record) + sys.getsizeof(fp) + sum(sys.getsizeof(value) for value in fp)
+        size += sys.getsizeof(yaw_ranges)
+        for yaw_range in yaw_ranges:
+            size += sys.getsizeof(yaw_range) + sum(sys.getsizeof(yaw) for yaw in yaw_range if yaw > 256)
+    return size
+
+# Helper for creating the canvas draw_screen is timed on
+def create_benchmark_canvas():
+    try:
+        import tkinter as tk
+        window = tk.Tk()
+        window.withdraw()
+        return window, tk.Canvas(master=window, width=1024, height=1024), "tk"
+    except Exception:
+        return None, RecordingCanvas(), "recording"
+
+# Helper for pointing main.py at the benchmark canvas and data, returning its draw_screen
+def setup_draw_screen(fps_and_yaws, yaw_indices, points, window, canvas):
+    import main
+    main.canvas = canvas
+    gV.window = window
+    gV.fps_and_yaws = fpStore.FPStore(fps_and_yaws)
+    gV.yaw_indices = yaw_indices
+    gV.points = points
+    gV.render_mode = "polygon"
+    # Timing the whole redraw needs it to finish before draw_screen returns
+    gV.render_in_background = False
+    return main.draw_screen
+
+# Runs every benchmark on one synthetic data set and returns the result records
+def run_scale(fp_count, max_ranges, args, directory, window, canvas):
+    fps_and_yaws = generate_fps_and_yaws(fp_count, max_ranges, seed=fp_count * 1000 + max_ranges)
+    points = generate_test_points(args.test_points, seed=fp_count)
+    range_count = sum(len(yaw_ranges) for fp, yaw_ranges in fps_and_yaws)
+    text_filename = os.path.join(directory, "bench.txt")
+    binary_filename = os.path.join(directory, "bench" + binaryFormat.FILE_EXTENSION)
+    yaw_indices = build_yaw_indices(fps_and_yaws)
+    store = fpStore.FPStore(fps_and_yaws)
+
+    # 'setup', if given, is only called if the benchmark runs and returns the function to time
+    def record(name, function=None, per_wedge=False, per_fp_raster=False, requires=None, setup=None):
+        result = {"benchmark": name, "fp_count": fp_count, "max_ranges": max_ranges, 
+                  "range_count": range_count, "test_point_count": len(points)}
+        if per_wedge and range_count > args.max_wedges:
+            result["skipped"] = "more than " + str(args.max_wedges) + " wedges"
+        elif per_fp_raster and fp_count > args.max_raster_fps:
+            result["skipped"] = "more than " + str(args.max_raster_fps) + " focal points"
+        elif requires is not None and not requires():
+            result["skipped"] = "missing optional dependency"
+        else:
+            result["seconds"] = time_best(function if setup is None else setup(), args.repeats)
+        print(json.dumps(result), file=sys.stderr)
+        return result
+
+    def find_all_polygons():
+        for fp, yaw_ranges in fps_and_yaws:
+            for yaw_range in yaw_ranges:
+                find_polygon(fp, yaw_range, True)
+
+    def export_png():
+        pngExport.render_image(fps_and_yaws, points, True, gV.display_settings, yaw_indices).save(
+            os.path.join(directory, "bench.png"))
+
+    def export_large_png():
+        stripExport.export_png(os.path.join(directory, "bench_large.png"), 
+                               stripExport.build_scene(LARGE_EXPORT_SIZE, fps_and_yaws, points, True, 
+                                                       gV.display_settings, yaw_indices))
+
+    def build_wedge_index():
+        index = wedgeIndex.WedgeIndex(store, True)
+        index.update()
+        return index
+
+    def setup_wedge_index_query():
+        index = build_wedge_index()
+        return lambda: [index.query(x, z) for x, z in points]
+
+    # Memory per yaw range of everything the viewer keeps per range, and of the equivalent list of tuples
+    #
+    # Besides the FPStore, the viewer keeps the yaw indices and, with NumPy, the 
+    # tile cache's culling arrays (raster mode) and the hover wedge index.
+    def memory_record():
+        per_range = lambda nbytes: nbytes / max(range_count, 1)
+        store_indices = build_yaw_indices(store)
+        result = {"benchmark": "fp_store_memory", "fp_count": fp_count, "max_ranges": max_ranges, 
+                  "range_count": range_count, "test_point_count": len(points),
+                  "store_bytes_per_range": store.bytes_per_range(),
+                  "yaw_index_bytes_per_range": per_range(store_indices.nbytes()),
+                  "list_bytes_per_range": per_range(record_list_size(fps_and_yaws))}
+        if backends.has_numpy():
+            cache = tileCache.TileCache()
+            cache.update_culling_arrays(store, store_indices)
+            result["tile_culling_bytes_per_range"] = per_range(cache.culling_nbytes())
+            if range_count <= args.max_wedges:
+                result["wedge_index_bytes_per_range"] = per_range(build_wedge_index().nbytes())
+        result["total_bytes_per_range"] = sum(value for name, value in result.items() 
+                                              if name.endswith("_bytes_per_range") and not name.startswith("list"))
+        print(json.dumps(result), file=sys.stderr)
+        return result
+
+    results = [
+        record("save_file", lambda: fileLoader.save_file(text_filename, fps_and_yaws)),
+        record("read_file", lambda: fileLoader.read_file(text_filename)),
+        record("save_file_binary", lambda: fileLoader.save_file(binary_filename, fps_and_yaws)),
+        record("read_file_binary", lambda: fileLoader.read_file(binary_filename)),
+        record("build_yaw_indices", lambda: build_yaw_indices(fps_and_yaws)),
+        record("fp_store_build", lambda: fpStore.FPStore(fps_and_yaws)),
+        memory_record(),
+        record("find_polygon", find_all_polygons, per_wedge=True),
+        record("get_valid_invalid_points", lambda: classify_points(fps_and_yaws, points, True, yaw_indices)),
+        record("get_valid_invalid_points_exact", 
+               lambda: classify_points(fps_and_yaws, points, True, yaw_indices, exact=True)),
+        record("raster_coverage", lambda: raster.coverage_mask(fps_and_yaws, yaw_indices, True), 
+               per_fp_raster=True, requires=backends.has_numpy),
+        record("heatmap_counts", lambda: raster.coverage_counts(fps_and_yaws, yaw_indices, True, count_ranges=True), 
+               per_fp_raster=True, requires=backends.has_numpy),
+        record("png_export", export_png, per_wedge=True, requires=backends.has_pil),
+        record("png_export_large", export_large_png, per_wedge=True, requires=backends.has_pil),
+        record("polygon_union", lambda: polygonMerge.merge_coverage(fps_and_yaws, True, "union").shapes(), 
+               per_wedge=True, requires=backends.has_shapely),
+        record("wedge_index_build", build_wedge_index, per_wedge=True, requires=backends.has_numpy),
+        record("wedge_index_query", setup=setup_wedge_index_query, per_wedge=True, requires=backends.has_numpy),
+        record("draw_screen", setup_draw_screen(fps_and_yaws, yaw_indices, points, window, canvas), 
+               per_wedge=True),
+    ]
+    return results
+
+# Helper for finding the current git commit, if any, so results can be matched to versions
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), 
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the plotter's pipeline stages on synthetic data.")
+    parser.add_argument("--scales", default="100,1000,10000", 
+                        help="comma separated focal point counts (default: 100,1000,10000; up to 1000000)")
+    parser.add_argument("--max-ranges", default="1,10,100", 
+                        help="comma separated maximum yaw ranges per focal point (default: 1,10,100)")
+    parser.add_argument("--test-points", type=int, default=1000, help="number of test points (default: 1000)")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per benchmark; the best is reported (default: 3)")
+    parser.add_argument("--max-wedges", type=int, default=DEFAULT_MAX_WEDGES, 
+                        help="skip per-wedge stages above this many (focal point, yaw range) pairs")
+    parser.add_argument("--max-raster-fps", type=int, default=DEFAULT_MAX_RASTER_FPS, 
+                        help="skip the raster stage above this many focal points")
+    parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    window, canvas, canvas_kind = create_benchmark_canvas()
+    report = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": backends.has_numpy(),
+        "pil": backends.has_pil(),
+        "draw_screen_canvas": canvas_kind,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for fp_count in [int(scale) for scale in args.scales.split(",")]:
+            for max_ranges in [int(ranges) for ranges in args.max_ranges.split(",")]:
+                report["results"].extend(run_scale(fp_count, max_ranges, args, directory, window, canvas))
+
+    if window is not None:
+        window.destroy()
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import sys
+import mmap
+import struct
+from array import array
+from fpStore import FPStore
+import fileLoader
+
+
+"""
+Compact binary storage for focal points and yaw ranges (.vhfp files).
+
+Layout (all values little-endian):
+
+ - Header (32 bytes): magic b"VHFP", uint16 version, uint16 reserved, 
+   uint64 focal point count N, uint64 yaw range count R, 8 reserved bytes
+ - float64[2 * N]:  focal points as x0, z0, x1, z1, ...
+ - uint64[N + 1]:   range offsets; focal point i owns ranges [offsets[i], offsets[i + 1])
+ - uint16[2 * R]:   yaw ranges as start0, end0, start1, end1, ...
+
+Every section is naturally aligned, so a memory-mapped file can be viewed 
+directly as typed arrays without parsing or creating per-record objects. 
+Conversion to and from the text format is lossless: focal points are stored 
+as the same float64 values read_file produces, and yaws must already fit in 
+[0, 65535].
+"""
+
+MAGIC = b"VHFP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQ8x")
+FILE_EXTENSION = ".vhfp"
+
+# Helper for checking whether a file starts with the binary format's magic bytes
+def is_binary_file(filename):
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+# Helper for computing the expected size in bytes of a file with N focal points and R ranges
+def file_size(fp_count, range_count):
+    return HEADER.size + 16 * fp_count + 8 * (fp_count + 1) + 4 * range_count
+
+# Helper for writing focal points and yaw ranges to a binary file
+def write_binary_file(filename, fps_and_yaws):
+    fps = array('d')
+    offsets = array('Q', [0])
+    yaws = array('H')
+    try:
+        for fp, yaw_ranges in fps_and_yaws:
+            fps.append(fp[0])
+            fps.append(fp[1])
+            for yaw_range in yaw_ranges:
+                yaws.append(yaw_range[0])
+                yaws.append(yaw_range[1])
+            offsets.append(len(yaws) // 2)
+    except OverflowError:
+        raise ValueError("Yaws must be within [0, 65535] to be stored in a binary FP/yaw file")
+
+    if sys.byteorder != "little":
+        for section in (fps, offsets, yaws):
+            section.byteswap()
+
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, len(fps) // 2, len(yaws) // 2))
+        fps.tofile(file)
+        offsets.tofile(file)
+        yaws.tofile(file)
+
+# Read-only memory map of a binary file that starts with a fixed size header
+#
+# Shared by the FP/yaw and test point (see testPoints.py) formats. The header 
+# struct starts with the magic bytes, a uint16 version and a uint16 reserved 
+# field; the remaining fields are kept in header_fields, and the file size 
+# has to match expected_size(*header_fields). section() views part of the file
+# as a typed array; close() releases those views before closing the map.
+class MappedBinaryFile:
+    def __init__(self, filename, header, magic, version, kind, expected_size):
+        self.filename = filename
+        self._views = []
+        with open(filename, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if len(self._mmap) < header.size:
+                raise ValueError(filename + " is too short to be a " + kind)
+            fields = header.unpack_from(self._mmap)
+            if fields[0] != magic:
+                raise ValueError(filename + " is not a " + kind)
+            if fields[1] != version:
+                raise ValueError(filename + " uses unsupported binary format version " + str(fields[1]))
+            if len(self._mmap) != expected_size(*fields[3:]):
+                raise ValueError(filename + " is truncated or corrupted")
+        except ValueError:
+            self._mmap.close()
+            raise
+
+        self.header_fields = fields[3:]
+        self.size = len(self._mmap)
+
+    # Helper for viewing a byte range of the file as a typed array
+    def section(self, start, end, typecode):
+        with memoryview(self._mmap) as whole, whole[start:end] as raw:
+            if sys.byteorder == "little":
+                view = raw.cast(typecode)
+                self._views.append(view)
+                return view
+            # Big-endian hosts cannot view the data in place, so fall back to a swapped copy
+            section = array(typecode, raw.tobytes())
+            section.byteswap()
+            return section
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Views have to be released before the map can be closed
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+# Read-only, memory-mapped view of a binary FP/yaw file
+#
+# fps, offsets and yaws are flat typed views into the mapped file. They are
+# copied into FPStores in bulk; records are only turned into Python tuples
+# when iterating, for callers that expect the ((x, z), [(start, end), ...])
+# layout.
+class BinaryFPFile(MappedBinaryFile):
+    def __init__(self, filename):
+        super().__init__(filename, HEADER, MAGIC, VERSION, "binary FP/yaw file", file_size)
+        self.fp_count, self.range_count = self.header_fields
+
+        offsets_start = HEADER.size + 16 * self.fp_count
+        yaws_start = offsets_start + 8 * (self.fp_count + 1)
+        self.fps = self.section(HEADER.size, offsets_start, 'd')
+        self.offsets = self.section(offsets_start, yaws_start, 'Q')
+        self.yaws = self.section(yaws_start, self.size, 'H')
+
+    def __len__(self):
+        return self.fp_count
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            yield from batch
+
+    # Returns focal points [first, last) as an FPStore, copying the sections in bulk
+    def read_store(self, first=0, last=None):
+        last = self.fp_count if last is None else min(last, self.fp_count)
+        first_range = self.offsets[first]
+        last_range = self.offsets[last]
+        if not first_range <= last_range <= self.range_count:
+            raise ValueError(self.filename + " has invalid yaw range offsets")
+        sections = (self.fps[2 * first:2 * last], self.offsets[first:last + 1], self.yaws[2 * first_range:2 * last_range])
+        try:
+            return FPStore.from_buffers(*sections)
+        finally:
+            # Slices of the views also keep the map open until they are released
+            for section in sections:
+                if isinstance(section, memoryview):
+                    section.release()
+
+    # Generator yielding FPStores of up to batch_size focal points each
+    def iter_batches(self, batch_size=2000):
+        for first in range(0, self.fp_count, batch_size):
+            yield self.read_store(first, first + batch_size)
+
+# Helper for reading a whole binary file into an FPStore
+def read_binary_file(filename):
+    with BinaryFPFile(filename) as binary_file:
+        return binary_file.read_store()
+
+# Helper for converting a text FP/yaw file into a binary one
+def convert_text_to_binary(text_filename, binary_filename):
+    write_binary_file(binary_filename, fileLoader.read_file(text_filename))
+
+# Helper for converting a binary FP/yaw file into a text one
+def convert_binary_to_text(binary_filename, text_filename):
+    with BinaryFPFile(binary_filename) as binary_file:
+        fileLoader.write_text_file(text_filename, binary_file)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python binaryFormat.py <input file> <output file>")
+        print("Converts between text and binary (" + FILE_EXTENSION + ") FP/yaw files based on the input file's contents.")
+        sys.exit(1)
+
+    if is_binary_file(sys.argv[1]):
+        convert_binary_to_text(sys.argv[1], sys.argv[2])
+    else:
+        convert_text_to_binary(sys.argv[1], sys.argv[2])
@@ -0,0 +1,139 @@
+from geometry import compute_p2p_yaw
+from yawIndex import YawIndexStore, build_yaw_indices, flatten_yaw_indices
+from fpStore import fp_array
+import backends
+import gameTrig
+
+
+"""
+Batched classification of test points against focal points and yaw ranges.
+
+A test point is valid if the yaw between it and at least one focal point lies
+within one of that focal point's yaw ranges. Membership is checked against the
+per-focal-point yaw indices (a yawIndex.YawIndexStore), which callers normally 
+build once at load time and pass in. When NumPy is available, all point-to-focal-point 
+yaws for a chunk of test points are computed as a single array and looked up 
+in every index at once. Otherwise a pure-Python loop with the same semantics 
+is used. With 'exact', yaws are computed like the game does (see gameTrig.py).
+"""
+
+# Upper bound on the number of (test point, focal point) pairs evaluated per NumPy chunk
+CHUNK_ELEMENTS = 1 << 22
+
+# Helper for finding the index of the first focal point accepting each test point (-1 if none do)
+def find_first_accepting_fps(fps_and_yaws, points, flipped, yaw_indices=None, exact=False):
+    if yaw_indices is None:
+        yaw_indices = build_yaw_indices(fps_and_yaws)
+    if backends.has_numpy():
+        return _find_first_accepting_fps_numpy(fps_and_yaws, yaw_indices, points, flipped, exact).tolist()
+    return _find_first_accepting_fps_python(fps_and_yaws, yaw_indices, points, flipped, exact)
+
+# Helper for splitting focal point indices [0, fp_count) into groups starting at the given indices
+#
+# Returns a list of (start, end) index ranges, skipping empty groups.
+def group_ranges(fp_count, group_starts=None):
+    starts = sorted(set([0] + [start for start in (group_starts or []) if 0 < start < fp_count]))
+    return [(start, end) for start, end in zip(starts, starts[1:] + [fp_count]) if start < end]
+
+# Helper for finding, for each test point, the focal point that makes it valid for every group of focal points
+#
+# A point is valid if each group (see group_ranges) has a focal point accepting
+# it; the result is the largest of those first accepting focal points, or -1.
+def find_first_accepting_fps_in_all_groups(fps_and_yaws, points, flipped, group_starts=None, yaw_indices=None, 
+                                           exact=False):
+    if yaw_indices is None:
+        yaw_indices = build_yaw_indices(fps_and_yaws)
+    groups = group_ranges(len(fps_and_yaws), group_starts)
+    if len(groups) == 0:
+        return [-1] * len(points)
+
+    first_fps = [0] * len(points)
+    for start, end in groups:
+        group_first_fps = find_first_accepting_fps(fps_and_yaws[start:end], points, flipped, 
+                                                   yaw_indices[start:end], exact)
+        first_fps = [-1 if first_fp < 0 or group_first_fp < 0 else max(first_fp, group_first_fp + start)
+                     for first_fp, group_first_fp in zip(first_fps, group_first_fps)]
+    return first_fps
+
+# Helper for splitting test points into valid and invalid points
+#
+# Valid points are ordered by the first focal point accepting them and invalid
+# points keep their original order, matching the original incremental search.
+# With group_starts, points have to be valid for every group of focal points.
+def classify_points(fps_and_yaws, points, flipped, yaw_indices=None, exact=False, group_starts=None):
+    if group_starts is None:
+        first_fps = find_first_accepting_fps(fps_and_yaws, points, flipped, yaw_indices, exact)
+    else:
+        first_fps = find_first_accepting_fps_in_all_groups(fps_and_yaws, points, flipped, group_starts, 
+                                                           yaw_indices, exact)
+
+    valid_indices = sorted((i for i in range(len(points)) if first_fps[i] >= 0), 
+                           key=lambda i: first_fps[i])
+    true_points = [points[i] for i in valid_indices]
+    false_points = [points[i] for i in range(len(points)) if first_fps[i] < 0]
+
+    return true_points, false_points
+
+# Pure-Python fallback used when NumPy is not installed
+def _find_first_accepting_fps_python(fps_and_yaws, yaw_indices, points, flipped, exact):
+    if not isinstance(yaw_indices, YawIndexStore):
+        yaw_indices = YawIndexStore(yaw_indices)
+    first_fps = []
+    for tp in points:
+        first_fp = -1
+        for fp_index, (fp, yaw_ranges) in enumerate(fps_and_yaws):
+            yaw = compute_p2p_yaw(fp, tp, exact) if flipped else compute_p2p_yaw(tp, fp, exact)
+            if yaw_indices.contains(fp_index, yaw):
+                first_fp = fp_index
+                break
+        first_fps.append(first_fp)
+    return first_fps
+
+# Helper for computing yaws from arrays of X/Z deltas (vectorized compute_p2p_yaw)
+def _yaws_from_deltas(dx, dz):
+    np = backends.numpy()
+    angles = np.trunc(np.arctan2(dz, dx) / np.pi * 32768).astype(np.int64)
+    return (16384 - angles) % 65536
+
+def _find_first_accepting_fps_numpy(fps_and_yaws, yaw_indices, points, flipped, exact):
+    np = backends.numpy()
+    first_fps = np.full(len(points), -1, dtype=np.int64)
+    if len(points) == 0:
+        return first_fps
+    key_starts, key_ends = flatten_yaw_indices(yaw_indices)
+    if len(key_starts) == 0:
+        return first_fps
+
+    fps = fp_array(fps_and_yaws)
+    key_offsets = np.arange(len(fps), dtype=np.int64) * 65536
+
+    tps = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if exact:
+        # The game works on single precision positions
+        fps = fps.astype(np.float32)
+        tps = tps.astype(np.float32)
+    chunk_size = max(1, CHUNK_ELEMENTS // len(fps))
+
+    for chunk_start in range(0, len(tps), chunk_size):
+        chunk = tps[chunk_start:chunk_start + chunk_size]
+
+        # Differences are taken in the same order as compute_p2p_yaw so signed zeros match
+        if flipped:
+            dx = chunk[:, 0, None] - fps[None, :, 0]
+            dz = chunk[:, 1, None] - fps[None, :, 1]
+        else:
+            dx = fps[None, :, 0] - chunk[:, 0, None]
+            dz = fps[None, :, 1] - chunk[:, 1, None]
+        yaws = gameTrig.atan2s_array(dz, dx) if exact else _yaws_from_deltas(dx, dz)
+        keys = yaws + key_offsets
+
+        # A key is accepted if it lies before the end of the last range starting at or before it.
+        # Ranges of earlier focal points always end before this focal point's keys begin.
+        range_ids = np.searchsorted(key_starts, keys, side="right") - 1
+        accepted = (range_ids >= 0) & (keys <= key_ends[np.maximum(range_ids, 0)])
+
+        hits = accepted.any(axis=1)
+        firsts = accepted.argmax(axis=1)
+        first_fps[chunk_start:chunk_start + len(chunk)] = np.where(hits, firsts, -1)
+
+    return first_fps
@@ -0,0 +1,74 @@
+import sys
+from geometry import wrap_yaw, compute_p2p_yaw, yaw_within_yaw_range, mario_to_screen
+from geometry import find_point_along_yaw_at_map_bounds, find_enclosed_corner_points, find_polygon
+from yawIndex import YawIndex, build_yaw_indices
+from classifier import classify_points, find_first_accepting_fps
+from fileLoader import read_file, save_file, read_test_points
+from normalization import normalize_fps_and_yaws
+from gameTrig import atan2s, atan2s_array
+
+
+"""
+Side-effect-free entry point to the plotter's geometry, classification and 
+file handling.
+
+Importing this module creates no window, reads no global state and does not 
+import Tk, NumPy, Pillow or Shapely; these are loaded lazily the first time
+a function needs them (see backends.py). All state is passed in explicitly:
+
+    import core
+    fps_and_yaws = core.read_file("FocalPointFiles/testSave.txt")
+    polygon = core.find_polygon(fps_and_yaws[0][0], fps_and_yaws[0][1][0], flipped=True)
+    valid, invalid = core.get_valid_invalid_points(fps_and_yaws, [(0.0, 0.0)], flipped=True)
+
+Run 'python core.py' to check the import time of this module against 
+IMPORT_TIME_BUDGET_MS in a fresh interpreter.
+"""
+
+# Maximum acceptable time for 'import core' in a fresh interpreter
+IMPORT_TIME_BUDGET_MS = 50.0
+
+# Modules that must not be pulled in by importing this module
+HEAVY_MODULES = ("tkinter", "numpy", "PIL", "shapely")
+
+# Helper for evaluating test points as valid/invalid
+def get_valid_invalid_points(fps_and_yaws, points, flipped, yaw_indices=None, exact=False):
+    return classify_points(fps_and_yaws, points, flipped, yaw_indices, exact)
+
+# Helper for measuring 'import core' in a fresh interpreter
+#
+# Returns the import time in milliseconds (best of 'repeats' runs) and the 
+# heavy modules that ended up loaded.
+def measure_import_time(repeats=5):
+    # Imported here so they do not count towards the measured import itself
+    import os
+    import json
+    import subprocess
+
+    script = ("import sys, time, json\n"
+              "start = time.perf_counter()\n"
+              "import core\n"
+              "elapsed = (time.perf_counter() - start) * 1000\n"
+              "heavy = [m for m in core.HEAVY_MODULES if m in sys.modules]\n"
+              "print(json.dumps([elapsed, heavy]))\n")
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    timings = []
+    heavy_modules = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], cwd=directory, 
+                                capture_output=True, text=True, check=True).stdout
+        elapsed, heavy_modules = json.loads(output)
+        timings.append(elapsed)
+    return min(timings), heavy_modules
+
+if __name__ == "__main__":
+    elapsed, heavy_modules = measure_import_time()
+    print("import core: {:.1f} ms (budget {:.1f} ms)".format(elapsed, IMPORT_TIME_BUDGET_MS))
+    if len(heavy_modules) > 0:
+        print("FAILED: importing core loaded", ", ".join(heavy_modules))
+        sys.exit(1)
+    if elapsed > IMPORT_TIME_BUDGET_MS:
+        print("FAILED: import time is over budget")
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,259 @@
+import os
+import sys
+import struct
+import argparse
+import multiprocessing
+import defaults
+from yawIndex import build_yaw_indices, flatten_yaw_indices
+from fpStore import fp_array
+import fileLoader
+import raster
+import backends
+
+
+"""
+Full resolution (1 unit) coverage of the map, stored bit-packed on disk.
+
+The viewer samples the map at 16 units per pixel, so gaps narrower than that
+never show up. This module evaluates every integer position (x, z) with
+x, z in [-8192, 8191] instead, i.e. a 16384 x 16384 grid, one tile at a time
+across a pool of worker processes. Each tile only considers the focal points
+whose yaw ranges can reach it, which is decided from the yaws towards the
+tile's corners.
+
+Layout of a .vhcg file (all values little-endian):
+
+ - Header (32 bytes): magic b"VHCG", uint16 version, uint16 flags
+   (1 = flipped, 2 = exact yaws), int32 minimum coordinate, uint32 grid size,
+   16 reserved bytes
+ - size rows of size / 8 bytes: row i holds z = minimum + i, and bit
+   (7 - j % 8) of byte j / 8 is set if x = minimum + j is a valid position
+
+The whole grid is 32 MB and is memory-mapped for queries, so checking a cell
+or listing the valid cells in a rectangle only touches the rows involved.
+Requires NumPy, which is imported on first use.
+
+Usage:
+
+python coverageGrid.py build FocalPointFiles/testSave.txt coverage.vhcg --jobs 8
+python coverageGrid.py query coverage.vhcg -100 250
+python coverageGrid.py query coverage.vhcg -100 250 -50 300
+"""
+
+MAGIC = b"VHCG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHiI16x")
+FILE_EXTENSION = ".vhcg"
+
+FLAG_FLIPPED = 1
+FLAG_EXACT = 2
+
+GRID_MIN = -8192
+GRID_SIZE = 16384
+TILE_SIZE = 1024
+
+# Helper for listing the (x, z) origins of the tiles covering the grid
+def tile_origins(tile_size=TILE_SIZE, grid_min=GRID_MIN, grid_size=GRID_SIZE):
+    return [(grid_min + x, grid_min + z) for z in range(0, grid_size, tile_size)
+            for x in range(0, grid_size, tile_size)]
+
+# State shared by the tiles computed in a worker process, set once per worker by init_worker
+_worker_state = None
+
+def init_worker(fps_and_yaws, flipped, exact, tile_size, grid_end=GRID_MIN + GRID_SIZE):
+    global _worker_state
+    yaw_indices = build_yaw_indices(fps_and_yaws)
+    fps = fp_array(fps_and_yaws)
+    _worker_state = (fps_and_yaws, yaw_indices, fps, flatten_yaw_indices(yaw_indices), flipped, exact, tile_size,
+                     grid_end)
+
+# Computes the bit-packed coverage of one tile; runs in a worker process
+#
+# Returns (x origin, z origin, packed rows, number of FPs considered).
+def compute_tile(origin):
+    np = backends.numpy()
+    fps_and_yaws, yaw_indices, fps, (key_starts, key_ends), flipped, exact, tile_size, grid_end = _worker_state
+    x0, z0 = origin
+    x1 = min(x0 + tile_size, grid_end) - 1
+    z1 = min(z0 + tile_size, grid_end) - 1
+
+    kept = raster.reaching_fps(fps, key_starts, key_ends, x0, z0, x1, z1, flipped).tolist()
+    xs = np.arange(x0, x1 + 1, dtype=np.float64)
+    zs = np.arange(z0, z1 + 1, dtype=np.float64)
+    mask = raster.coverage_mask([fps_and_yaws[i] for i in kept], [yaw_indices[i] for i in kept], flipped,
+                                xs, zs, exact)
+    return x0, z0, np.packbits(mask, axis=1), len(kept)
+
+# Helper for creating an empty grid file and mapping its rows for writing
+def create_grid_file(filename, flipped, exact, grid_min=GRID_MIN, grid_size=GRID_SIZE):
+    np = backends.numpy()
+    flags = (FLAG_FLIPPED if flipped else 0) | (FLAG_EXACT if exact else 0)
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, flags, grid_min, grid_size))
+        file.truncate(HEADER.size + grid_size * grid_size // 8)
+    return np.memmap(filename, dtype=np.uint8, mode="r+", offset=HEADER.size, shape=(grid_size, grid_size // 8))
+
+# Computes the full resolution coverage of fps_and_yaws and writes it to filename
+#
+# Tiles are spread across 'jobs' worker processes (default: CPU count; 1
+# computes them in this process). progress(tiles done, tile count) is called
+# after each tile. Returns the total number of FPs considered over all tiles.
+# The grid covers the whole map unless grid_min/grid_size say otherwise (e.g.
+# to check a smaller area).
+def build_coverage_grid(fps_and_yaws, filename, flipped, exact=False, jobs=None, tile_size=TILE_SIZE,
+                        progress=None, grid_min=GRID_MIN, grid_size=GRID_SIZE):
+    if tile_size <= 0 or tile_size % 8 != 0:
+        raise ValueError("Tile size must be a positive multiple of 8 to be bit-packed")
+    if grid_size <= 0 or grid_size % 8 != 0:
+        raise ValueError("Grid size must be a positive multiple of 8 to be bit-packed")
+
+    rows = create_grid_file(filename, flipped, exact, grid_min, grid_size)
+    origins = tile_origins(tile_size, grid_min, grid_size)
+    considered = 0
+    pool = None
+    if jobs == 1:
+        init_worker(fps_and_yaws, flipped, exact, tile_size, grid_min + grid_size)
+        tiles = map(compute_tile, origins)
+    else:
+        pool = multiprocessing.Pool(processes=jobs, initializer=init_worker,
+                                    initargs=(fps_and_yaws, flipped, exact, tile_size, grid_min + grid_size))
+        tiles = pool.imap_unordered(compute_tile, origins)
+
+    try:
+        for done, (x0, z0, packed, fp_count) in enumerate(tiles, 1):
+            row = z0 - grid_min
+            column = (x0 - grid_min) // 8
+            rows[row:row + packed.shape[0], column:column + packed.shape[1]] = packed
+            considered += fp_count
+            if progress is not None:
+                progress(done, len(origins))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        rows.flush()
+        del rows
+    return considered
+
+# Read-only, memory-mapped view of a .vhcg coverage grid
+class CoverageGrid:
+    def __init__(self, filename):
+        np = backends.numpy()
+        self.filename = filename
+        with open(filename, "rb") as file:
+            header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(filename + " is too short to be a coverage grid file")
+        magic, version, flags, self.minimum, self.size = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(filename + " is not a coverage grid file")
+        if version != VERSION:
+            raise ValueError(filename + " uses unsupported coverage grid version " + str(version))
+        if self.size % 8 != 0 or os.path.getsize(filename) != HEADER.size + self.size * self.size // 8:
+            raise ValueError(filename + " is truncated or corrupted")
+
+        self.flipped = bool(flags & FLAG_FLIPPED)
+        self.exact = bool(flags & FLAG_EXACT)
+        self.rows = np.memmap(filename, dtype=np.uint8, mode="r", offset=HEADER.size,
+                              shape=(self.size, self.size // 8))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # The map is released once the last view of it is gone
+        self.rows = None
+
+    # Returns whether the integer position (x, z) is a valid camera position; positions off the grid are not
+    def is_valid(self, x, z):
+        column = x - self.minimum
+        row = z - self.minimum
+        if not (0 <= column < self.size and 0 <= row < self.size):
+            return False
+        return bool((int(self.rows[row, column >> 3]) >> (7 - (column & 7))) & 1)
+
+    # Helper for unpacking the bits of the rectangle [x_min, x_max] x [z_min, z_max], clipped to the grid
+    #
+    # Returns (bits indexed by [z, x], x of the first column, z of the first row).
+    def _rect_bits(self, x_min, z_min, x_max, z_max):
+        np = backends.numpy()
+        first_column = max(x_min - self.minimum, 0)
+        last_column = min(x_max - self.minimum, self.size - 1)
+        first_row = max(z_min - self.minimum, 0)
+        last_row = min(z_max - self.minimum, self.size - 1)
+        if first_column > last_column or first_row > last_row:
+            return np.zeros((0, 0), dtype=np.uint8), x_min, z_min
+
+        packed = self.rows[first_row:last_row + 1, first_column >> 3:(last_column >> 3) + 1]
+        skip = first_column & 7
+        bits = np.unpackbits(packed, axis=1)[:, skip:skip + last_column - first_column + 1]
+        return bits, first_column + self.minimum, first_row + self.minimum
+
+    # Returns the valid integer positions (x, z) within [x_min, x_max] x [z_min, z_max], ordered by z then x
+    def valid_cells_in_rect(self, x_min, z_min, x_max, z_max):
+        np = backends.numpy()
+        bits, x0, z0 = self._rect_bits(x_min, z_min, x_max, z_max)
+        zs, xs = np.nonzero(bits)
+        return list(zip((xs + x0).tolist(), (zs + z0).tolist()))
+
+    # Returns the number of valid integer positions within [x_min, x_max] x [z_min, z_max]
+    def count_valid_in_rect(self, x_min, z_min, x_max, z_max):
+        bits = self._rect_bits(x_min, z_min, x_max, z_max)[0]
+        return int(bits.sum(dtype=backends.numpy().int64))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query full resolution coverage grids.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="compute the coverage grid of an FP/yaw file")
+    build_parser.add_argument("input", help="FP/yaw file (text or binary)")
+    build_parser.add_argument("output", help="coverage grid file to write (" + FILE_EXTENSION + ")")
+    build_parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    build_parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="tile width and height in units")
+    build_parser.add_argument("--no-flip", action="store_true", help="compute with 'Flip Yaws' turned off")
+    build_parser.add_argument("--exact", action="store_true", help="compute yaws with the game's table-based arctangent")
+
+    query_parser = subparsers.add_parser("query", help="check a position or list the valid positions in a rectangle")
+    query_parser.add_argument("grid", help="coverage grid file")
+    query_parser.add_argument("coords", type=int, nargs="+", metavar="COORD", help="x z, or x_min z_min x_max z_max")
+    args = parser.parse_args(argv)
+
+    if not backends.has_numpy():
+        print("ERROR: NumPy is required for coverage grids.")
+        return 1
+
+    if args.command == "build":
+        fps_and_yaws = fileLoader.read_file(args.input)
+        flipped = defaults.FLIPPED and not args.no_flip
+
+        def report(done, total):
+            print("\rComputed", done, "of", total, "tiles", end="" if done < total else "\n", flush=True)
+
+        try:
+            considered = build_coverage_grid(fps_and_yaws, args.output, flipped, args.exact, args.jobs,
+                                             args.tile_size, report)
+        except ValueError as e:
+            print("ERROR: " + str(e))
+            return 1
+        tiles = len(tile_origins(args.tile_size))
+        print("Wrote", args.output + ";", "{:.1f}".format(considered / tiles), "of", len(fps_and_yaws),
+              "FPs considered per tile on average.")
+        return 0
+
+    with CoverageGrid(args.grid) as grid:
+        if len(args.coords) == 2:
+            x, z = args.coords
+            print("VALID" if grid.is_valid(x, z) else "INVALID")
+        elif len(args.coords) == 4:
+            for x, z in grid.valid_cells_in_rect(*args.coords):
+                print(str(x) + "," + str(z))
+        else:
+            print("ERROR: Expected 2 or 4 coordinates.")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+"""
+Default settings shared by the viewer and the command line tools.
+
+globalVars starts from these, and the headless tools (batchRender.py,
+sequenceRender.py, testPoints.py, coverageGrid.py) use them directly, so
+they do not have to import globalVars and the viewer state it creates.
+"""
+
+# Whether yaws are flipped ('Flip Yaws' in the viewer)
+FLIPPED = True
+
+DISPLAY_SETTINGS = {
+    "background_color": "#800000",
+    "valid_position_color": "#FFFFFF",
+    "test_point_diameter": 8.0,
+    "test_point_success_color": "#00FF00",
+    "test_point_failure_color": "#FF8000",
+    "heatmap_colormap": "heat",
+    "heatmap_threshold": 1,
+    }
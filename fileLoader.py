@@ -0,0 +1,281 @@
+import os
+import queue
+import threading
+import binaryFormat
+import normalization
+
+
+"""
+Streaming reader for focal point/yaw range files.
+
+Files are expected to be a sequence of lines with the following format:
+
+focal_point_x,focal_point_z : yaw_range_1_start,yaw_range_1_end,...,yaw_range_n_start,yaw_range_n_end
+
+Blank lines and lines starting with '#' are skipped. Records are produced in
+batches so that large files never need to be held in memory as text, and a 
+malformed line is recorded as an error instead of stopping the whole load.
+The background loader also accepts binary files (see binaryFormat.py).
+"""
+
+# Number of focal points handed out per batch
+BATCH_SIZE = 2000
+
+# Maximum number of parsed batches waiting to be picked up by the UI
+MAX_QUEUED_BATCHES = 16
+
+# Helper for parsing one line into a focal point and its yaw ranges
+#
+# Returns None for blank and comment lines, and raises ValueError with a 
+# description of the problem for malformed lines.
+def parse_line(line, line_counter):
+    if line.strip() == "" or line.startswith("#"):
+        return None
+    linesplit = line.split(':')
+    if len(linesplit) != 2:
+        raise ValueError("Invalid number of colons on line " + str(line_counter) + "; should be one, but found " + str(len(linesplit) - 1) + "!")
+
+    fp_strings = linesplit[0].split(',')
+    if len(fp_strings) != 2:
+        raise ValueError("Found invalid number of focal point entries on line " + str(line_counter))
+
+    # Focal points without yaw ranges are written as 'x,z:' (e.g. when converting binary files)
+    yaw_strings = linesplit[1].split(',') if linesplit[1].strip() != "" else []
+    if len(yaw_strings) % 2 != 0:
+        raise ValueError("Found non-even number of yaw range entries on line " + str(line_counter))
+
+    try:
+        fp = float(fp_strings[0]), float(fp_strings[1])
+        yaws = []
+        for i in range(int(len(yaw_strings)/2)):
+            yaws.append((int(yaw_strings[2*i]), int(yaw_strings[2*i+1])))
+    except ValueError:
+        raise ValueError("Found non-numeric entry on line " + str(line_counter))
+
+    # Yaws are stored as 16 bit values (see fpStore.py)
+    if any(not (0 <= yaw <= 65535) for yaw_range in yaws for yaw in yaw_range):
+        raise ValueError("Found yaw outside of [0, 65535] on line " + str(line_counter))
+
+    return fp, yaws
+
+# Generator yielding (records, bytes_read) batches from a file opened in binary mode
+#
+# Errors for malformed lines are appended to 'errors' as (line_number, message).
+# If 'lines' is given, every line read is also passed to lines.add(raw_line, 
+# has_record) (see fileWatcher.LineTable).
+def iter_record_batches(file, errors, batch_size=BATCH_SIZE, lines=None):
+    batch = []
+    bytes_read = 0
+    for line_counter, raw_line in enumerate(file, 1):
+        bytes_read += len(raw_line)
+        try:
+            record = parse_line(raw_line.decode("utf-8", errors="replace"), line_counter)
+        except ValueError as e:
+            errors.append((line_counter, str(e)))
+            record = None
+        if lines is not None:
+            lines.add(raw_line, record is not None)
+        if record is None:
+            continue
+
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch, bytes_read
+            batch = []
+
+    if len(batch) > 0:
+        yield batch, bytes_read
+
+# Helper for reading in a list of focal points and associated acceptable yaws
+#
+# Binary files are detected automatically. Malformed lines are skipped; they
+# are collected in 'errors' if given, and printed otherwise.
+def read_file(filename, errors=None):
+    if binaryFormat.is_binary_file(filename):
+        return binaryFormat.read_binary_file(filename)
+
+    line_errors = [] if errors is None else errors
+    fps_and_yaws = []
+    with open(filename, "rb") as file:
+        for batch, bytes_read in iter_record_batches(file, line_errors):
+            fps_and_yaws.extend(batch)
+
+    if errors is None:
+        print_errors(line_errors)
+    return fps_and_yaws
+
+# Helper for parsing one line of a test point file into an (x, z) tuple
+#
+# Returns None for blank and comment lines and for a CSV header on the first 
+# line, and raises ValueError for malformed lines.
+def parse_test_point_line(line, line_counter):
+    if line.strip() == "" or line.startswith("#"):
+        return None
+    if line_counter == 1 and not any(c.isdigit() for c in line):
+        return None
+    point_strings = line.split(',')
+    try:
+        if len(point_strings) != 2:
+            raise ValueError
+        return float(point_strings[0]), float(point_strings[1])
+    except ValueError:
+        raise ValueError("Found invalid test point on line " + str(line_counter))
+
+# Generator yielding (points, bytes_read) batches from a test point file opened in binary mode
+#
+# Errors for malformed lines are appended to 'errors' as (line_number, message).
+def iter_test_point_batches(file, errors, batch_size=BATCH_SIZE):
+    batch = []
+    bytes_read = 0
+    for line_counter, raw_line in enumerate(file, 1):
+        bytes_read += len(raw_line)
+        try:
+            point = parse_test_point_line(raw_line.decode("utf-8", errors="replace"), line_counter)
+        except ValueError as e:
+            errors.append((line_counter, str(e)))
+            continue
+        if point is None:
+            continue
+
+        batch.append(point)
+        if len(batch) >= batch_size:
+            yield batch, bytes_read
+            batch = []
+
+    if len(batch) > 0:
+        yield batch, bytes_read
+
+# Helper for reading test points from a file with one 'x,z' pair per line
+def read_test_points(filename, errors=None):
+    line_errors = [] if errors is None else errors
+    points = []
+    with open(filename, "rb") as file:
+        for batch, bytes_read in iter_test_point_batches(file, line_errors):
+            points.extend(batch)
+
+    if errors is None:
+        print_errors(line_errors)
+    return points
+
+# Helper for saving out a list of focal points and associated acceptable yaws
+def write_text_file(filename, fps_and_yaws):
+    with open(filename, "w") as file:
+        for fp, yaw_ranges in fps_and_yaws:
+            yaw_str = ','.join(str(yaw_range[0]) + ',' + str(yaw_range[1]) for yaw_range in yaw_ranges)
+            file.write(str(fp[0]) + ',' + str(fp[1]) + ":" + yaw_str + '\n')
+
+# Helper for saving focal points and yaw ranges, in the binary format if the file has the binary extension
+def save_file(filename, fps_and_yaws):
+    if filename.lower().endswith(binaryFormat.FILE_EXTENSION):
+        binaryFormat.write_binary_file(filename, fps_and_yaws)
+    else:
+        write_text_file(filename, fps_and_yaws)
+
+# Helper for printing collected line errors
+def print_errors(errors):
+    for line_counter, message in errors:
+        print("INVALID FORMAT:", message)
+
+# Parses a focal point/yaw file on a worker thread
+#
+# Parsed batches are queued for the UI thread, which picks them up with 
+# take_batches() while polling. The worker blocks while the queue is full, 
+# so memory stays bounded even if the UI falls behind. For text files, 'lines' 
+# is passed on to iter_record_batches.
+#
+# With 'normalize', the whole file is parsed before it is normalized (see 
+# normalization.py) and handed out in batches; 'normalization' then holds the
+# NormalizationStats.
+class BackgroundFileLoader:
+    def __init__(self, filename, batch_size=BATCH_SIZE, lines=None, normalize=False):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.lines = lines
+        self.normalize = normalize
+        self.normalization = None
+        self.errors = []
+        self.total_bytes = max(os.path.getsize(filename), 1)
+        self.bytes_read = 0
+
+        self._batches = queue.Queue(maxsize=MAX_QUEUED_BATCHES)
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    # Returns whether the worker is done and every batch has been taken
+    def finished(self):
+        return self._finished.is_set() and self._batches.empty()
+
+    # Returns the fraction of the file parsed so far
+    def progress(self):
+        return min(self.bytes_read / self.total_bytes, 1.0)
+
+    # Returns up to 'max_batches' parsed batches without blocking
+    def take_batches(self, max_batches=4):
+        batches = []
+        while len(batches) < max_batches:
+            try:
+                batches.append(self._batches.get_nowait())
+            except queue.Empty:
+                break
+        return batches
+
+    def _run(self):
+        try:
+            if binaryFormat.is_binary_file(self.filename):
+                batches = self._binary_batches()
+            else:
+                batches = self._text_batches()
+            if self.normalize:
+                batches = self._normalized_batches(batches)
+            for batch, bytes_read in batches:
+                if not self._put(batch):
+                    return
+                self.bytes_read = bytes_read
+        except (OSError, ValueError) as e:
+            self.errors.append((0, "Could not read " + self.filename + ": " + str(e)))
+        finally:
+            self._finished.set()
+
+    def _text_batches(self):
+        with open(self.filename, "rb") as file:
+            yield from iter_record_batches(file, self.errors, self.batch_size, self.lines)
+
+    # Duplicates can be anywhere in the file, so nothing is handed out before all of it is read
+    def _normalized_batches(self, batches):
+        fps_and_yaws = []
+        for batch, bytes_read in batches:
+            if self._cancelled.is_set():
+                return
+            fps_and_yaws.extend(batch)
+            self.bytes_read = bytes_read
+        fps_and_yaws, self.normalization = normalization.normalize_fps_and_yaws(fps_and_yaws)
+        for first in range(0, len(fps_and_yaws), self.batch_size):
+            yield fps_and_yaws[first:first + self.batch_size], self.total_bytes
+
+    # Binary files are already parsed, so progress is reported by focal points converted
+    def _binary_batches(self):
+        with binaryFormat.BinaryFPFile(self.filename) as binary_file:
+            converted = 0
+            for batch in binary_file.iter_batches(self.batch_size):
+                converted += len(batch)
+                yield batch, self.total_bytes * converted // max(len(binary_file), 1)
+
+    # Queues a batch, giving up if the load is cancelled while waiting for space
+    def _put(self, batch):
+        while not self._cancelled.is_set():
+            try:
+                self._batches.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -0,0 +1,262 @@
+import os
+import queue
+import hashlib
+import threading
+from array import array
+import fileLoader
+
+
+"""
+Watches loaded focal point/yaw files for changes, so searches that are still
+writing their results can be followed in the viewer.
+
+Every line of a loaded text file is remembered in a LineTable: where it
+starts, a hash of its bytes and whether it produced a focal point, along with
+a hash of all complete lines together. A worker thread checks the watched
+files every WATCH_INTERVAL seconds. If a file grew and the bytes that were
+read before are unchanged (which only needs hashing, not parsing), only the
+lines after them are read. Otherwise the whole file is read again, and the
+line hashes are compared to find the block of lines between the unchanged
+beginning and end. Either way, only the changed lines are parsed.
+
+Changes are queued as FileChange objects, which replace a run of a file's
+focal points with new ones. Large changes are split up so that the UI thread,
+which takes them with take_changes(), only has a bounded amount of work per
+change. A final line without a newline may still be being written, so it is
+only read once it stayed the same for a check.
+"""
+
+# Seconds between checks of the watched files
+WATCH_INTERVAL = 1.0
+
+# Largest number of new focal points in one FileChange
+MAX_CHANGE_RECORDS = fileLoader.BATCH_SIZE
+
+# Files are not checked while this many changes are waiting to be taken
+MAX_QUEUED_CHANGES = 16
+
+# Bytes read at a time while checking that the known part of a file is unchanged
+VERIFY_CHUNK_SIZE = 1 << 20
+
+# Helper for hashing the bytes of one line
+def line_hash(raw_line):
+    return int.from_bytes(hashlib.blake2b(raw_line, digest_size=8).digest(), "little")
+
+# The lines of a text file as they were last read
+class LineTable:
+    def __init__(self):
+        self.starts = array('q')
+        self.hashes = array('Q')
+        # 1 for lines that produced a focal point, 0 for blank, comment and malformed lines
+        self.has_record = bytearray()
+        self.size = 0
+        self.last_line_complete = True
+        # Hash of the bytes of every line but an incomplete final one, and how many bytes that is
+        self.complete_hash = hashlib.blake2b()
+        self.complete_size = 0
+
+    def __len__(self):
+        return len(self.hashes)
+
+    # Returns the number of lines that end with a newline
+    def complete_count(self):
+        return len(self) - (0 if self.last_line_complete else 1)
+
+    def add(self, raw_line, has_record):
+        self.starts.append(self.size)
+        self.hashes.append(line_hash(raw_line))
+        self.has_record.append(1 if has_record else 0)
+        self.size += len(raw_line)
+        self.last_line_complete = raw_line.endswith(b"\n")
+        if self.last_line_complete:
+            self.complete_hash.update(raw_line)
+            self.complete_size += len(raw_line)
+
+    # Returns the number of focal points from the lines before line_index
+    def record_count(self, line_index):
+        return self.has_record.count(1, 0, line_index)
+
+    # Removes every line from line_index on
+    #
+    # Only the incomplete final line or all lines can be removed, as the hash 
+    # of the complete lines cannot be taken back.
+    def truncate(self, line_index):
+        if line_index == 0:
+            self.complete_hash = hashlib.blake2b()
+            self.complete_size = 0
+        elif line_index < self.complete_count():
+            raise ValueError("Cannot remove complete lines from a line table")
+        if line_index < len(self):
+            self.size = self.starts[line_index]
+        del self.starts[line_index:]
+        del self.hashes[line_index:]
+        del self.has_record[line_index:]
+        self.last_line_complete = True
+
+# Replaces 'removed_count' focal points of a file, starting at its 'first_record'th one, with 'records'
+class FileChange:
+    __slots__ = ("file_id", "first_record", "removed_count", "records", "errors")
+
+    def __init__(self, file_id, first_record, removed_count, records, errors=()):
+        self.file_id = file_id
+        self.first_record = first_record
+        self.removed_count = removed_count
+        self.records = records
+        self.errors = errors
+
+# One watched file and what is known about its contents
+class WatchedFile:
+    def __init__(self, file_id, filename, lines):
+        self.file_id = file_id
+        self.filename = filename
+        self.lines = lines
+        self.error = None
+        self._stat = None
+        # Hash of the final line if it has no newline yet; see check()
+        self._unfinished_hash = None if lines.last_line_complete else lines.hashes[-1]
+
+    # Reads what changed since the last check and returns it as a list of FileChange
+    def check(self):
+        stat = os.stat(self.filename)
+        if (stat.st_size, stat.st_mtime_ns) == self._stat:
+            return []
+        self._stat = (stat.st_size, stat.st_mtime_ns)
+
+        lines = self.lines
+        first_line = self._first_unverified_line(stat.st_size)
+        with open(self.filename, "rb") as file:
+            file.seek(lines.starts[first_line] if first_line < len(lines) else lines.size)
+            new_lines = file.readlines()
+        if len(new_lines) > 0 and not new_lines[-1].endswith(b"\n"):
+            # A final line without a newline may still be being written, so it 
+            # is only read once it stayed the same between two checks
+            unfinished_hash = line_hash(new_lines[-1])
+            if unfinished_hash != self._unfinished_hash:
+                self._unfinished_hash = unfinished_hash
+                new_lines.pop()
+                self._stat = None
+
+        new_hashes = [line_hash(raw_line) for raw_line in new_lines]
+        old_hashes = lines.hashes[first_line:]
+        old_flags = lines.has_record[first_line:]
+
+        # Only the lines between the unchanged beginning and end are parsed
+        prefix = 0
+        while prefix < min(len(old_hashes), len(new_hashes)) and old_hashes[prefix] == new_hashes[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(old_hashes), len(new_hashes)) - prefix
+               and old_hashes[-1 - suffix] == new_hashes[-1 - suffix]):
+            suffix += 1
+        old_end = len(old_hashes) - suffix
+        new_end = len(new_hashes) - suffix
+
+        records = []
+        errors = []
+        new_flags = bytearray(old_flags[:prefix])
+        for line_counter, raw_line in enumerate(new_lines[prefix:new_end], first_line + prefix + 1):
+            try:
+                record = fileLoader.parse_line(raw_line.decode("utf-8", errors="replace"), line_counter)
+            except ValueError as e:
+                errors.append((line_counter, str(e)))
+                record = None
+            if record is not None:
+                records.append(record)
+            new_flags.append(1 if record is not None else 0)
+        new_flags += old_flags[old_end:]
+
+        first_record = lines.record_count(first_line + prefix)
+        removed_count = old_flags.count(1, prefix, old_end)
+        lines.truncate(first_line)
+        for raw_line, has_record in zip(new_lines, new_flags):
+            lines.add(raw_line, has_record)
+
+        if removed_count == 0 and len(records) == 0:
+            return [FileChange(self.file_id, first_record, 0, [], errors)] if len(errors) > 0 else []
+        changes = [FileChange(self.file_id, first_record, removed_count, records[:MAX_CHANGE_RECORDS], errors)]
+        for start in range(MAX_CHANGE_RECORDS, len(records), MAX_CHANGE_RECORDS):
+            changes.append(FileChange(self.file_id, first_record + start, 0, records[start:start + MAX_CHANGE_RECORDS]))
+        return changes
+
+    # Helper for finding the first line that has to be read again
+    #
+    # If the complete lines read before are unchanged, the file was only 
+    # appended to, so only a final incomplete line has to be read again. 
+    # Otherwise the whole file is.
+    def _first_unverified_line(self, size):
+        lines = self.lines
+        if size < lines.complete_size or lines.complete_count() == 0:
+            return 0
+        complete_hash = hashlib.blake2b()
+        with open(self.filename, "rb") as file:
+            remaining = lines.complete_size
+            while remaining > 0:
+                chunk = file.read(min(remaining, VERIFY_CHUNK_SIZE))
+                if len(chunk) == 0:
+                    return 0
+                complete_hash.update(chunk)
+                remaining -= len(chunk)
+        if complete_hash.digest() != lines.complete_hash.digest():
+            return 0
+        return lines.complete_count()
+
+# Checks the watched files on a worker thread and queues their changes for the UI thread
+class FileWatcher:
+    def __init__(self, interval=WATCH_INTERVAL):
+        self.interval = interval
+        self._files = {}
+        self._lock = threading.Lock()
+        self._changes = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    # Starts watching a file whose lines up to now are in 'lines'
+    def watch(self, file_id, filename, lines):
+        with self._lock:
+            self._files[file_id] = WatchedFile(file_id, filename, lines)
+
+    # Stops watching every file; changes that were already found can still be taken
+    def clear(self):
+        with self._lock:
+            self._files = {}
+
+    # Returns up to 'max_changes' changes without blocking
+    def take_changes(self, max_changes=4):
+        changes = []
+        while len(changes) < max_changes:
+            try:
+                changes.append(self._changes.get_nowait())
+            except queue.Empty:
+                break
+        return changes
+
+    # Checks every watched file right away; used by the worker thread and for testing
+    #
+    # Errors reading a file are reported once, until it can be read again.
+    def check_files(self):
+        with self._lock:
+            watched_files = list(self._files.values())
+        for watched in watched_files:
+            try:
+                changes = watched.check()
+                watched.error = None
+            except OSError as e:
+                changes = []
+                if watched.error is None:
+                    watched.error = str(e)
+                    changes.append(FileChange(watched.file_id, 0, 0, [], 
+                                              [(0, "Could not read " + watched.filename + ": " + str(e))]))
+            for change in changes:
+                self._changes.put(change)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            # The UI has not caught up yet, so reading more would only use memory
+            if self._changes.qsize() < MAX_QUEUED_CHANGES:
+                self.check_files()
@@ -0,0 +1,218 @@
+from array import array
+from bisect import bisect_right
+import backends
+
+
+"""
+Compact in-memory storage for focal points and yaw ranges.
+
+A list of ((x, z), [(start, end), ...]) tuples costs a few hundred bytes of
+Python objects per focal point and yaw range, which dominates memory use with
+millions of ranges. FPStore keeps the same data in flat typed arrays, laid
+out like the binary file format (see binaryFormat.py):
+
+ - fps:     float64 x0, z0, x1, z1, ...
+ - offsets: focal point i owns the yaw ranges [offsets[i], offsets[i + 1])
+ - yaws:    uint16 start0, end0, start1, end1, ...
+
+It behaves like the list it replaces for existing callers: len(), indexing,
+slicing, iteration and append/extend/clear all work with the same tuples,
+which are only created while iterating or indexing. Vectorized code can view
+the arrays as NumPy arrays without copying (fp_array(), offset_array() and
+yaw_array()). Yaws have to be within [0, 65535].
+"""
+
+class FPStore:
+    def __init__(self, fps_and_yaws=()):
+        self._fps = array('d')
+        self._offsets = array('Q', [0])
+        self._yaws = array('H')
+        self.extend(fps_and_yaws)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    # Returns the total number of yaw ranges
+    def range_count(self):
+        return len(self._yaws) // 2
+
+    # Adds one ((x, z), [(start, end), ...]) record; raises ValueError for yaws outside [0, 65535]
+    def append(self, fp_and_yaws):
+        fp, yaw_ranges = fp_and_yaws
+        yaws = array('H')
+        try:
+            for yaw_range in yaw_ranges:
+                yaws.append(yaw_range[0])
+                yaws.append(yaw_range[1])
+        except OverflowError:
+            raise ValueError("Yaws must be within [0, 65535], but focal point " + str(tuple(fp))
+                             + " has the range " + str(tuple(yaw_range)))
+        check_resizable((self._fps, self._offsets, self._yaws))
+        self._fps.append(fp[0])
+        self._fps.append(fp[1])
+        self._yaws.extend(yaws)
+        self._offsets.append(len(self._yaws) // 2)
+
+    def extend(self, fps_and_yaws):
+        if isinstance(fps_and_yaws, FPStore):
+            # Copying the arrays is much faster than going through the records
+            check_resizable((self._fps, self._offsets, self._yaws))
+            base = self.range_count()
+            self._fps.extend(fps_and_yaws._fps)
+            self._yaws.extend(fps_and_yaws._yaws)
+            self._offsets.extend(base + offset for offset in fps_and_yaws._offsets[1:])
+            return
+        for fp_and_yaws in fps_and_yaws:
+            self.append(fp_and_yaws)
+
+    # Builds a store from buffers laid out like its arrays (e.g. the sections of a binaryFormat.BinaryFPFile)
+    #
+    # The buffers are copied in bulk instead of record by record. Offsets may
+    # start at any value, as for a slice of a file; they are rebased to 0.
+    @classmethod
+    def from_buffers(cls, fps, offsets, yaws):
+        store = cls()
+        store._offsets = array('Q')
+        for section, buffer in ((store._fps, fps), (store._offsets, offsets), (store._yaws, yaws)):
+            with memoryview(buffer) as view, view.cast('B') as raw:
+                section.frombytes(raw)
+        if len(store._offsets) > 0 and store._offsets[0] != 0:
+            base = store._offsets[0]
+            store._offsets = array('Q', (offset - base for offset in store._offsets))
+        if (len(store._offsets) == 0 or len(store._fps) != 2 * (len(store._offsets) - 1) or len(store._yaws) % 2 != 0
+                or store._offsets[-1] != len(store._yaws) // 2):
+            raise ValueError("Focal point, offset and yaw buffers do not describe the same records")
+        return store
+
+    def clear(self):
+        check_resizable((self._fps, self._offsets, self._yaws))
+        del self._fps[:]
+        del self._yaws[:]
+        del self._offsets[1:]
+
+    def copy(self):
+        return self[:]
+
+    # Helper for building the record of focal point i
+    def _record(self, i):
+        first, last = 2 * self._offsets[i], 2 * self._offsets[i + 1]
+        yaws = self._yaws[first:last]
+        return (self._fps[2 * i], self._fps[2 * i + 1]), list(zip(yaws[0::2], yaws[1::2]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._record(i)
+
+    # Returns the (x, z) position of focal point i
+    def focal_point(self, i):
+        return self._fps[2 * i], self._fps[2 * i + 1]
+
+    # Returns yaw range r, counting the ranges of all focal points, as a (start, end) tuple
+    def yaw_range(self, r):
+        return self._yaws[2 * r], self._yaws[2 * r + 1]
+
+    # Returns the index of the focal point owning yaw range r, counting the ranges of all focal points
+    def range_owner(self, r):
+        return bisect_right(self._offsets, r) - 1
+
+    # Returns the index of the first yaw range of focal point i, counting the ranges of all focal points
+    def first_range(self, i):
+        return self._offsets[i]
+
+    # Integers return a record, slices (without a step) a new FPStore with copies of the arrays
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop = self._slice_bounds(key)
+            store = FPStore()
+            store._fps = self._fps[2 * start:2 * stop]
+            first = self._offsets[start]
+            store._yaws = self._yaws[2 * first:2 * self._offsets[stop]]
+            store._offsets = array('Q', (offset - first for offset in self._offsets[start:stop + 1]))
+            return store
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("FPStore index out of range")
+        return self._record(key)
+
+    # Replaces a slice of focal points with the given records
+    def __setitem__(self, key, fps_and_yaws):
+        if not isinstance(key, slice):
+            raise TypeError("FPStore only supports assigning to slices")
+        start, stop = self._slice_bounds(key)
+        check_resizable((self._fps, self._offsets, self._yaws))
+        tail = self[stop:]
+        new = fps_and_yaws if isinstance(fps_and_yaws, FPStore) else FPStore(fps_and_yaws)
+        del self[start:]
+        self.extend(new)
+        self.extend(tail)
+
+    def __delitem__(self, key):
+        if not isinstance(key, slice):
+            index = key + len(self) if key < 0 else key
+            if not 0 <= index < len(self):
+                raise IndexError("FPStore index out of range")
+            key = slice(index, index + 1)
+        start, stop = self._slice_bounds(key)
+        check_resizable((self._fps, self._offsets, self._yaws))
+        tail = self[stop:] if stop < len(self) else None
+        first = self._offsets[start]
+        del self._fps[2 * start:]
+        del self._yaws[2 * first:]
+        del self._offsets[start + 1:]
+        if tail is not None:
+            self.extend(tail)
+
+    # Helper for turning a slice into (start, stop) focal point indices
+    def _slice_bounds(self, key):
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("FPStore slices cannot have a step")
+        return start, max(start, stop)
+
+    # Returns the focal points as an N x 2 float64 NumPy array that shares memory with the store
+    #
+    # While a view is alive the store cannot be changed (BufferError is raised
+    # and the store is left as it was), so views should not be kept around; 
+    # copy what has to be stored.
+    def fp_array(self):
+        np = backends.numpy()
+        return np.frombuffer(self._fps, dtype=np.float64).reshape(-1, 2)
+
+    # Returns the N + 1 range offsets as a uint64 NumPy array that shares memory with the store
+    def offset_array(self):
+        np = backends.numpy()
+        return np.frombuffer(self._offsets, dtype=np.uint64)
+
+    # Returns the yaw ranges as an R x 2 uint16 NumPy array that shares memory with the store
+    def yaw_array(self):
+        np = backends.numpy()
+        return np.frombuffer(self._yaws, dtype=np.uint16).reshape(-1, 2)
+
+    # Returns the bytes used by the arrays (not counting spare capacity)
+    def nbytes(self):
+        return sum(len(section) * section.itemsize for section in (self._fps, self._offsets, self._yaws))
+
+    # Returns the bytes of the store per yaw range; the yaw indices, hover index and culling arrays kept 
+    # next to it are not included (see the fp_store_memory results of benchmark.py for all of them)
+    def bytes_per_range(self):
+        return self.nbytes() / max(self.range_count(), 1)
+
+# Helper for raising BufferError before changing any of several arrays if one of them cannot be resized
+#
+# Arrays cannot be resized while they export their buffers (e.g. to a NumPy
+# view), and checking all of them first keeps a failed change from leaving
+# some of them changed.
+def check_resizable(sections):
+    for section in sections:
+        section.append(0)
+        del section[-1]
+
+# Helper for getting the focal points of an FPStore or a list of records as an N x 2 NumPy array
+#
+# FPStores are viewed without copying; the result must not be modified.
+def fp_array(fps_and_yaws):
+    if isinstance(fps_and_yaws, FPStore):
+        return fps_and_yaws.fp_array()
+    np = backends.numpy()
+    return np.array([fp for fp, yaw_ranges in fps_and_yaws], dtype=np.float64).reshape(-1, 2)
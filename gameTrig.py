@@ -0,0 +1,127 @@
+import math
+import struct
+from array import array
+import backends
+
+
+"""
+Integer-exact reproduction of the game's table-based arctangent (atan2s).
+
+The game does not call a floating point atan2 for camera yaws. It divides the
+smaller of |y| and |x| by the larger one in single precision, turns the ratio
+into an index into a 1025 entry arctangent table, and assembles the final 
+16-bit angle from the octant. The functions here follow the same steps with
+float32 rounding at every stage, so yaws match the game exactly.
+
+The table holds round(atan(i / 1024) * 32768 / pi) for i in [0, 1024], which
+is how the game's table was built. It is generated once, on first use.
+"""
+
+ARCTAN_TABLE_SIZE = 1025
+
+_float32 = struct.Struct("f")
+_arctan_table = None
+_octant_angle_table = None
+
+# Helper for rounding a Python float to single precision
+def f32(value):
+    return _float32.unpack(_float32.pack(value))[0]
+
+# Returns the arctangent lookup table, building it the first time it is needed
+def arctan_table():
+    global _arctan_table
+    if _arctan_table is None:
+        _arctan_table = array('H', [int(round(math.atan(i / 1024) * 32768 / math.pi)) 
+                                    for i in range(ARCTAN_TABLE_SIZE)])
+    return _arctan_table
+
+# Looks up atan(y / x) for 0 <= y <= x, like the game's atan2_lookup
+def atan2_lookup(y, x):
+    if x == 0:
+        return arctan_table()[0]
+    return arctan_table()[int(f32(f32(f32(y / x) * 1024) + 0.5))]
+
+# Computes the game's 16-bit angle of the vector (x, y), with 0 along +y and 0x4000 along +x
+def atan2s(y, x):
+    y = f32(y)
+    x = f32(x)
+    if x >= 0:
+        if y >= 0:
+            if y >= x:
+                ret = atan2_lookup(x, y)
+            else:
+                ret = 0x4000 - atan2_lookup(y, x)
+        else:
+            y = -y
+            if y < x:
+                ret = 0x4000 + atan2_lookup(y, x)
+            else:
+                ret = 0x8000 - atan2_lookup(x, y)
+    else:
+        x = -x
+        if y < 0:
+            y = -y
+            if y >= x:
+                ret = 0x8000 + atan2_lookup(x, y)
+            else:
+                ret = 0xC000 - atan2_lookup(y, x)
+        else:
+            if y < x:
+                ret = 0xC000 + atan2_lookup(y, x)
+            else:
+                ret = -atan2_lookup(x, y)
+    return ret & 0xFFFF
+
+# Helper for computing the in-game yaw from one point, p1, to another point, p2
+def compute_p2p_yaw(p1, p2):
+    return atan2s(f32(p2[1]) - f32(p1[1]), f32(p2[0]) - f32(p1[0]))
+
+# Octant offsets and signs used by atan2s, indexed by (x < 0) * 4 + (y < 0) * 2 + (|y| >= |x|)
+_OCTANT_BASES = (0x4000, 0, 0x4000, 0x8000, 0xC000, 0, 0xC000, 0x8000)
+_OCTANT_SIGNS = (-1, 1, 1, -1, 1, -1, -1, 1)
+
+# Returns the final angle for every (octant, arctangent table index) pair, as used by atan2s_array
+def octant_angle_table():
+    global _octant_angle_table
+    if _octant_angle_table is None:
+        np = backends.numpy()
+        table = np.frombuffer(arctan_table(), dtype=np.uint16).astype(np.int32)
+        bases = np.array(_OCTANT_BASES, dtype=np.int32)[:, None]
+        signs = np.array(_OCTANT_SIGNS, dtype=np.int32)[:, None]
+        _octant_angle_table = ((bases + signs * table[None, :]) & 0xFFFF).astype(np.uint16).ravel()
+    return _octant_angle_table
+
+# Vectorized atan2s, returning indices into octant_angle_table() instead of angles
+#
+# Every branch of atan2s looks up the smaller of |x| and |y| divided by the
+# larger one, so the result only depends on that table index and the octant.
+# Callers that only need some property of the angle (e.g. whether it lies in
+# a set of yaw ranges) can precompute it for the whole table and look it up 
+# with these indices directly. Inputs may be broadcastable shapes (e.g. a row 
+# and a column of a grid); per-axis work is then done once per axis.
+def atan2s_table_indices(y, x):
+    np = backends.numpy()
+    y = np.asarray(y, dtype=np.float32)
+    x = np.asarray(x, dtype=np.float32)
+    # The in-place steps below need arrays, which NumPy doesn't return for scalar inputs
+    if y.ndim == 0 and x.ndim == 0:
+        return atan2s_table_indices(y.reshape(1), x.reshape(1))[0]
+    abs_y = np.abs(y)
+    abs_x = np.abs(x)
+
+    # (0, 0) has to look up index 0 like atan2_lookup does for x == 0, so the 
+    # divisor is kept away from zero; 0 divided by anything is still 0
+    ratios = np.minimum(abs_x, abs_y)
+    ratios /= np.maximum(np.maximum(abs_x, abs_y), np.finfo(np.float32).smallest_subnormal)
+    ratios *= np.float32(1024)
+    ratios += np.float32(0.5)
+    indices = ratios.astype(np.int32)
+
+    indices += (x < 0).astype(np.int32) * (4 * ARCTAN_TABLE_SIZE) + (y < 0).astype(np.int32) * (2 * ARCTAN_TABLE_SIZE)
+    np.add(indices, ARCTAN_TABLE_SIZE, out=indices, where=abs_y >= abs_x)
+    return indices
+
+# Vectorized atan2s over arrays of y and x values (converted to float32)
+def atan2s_array(y, x):
+    np = backends.numpy()
+    return np.take(octant_angle_table(), atan2s_table_indices(y, x))
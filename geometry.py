@@ -0,0 +1,130 @@
+import math
+import gameTrig
+
+"""
+Yaw and polygon helpers shared by the plotter, the test point classifier and
+the image renderers.
+
+Yaws follow the in-game convention used throughout this program:
+ - +Z is 0
+ - +X is 16384
+ - -Z is 32768
+ - -X is 49152
+
+'flipped' selects the same 180 degree flip as the 'Flip Yaws' menu option, and
+'exact' computes yaws with the game's table-based arctangent (see gameTrig.py)
+instead of Python's floating point atan2.
+"""
+
+# Helper for wrapping yaw values around
+def wrap_yaw(yaw):
+    while yaw < 0:
+        yaw += 65536
+    while yaw > 65535:
+        yaw -= 65536
+    return yaw
+
+# Helper for computing relative yaw from one point, p1, to another point, p2
+def compute_p2p_yaw(p1, p2, exact=False):
+    if exact:
+        return gameTrig.compute_p2p_yaw(p1, p2)
+    return wrap_yaw(16384 - int(math.atan2(p2[1] - p1[1], p2[0] - p1[0]) / math.pi * 32768))
+
+# Helper function for computing whether a yaw is within a yaw range
+def yaw_within_yaw_range(yaw, yaw_range):
+    if yaw_range[0] <= yaw_range[1]:
+        # Case 1: No wrap around
+        return yaw >= yaw_range[0] and yaw <= yaw_range[1]
+    else:
+        # Case 2: Wrap around 
+        return yaw >= yaw_range[0] or yaw <= yaw_range[1]
+
+# Helper for converting points in Mario X/Z to screen coordinates X/Y
+def mario_to_screen(pts):
+    screen_pts = []
+    for pt in pts:
+        screen_pts.append((pt[0] / 16 + 512, pt[1] / 16 + 512))
+    return screen_pts
+
+# Helper for computing the squared Euclidean distance between points
+def point_dist_squared(p1, p2):
+    return (p1[0] - p2[0])**2 + (p1[1] - p2[1])**2
+
+# Helper for finding where a yaw line propogating from a focal point hits the boundary of the map
+def find_point_along_yaw_at_map_bounds(fp, yaw):
+    if yaw == 0:
+        return (fp[0], 8192)
+    elif yaw == 16384:
+        return (8192, fp[1])
+    elif yaw == 32768:
+        return (fp[0], -8192)
+    elif yaw == 49152:
+        return (-8192, fp[1])
+    else:
+        angle = wrap_yaw(16384 - yaw)/ 32768 * math.pi
+        slope = math.tan(angle)
+
+        if angle < math.pi / 2:
+            p1 = (8192, fp[1] + slope * (8192 - fp[0]))
+            p2 = (fp[0] + (8192 - fp[1]) / slope, 8192)
+        elif angle < math.pi:
+            p1 = (-8192, fp[1] + slope * (-8192 - fp[0]))
+            p2 = (fp[0] + (8192 - fp[1]) / slope, 8192)
+        elif angle < 3 * math.pi / 2:
+            p1 = (-8192, fp[1] + slope * (-8192 - fp[0]))
+            p2 = (fp[0] + (-8192 - fp[1]) / slope, -8192)
+        else:
+            p1 = (8192, fp[1] + slope * (8192 - fp[0]))
+            p2 = (fp[0] + (-8192 - fp[1]) / slope, -8192)
+
+        p1_dist = point_dist_squared(fp, p1)
+        p2_dist = point_dist_squared(fp, p2)
+
+        return p1 if p1_dist < p2_dist else p2
+
+# Helper for finding corner points enclosed by a yaw range    
+def find_enclosed_corner_points(fp, yaw_range, flipped, exact=False):
+    yaw_adjusted_range = [wrap_yaw(yaw_range[0] + (0 if flipped else 32768)), 
+                          wrap_yaw(yaw_range[1] + (0 if flipped else 32768))]
+
+    corner_points = [(-8192, -8192),
+                     (-8192, 8192),
+                     (8192, 8192),
+                     (8192, -8192)]
+    
+    corner_point_yaws = []
+    for cp in corner_points:
+        yaw = compute_p2p_yaw(fp, cp, exact)
+        corner_point_yaws.append(yaw)
+
+    enclosed_corners = []
+    corner_counter = 0
+    for cpy in corner_point_yaws:
+        # Two cases: range wraps around or doesn't wrap around
+        if yaw_within_yaw_range(cpy, yaw_adjusted_range):
+            enclosed_corners.append((wrap_yaw(cpy - yaw_adjusted_range[0]), corner_counter))
+        
+        corner_counter += 1
+
+    # Corners have to follow the sweep from the start of the range to its end, or wide 
+    # ranges that wrap past a corner produce self-intersecting polygons
+    enclosed_corners.sort()
+
+    return [corner_points[corner_index] for offset, corner_index in enclosed_corners]
+
+# Helper for finding the polygon corresponding to a focal point and yaw range
+def find_polygon(fp, yaw_range, flipped, exact=False):
+    # Determine the yaw slope points
+    p1 = find_point_along_yaw_at_map_bounds(fp, wrap_yaw(yaw_range[0] + (0 if flipped else 32768)))
+    p2 = find_point_along_yaw_at_map_bounds(fp, wrap_yaw(yaw_range[1] + (0 if flipped else 32768)))
+
+    # Check for corner points
+    enclosed_corner_points = find_enclosed_corner_points(fp, yaw_range, flipped, exact)
+
+    polygon_points = [fp, p1]
+    for ecp in enclosed_corner_points:
+        polygon_points.append(ecp)
+    polygon_points.append(p2)
+    polygon_points.append(fp)
+
+    return polygon_points
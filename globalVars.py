@@ -1,17 +1,89 @@
+from viewport import Viewport
+from fpStore import FPStore
+from yawIndex import YawIndexStore
+import defaults
+
 window = None
 
-fps_and_yaws = []
+# Focal points and yaw ranges as compact arrays (see fpStore.py), and the yaw index of every focal point
+fps_and_yaws = FPStore()
+yaw_indices = YawIndexStore()
 points = []
-shapes = []
 
-flipped = True
+# Canvas change tracking: what has already been drawn and how
+drawn_fp_count = 0
+drawn_as_raster = False
+test_point_items = []
+test_point_first_fps = []
+tile_images = {}
+# Polygons (in Mario coordinates) drawn one per wedge, kept for PNG export, and 
+# their canvas items; both hold one list per focal point
+coverage_polygons = []
+coverage_items = []
+
+flipped = defaults.FLIPPED
+exact_yaws = False
+
+render_mode = "auto"
+render_mode_var = None
+raster_range_threshold = 2000
+
+# Wedge merging mode (see polygonMerge.MERGE_MODES), the merged coverage drawn 
+# so far and the first focal point of every loaded file
+polygon_merge_mode = "none"
+polygon_merge_mode_var = None
+merged_coverage = None
+fp_file_starts = []
+
+# Loaded files: an id per entry of fp_file_starts, the (filename, fileWatcher.LineTable) 
+# of every loaded text file by id, and the number of loads still running
+fp_file_ids = []
+next_file_id = 0
+watchable_files = {}
+file_loads_in_progress = 0
+
+# Whether duplicate focal points and overlapping yaw ranges are merged on load and save (see normalization.py)
+normalize_fps = False
+normalize_fps_var = None
+
+# Whether loaded text files are followed as they change (see fileWatcher.py); the watcher is created on first use
+watch_files = False
+watch_files_var = None
+file_watcher = None
+
+# Imported test point files are classified in full, but at most this many of their points are drawn
+draw_imported_test_points = True
+draw_imported_test_points_var = None
+max_drawn_imported_points = 5000
+
+# Full redraws: whether they are computed on the render worker (created on 
+# first use), whether one is waiting to be applied, and the pending Tk timers
+render_in_background = True
+render_worker = None
+render_pending = False
+render_after_id = None
+render_poll_id = None
+
+# Merges of newly added focal points into the merged coverage run on their own 
+# worker (a renderWorker.RenderWorker, created on first use) while rendering in 
+# the background, so loading in a merge mode does not stall the UI
+merge_worker = None
+merge_poll_id = None
+
+# Whether the next full redraw is profiled, and the status bar text showing the last frame's timings
+profile_next_redraw = False
+perf_status_var = None
+
+# Zoom/pan state and the cache of raster coverage tiles (created on first use)
+viewport = Viewport()
+tile_cache = None
+tile_cache_max_bytes = 64 * 1024 * 1024
+pan_anchor = None
 
-display_settings = {
-    "background_color": "#800000",
-    "valid_position_color": "#FFFFFF",
-    "test_point_diameter": 8.0,
-    "test_point_success_color": "#00FF00",
-    "test_point_failure_color": "#FF8000",
-    }
+# Index of the wedges under the mouse cursor (wedgeIndex.WedgeIndex, created on 
+# first hover), and the worker (a renderWorker.RenderWorker) building its blocks
+wedge_index = None
+wedge_worker = None
+wedge_poll_id = None
 
-old_diplay_settings = None
+display_settings = dict(defaults.DISPLAY_SETTINGS)
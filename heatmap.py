@@ -0,0 +1,63 @@
+from raster import hex_to_rgb
+import backends
+
+
+"""
+Coloring of coverage count rasters for the heatmap render mode.
+
+The counts themselves come from raster.coverage_counts, either the number
+of focal points or the number of yaw ranges accepting each position. They
+are turned into colors separately, so changing the colormap or threshold only
+recolors cached counts. Positions accepted fewer than 'threshold' times are
+drawn in the background color, and the counts from the threshold up to the
+largest count shown are spread over the colormap. Requires NumPy.
+"""
+
+# What the heatmap counts per position
+COUNT_MODES = ("fps", "ranges")
+
+# Colormaps as evenly spaced anchor colors that are interpolated in between
+COLORMAPS = {
+    "heat": ["#200000", "#C00000", "#FF8000", "#FFFF00", "#FFFFFF"],
+    "viridis": ["#440154", "#3B528B", "#21918C", "#5EC962", "#FDE725"],
+    "grayscale": ["#303030", "#FFFFFF"],
+    }
+
+# Number of colors each colormap is sampled into
+PALETTE_SIZE = 256
+
+_palettes = {}
+
+# Helper for sampling a colormap into a PALETTE_SIZE x 3 array of RGB values
+def colormap_palette(name):
+    if name not in _palettes:
+        np = backends.numpy()
+        anchors = np.array([hex_to_rgb(color) for color in COLORMAPS[name]], dtype=np.float64)
+        positions = np.linspace(0, 1, len(anchors))
+        samples = np.linspace(0, 1, PALETTE_SIZE)
+        _palettes[name] = np.stack([np.interp(samples, positions, anchors[:, channel]) for channel in range(3)],
+                                   axis=1).round().astype(np.uint8)
+    return _palettes[name]
+
+# Helper for coloring a count raster, returning an H x W x 3 array of RGB values
+#
+# max_count is the count mapped to the last colormap color; it defaults to the
+# largest count in the raster, but has to be shared when coloring tiles of one view.
+def counts_to_rgb(counts, colormap, threshold, background_color, max_count=None):
+    np = backends.numpy()
+    threshold = max(int(threshold), 1)
+    max_count = int(counts.max(initial=0)) if max_count is None else max_count
+
+    palette = colormap_palette(colormap)
+    span = max(max_count - threshold, 1)
+    indices = (np.minimum(counts, max_count).astype(np.float64) - threshold) * ((PALETTE_SIZE - 1) / span)
+
+    pixels = palette[np.clip(indices, 0, PALETTE_SIZE - 1).round().astype(np.intp)]
+    pixels[counts < threshold] = hex_to_rgb(background_color)
+    return pixels
+
+# Helper for turning a count raster into binary PPM data that tk.PhotoImage can load directly
+def counts_to_ppm(counts, colormap, threshold, background_color, max_count=None):
+    pixels = counts_to_rgb(counts, colormap, threshold, background_color, max_count)
+    header = "P6 {} {} 255\n".format(counts.shape[1], counts.shape[0]).encode("ascii")
+    return header + pixels.tobytes()
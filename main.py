@@ -1,18 +1,29 @@
 import os
-import math
-import copy
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import colorchooser
+from tkinter import ttk
 from functools import partial
-import pkg_resources
+from bisect import bisect_right
 import globalVars as gV
-
-installed = {pkg.key for pkg in pkg_resources.working_set}
-usePIL = False
-if "pillow" in installed:
-    usePIL = True
-    from PIL import Image, ImageDraw
+from geometry import find_polygon
+from classifier import classify_points, find_first_accepting_fps, find_first_accepting_fps_in_all_groups, group_ranges
+from yawIndex import build_yaw_indices
+from fpStore import FPStore
+import raster
+import tileCache
+import renderWorker
+import heatmap
+import fileLoader
+import testPoints
+import binaryFormat
+import stripExport
+import polygonMerge
+import wedgeIndex
+import perfStats
+import fileWatcher
+import normalization
+import backends
 
 
 """
@@ -48,6 +59,37 @@ The generated plot has bounds [-8192,8191] in X and Z, and is scaled down
 by a factor of 16 in each direction for easier generation/viewing. 
 """
 
+# How often the UI checks a background file load for new batches
+LOAD_POLL_INTERVAL_MS = 50
+
+# How often the UI takes changes found by the file watcher, and how many it applies at a time
+WATCH_POLL_INTERVAL_MS = 250
+MAX_WATCH_CHANGES_PER_POLL = 2
+
+# Canvas that everything is drawn on; created by main()
+canvas = None
+
+# Zoom levels changed per mouse wheel step
+ZOOM_STEPS_PER_WHEEL_STEP = 1
+
+# How long a full redraw waits for further redraw requests before it starts, 
+# and how often the UI checks whether the render worker is done
+RENDER_DEBOUNCE_MS = 150
+RENDER_POLL_INTERVAL_MS = 30
+
+# Render modes that draw a heatmap, and what they count (see heatmap.COUNT_MODES)
+HEATMAP_RENDER_MODES = {"heatmap_fps": "fps", "heatmap_ranges": "ranges"}
+
+# Sizes offered for PNG export, and the largest one that is rendered without worker processes
+PNG_EXPORT_SIZES = (1024, 2048, 4096, 8192, 16384)
+MAX_SINGLE_PROCESS_EXPORT_SIZE = 1024
+
+# Where 'Profile Next Redraw' saves its cProfile stats
+PROFILE_FILENAME = "redraw.prof"
+
+# Number of wedges listed in the hover status line; right-clicking prints all of them
+HOVER_MAX_LISTED_WEDGES = 3
+
 # Creates the tkinter window that houses the program
 def setup_window():
     gV.window = tk.Tk()
@@ -65,14 +107,21 @@ def setup_menu_bar():
     filemenu = tk.Menu(menu_bar, tearoff=0)
     filemenu.add_command(label="Add New FP/Yaw File", command=spawn_load_file_window)
     filemenu.add_command(label="Save FP/Yaw Info to File", command=spawn_save_file_window)
-    if usePIL:
-        filemenu.add_command(label="Save PNG", command=save_png)
+    if backends.has_pil():
+        filemenu.add_command(label="Save PNG", command=spawn_save_png_window)
+    filemenu.add_separator()
+    gV.normalize_fps_var = tk.BooleanVar(master=gV.window, value=gV.normalize_fps)
+    filemenu.add_checkbutton(label="Normalize Focal Points on Load/Save", variable=gV.normalize_fps_var, 
+                             command=toggle_normalize_fps)
+    gV.watch_files_var = tk.BooleanVar(master=gV.window, value=gV.watch_files)
+    filemenu.add_checkbutton(label="Watch Loaded Files", variable=gV.watch_files_var, command=toggle_watch_files)
     filemenu.add_separator()
     filemenu.add_command(label="Exit", command=gV.window.quit)
     menu_bar.add_cascade(label='File', menu=filemenu)
 
     editmenu = tk.Menu(menu_bar, tearoff=0)
     editmenu.add_checkbutton(label="Flip Yaws", command=flip_yaws)
+    editmenu.add_checkbutton(label="Exact In-Game Yaws", command=toggle_exact_yaws)
     editmenu.add_separator()
     editmenu.add_command(label="Clear Focal Points", command=clear_existing_fps)
     editmenu.add_command(label="Clear Test Points", command=clear_existing_test_points)
@@ -81,10 +130,43 @@ def setup_menu_bar():
 
     testmenu = tk.Menu(menu_bar, tearoff=0)
     testmenu.add_command(label="Add Test Point", command=spawn_test_point_window)
+    testmenu.add_command(label="Import Test Points...", command=spawn_import_test_points_window)
+    testmenu.add_command(label="Export Test Point Results...", command=spawn_export_test_point_results_window)
+    gV.draw_imported_test_points_var = tk.BooleanVar(master=gV.window, value=gV.draw_imported_test_points)
+    testmenu.add_checkbutton(label="Draw Imported Test Points", variable=gV.draw_imported_test_points_var,
+                             command=toggle_draw_imported_test_points)
     menu_bar.add_cascade(label='Test', menu=testmenu)
 
     settingsmenu = tk.Menu(menu_bar, tearoff=0)
     settingsmenu.add_command(label="Display Settings", command=spawn_display_settings_window)
+    if backends.has_numpy():
+        gV.render_mode_var = tk.StringVar(master=gV.window, value=gV.render_mode)
+        rendermenu = tk.Menu(settingsmenu, tearoff=0)
+        rendermenu.add_radiobutton(label="Automatic", variable=gV.render_mode_var, value="auto", 
+                                   command=partial(set_render_mode, "auto"))
+        rendermenu.add_radiobutton(label="Polygons", variable=gV.render_mode_var, value="polygon", 
+                                   command=partial(set_render_mode, "polygon"))
+        rendermenu.add_radiobutton(label="Raster", variable=gV.render_mode_var, value="raster", 
+                                   command=partial(set_render_mode, "raster"))
+        rendermenu.add_radiobutton(label="Heatmap (Focal Points)", variable=gV.render_mode_var, value="heatmap_fps", 
+                                   command=partial(set_render_mode, "heatmap_fps"))
+        rendermenu.add_radiobutton(label="Heatmap (Yaw Ranges)", variable=gV.render_mode_var, 
+                                   value="heatmap_ranges", command=partial(set_render_mode, "heatmap_ranges"))
+        settingsmenu.add_cascade(label="Render Mode", menu=rendermenu)
+    gV.polygon_merge_mode_var = tk.StringVar(master=gV.window, value=gV.polygon_merge_mode)
+    mergemenu = tk.Menu(settingsmenu, tearoff=0)
+    mergemenu.add_radiobutton(label="None", variable=gV.polygon_merge_mode_var, value="none", 
+                              command=partial(set_polygon_merge_mode, "none"))
+    mergemenu.add_radiobutton(label="Union", variable=gV.polygon_merge_mode_var, value="union", 
+                              command=partial(set_polygon_merge_mode, "union"))
+    if backends.has_shapely():
+        mergemenu.add_radiobutton(label="Intersection of Files", variable=gV.polygon_merge_mode_var, 
+                                  value="intersection", command=partial(set_polygon_merge_mode, "intersection"))
+    settingsmenu.add_cascade(label="Polygon Merging", menu=mergemenu)
+    settingsmenu.add_command(label="Reset Zoom", command=reset_view)
+    settingsmenu.add_separator()
+    settingsmenu.add_command(label="Profile Next Redraw", command=profile_next_redraw)
+    settingsmenu.add_command(label="Save Frame Timings...", command=spawn_save_frame_timings_window)
     menu_bar.add_cascade(label='Settings', menu=settingsmenu)
 
     gV.window.config(menu=menu_bar)
@@ -96,70 +178,218 @@ def spawn_load_file_window():
                                           title = "Select a File",
                                           filetypes = (("Text files",
                                                         "*.txt*"),
+                                                       ("Binary FP/Yaw files",
+                                                        "*" + binaryFormat.FILE_EXTENSION),
                                                        ("all files",
                                                         "*.*")))
     
-    new_fp_info = read_file(filename)
+    if filename is None or filename == "":
+        return
 
-    for fp_and_yaw in new_fp_info:
-        gV.fps_and_yaws.append(fp_and_yaw)
-    
-    draw_screen()
+    start_loading_file(filename)
+
+# Helper for appending focal points/yaw ranges and building their yaw indices
+#
+# Batches of binary files arrive as FPStores, which are appended in bulk.
+def add_fps_and_yaws(new_fp_info):
+    if not isinstance(new_fp_info, FPStore):
+        new_fp_info = FPStore(new_fp_info)
+    gV.fps_and_yaws.extend(new_fp_info)
+    gV.yaw_indices.extend(build_yaw_indices(new_fp_info))
+    build_wedge_index()
+
+# Starts parsing a file on a worker thread and shows a progress window while it loads
+def start_loading_file(filename):
+    # The lines are remembered so the file can be watched for changes later; normalized 
+    # files no longer have one focal point per line, so they are not watched
+    if gV.normalize_fps:
+        loader = fileLoader.BackgroundFileLoader(filename, normalize=True)
+    else:
+        loader = fileLoader.BackgroundFileLoader(filename, lines=fileWatcher.LineTable())
+    progress_window, progress_bar = spawn_progress_window("Loading File", 
+                                                          "Loading " + os.path.basename(filename) + "...", loader.cancel)
+
+    loader.start()
+    gV.fp_file_starts.append(len(gV.fps_and_yaws))
+    gV.fp_file_ids.append(gV.next_file_id)
+    gV.next_file_id += 1
+    gV.file_loads_in_progress += 1
+    gV.window.after(LOAD_POLL_INTERVAL_MS, partial(poll_file_loader, loader, len(gV.fps_and_yaws), 
+                                                   progress_window, progress_bar, perfStats.Frame("load")))
+
+# Helper for showing a modal progress window with a cancel button; returns the window and its progress bar
+def spawn_progress_window(title : str, message : str, cancel):
+    progress_window = tk.Toplevel(gV.window)
+    progress_window.title(title)
+    progress_window.geometry("300x110")
+    progress_window.resizable(False, False)
+
+    tk.Label(progress_window, text=message).pack(pady=(10,5))
+    progress_bar = ttk.Progressbar(progress_window, length=260, maximum=100, mode="determinate")
+    progress_bar.pack(pady=5)
+    tk.Button(progress_window, text="Cancel", width=10, command=cancel).pack(pady=5)
+    progress_window.protocol("WM_DELETE_WINDOW", cancel)
+
+    progress_window.focus_force()
+    progress_window.grab_set()
+    return progress_window, progress_bar
+
+# Moves parsed batches from the loader onto the canvas and reschedules itself until the load is done
+def poll_file_loader(loader : fileLoader.BackgroundFileLoader, first_fp_index : int, 
+                     progress_window : tk.Toplevel, progress_bar : ttk.Progressbar, frame : perfStats.Frame):
+    if loader.cancelled():
+        # Drop everything this load added so far
+        progress_window.destroy()
+        fp_count = len(gV.fps_and_yaws)
+        del gV.fps_and_yaws[first_fp_index:]
+        del gV.yaw_indices[first_fp_index:]
+        gV.fp_file_starts.pop()
+        gV.fp_file_ids.pop()
+        gV.file_loads_in_progress -= 1
+        update_wedge_index(first_fp_index, fp_count, 0)
+        draw_screen()
+        return
+
+    for batch in loader.take_batches():
+        add_fps_and_yaws(batch)
+    update_screen()
+    progress_bar["value"] = loader.progress() * 100
+
+    if not loader.finished():
+        gV.window.after(LOAD_POLL_INTERVAL_MS, partial(poll_file_loader, loader, first_fp_index, 
+                                                       progress_window, progress_bar, frame))
+        return
 
-# Helper for reading in a list of focal points and associated acceptable yaws
-def read_file(filename):
-    fps_and_yaws = []
-    with open(filename, "r") as file:
-        line_counter = 0
-        for line in file:
-            line_counter += 1
-            if line.strip() == "" or line.startswith("#"):
-                continue
-            linesplit = line.split(':')
-            if len(linesplit) != 2:
-                print("INVALID FORMAT: Invalid number of colons on line", str(line_counter) + "; should be one, but found " + str(len(linesplit) - 1) + "!")
-                quit()
-
-            fp_strings = linesplit[0].split(',')
-            if len(fp_strings) != 2:
-                print("INVALID FORMAT: Found invalid number of focal point entries on line ", line_counter)
-                quit()
-            fp = float(fp_strings[0]), float(fp_strings[1])
-
-            yaw_strings = linesplit[1].split(',')
-            if len(yaw_strings) % 2 != 0:
-                print("INVALID FORMAT: Found non-even number of yaw range entries on line ", line_counter)
-                quit()
-            yaws = []
-            for i in range(int(len(yaw_strings)/2)):
-                yaws.append((int(yaw_strings[2*i]), int(yaw_strings[2*i+1])))
-
-            fps_and_yaws.append((fp, yaws))
-
-    return fps_and_yaws
+    progress_window.destroy()
+    gV.file_loads_in_progress -= 1
+    if loader.normalization is not None:
+        print(os.path.basename(loader.filename) + ":", loader.normalization.summary())
+    elif not binaryFormat.is_binary_file(loader.filename):
+        file_id = gV.fp_file_ids[-1]
+        gV.watchable_files[file_id] = (loader.filename, loader.lines)
+        if gV.watch_files:
+            gV.file_watcher.watch(file_id, loader.filename, loader.lines)
+    # The load phase is the wall time of the whole load; drawing the batches is also recorded as update frames
+    frame.add_time("load", frame.elapsed())
+    frame.count("focal_points_loaded", len(gV.fps_and_yaws) - first_fp_index)
+    perfStats.finish(frame)
+    if len(loader.errors) > 0:
+        fileLoader.print_errors(loader.errors)
+        spawn_popup("Invalid Format Warning!", "Skipped " + str(len(loader.errors)) + " malformed line(s); see console.")
+
+# Turns watching the loaded text files for changes on or off
+def toggle_watch_files():
+    gV.watch_files = gV.watch_files_var.get()
+    if not gV.watch_files:
+        # Changes that were already found are still applied
+        gV.file_watcher.clear()
+        return
+
+    if gV.file_watcher is None:
+        gV.file_watcher = fileWatcher.FileWatcher()
+        gV.file_watcher.start()
+        gV.window.after(WATCH_POLL_INTERVAL_MS, poll_file_watcher)
+    for file_id, (filename, lines) in gV.watchable_files.items():
+        gV.file_watcher.watch(file_id, filename, lines)
+
+# Applies changes found by the file watcher a few at a time and reschedules itself
+def poll_file_watcher():
+    # A load in progress assumes the focal points before it stay in place
+    if gV.file_loads_in_progress == 0:
+        for change in gV.file_watcher.take_changes(MAX_WATCH_CHANGES_PER_POLL):
+            apply_file_change(change)
+    gV.window.after(WATCH_POLL_INTERVAL_MS, poll_file_watcher)
+
+# Replaces the focal points of a changed file, updating only what they affect on the canvas
+def apply_file_change(change : fileWatcher.FileChange):
+    if len(change.errors) > 0:
+        fileLoader.print_errors(change.errors)
+    # The file may have been cleared since the change was found
+    if change.file_id not in gV.fp_file_ids:
+        return
+    file_index = gV.fp_file_ids.index(change.file_id)
+    start = gV.fp_file_starts[file_index] + change.first_record
+    end = start + change.removed_count
+    if change.removed_count == 0 and start == len(gV.fps_and_yaws):
+        # Appending to the last file is the same as loading more of it
+        add_fps_and_yaws(change.records)
+        update_screen()
+        return
+    if change.removed_count == 0 and len(change.records) == 0:
+        return
+
+    drawn_everything = gV.drawn_fp_count == len(gV.fps_and_yaws)
+    gV.fps_and_yaws[start:end] = change.records
+    gV.yaw_indices[start:end] = build_yaw_indices(change.records)
+    for i in range(file_index + 1, len(gV.fp_file_starts)):
+        gV.fp_file_starts[i] += len(change.records) - change.removed_count
+    update_wedge_index(start, end, len(change.records))
+
+    # Only separately drawn polygons can be replaced one focal point at a time
+    if (gV.render_pending or not drawn_everything or gV.drawn_as_raster or use_raster_rendering() 
+            or gV.polygon_merge_mode != "none"):
+        draw_screen()
+        return
+    with perfStats.recording("watch"):
+        replace_fp_polygons(start, change.removed_count, change.records)
+        reclassify_points_from(start)
+    canvas.tag_raise(TEST_POINT_TAG)
+    canvas.tag_raise(HOVER_TAG)
 
 # Spawns a file selection dialog box and loads the focal points from the chosen file
 def spawn_save_file_window():
     filename = filedialog.asksaveasfilename(initialfile = 'Untitled.txt',
                                         defaultextension=".txt",
                                         filetypes=[("All Files","*.*"),
-                                                   ("Text Documents","*.txt")])
+                                                   ("Text Documents","*.txt"),
+                                                   ("Binary FP/Yaw Files","*" + binaryFormat.FILE_EXTENSION)])
     
-    save_file(filename)
+    if filename is None or filename == "":
+        return
+
+    try:
+        save_file(filename)
+    except ValueError as e:
+        spawn_popup("Save Failed!", str(e))
 
 # Helper for saving out a list of focal points and associated acceptable yaws
+#
+# With normalization turned on, duplicates are merged across all loaded files.
 def save_file(filename):
-    with open(filename, "w") as file:
-        for fp, yaw_ranges in gV.fps_and_yaws:
-            file.write(str(fp[0]) + ',' + str(fp[1]) + ":")
-            yaw_str = ""
-            for yaw_range in yaw_ranges:
-                yaw_str += str(yaw_range[0]) + ',' + str(yaw_range[1]) + ','
-            yaw_str = yaw_str[:-1]
-            file.write(yaw_str + '\n')
-
-# Helper for saving canvas as a PNG image
-def save_png():
+    fps_and_yaws = gV.fps_and_yaws
+    if gV.normalize_fps:
+        fps_and_yaws, stats = normalization.normalize_fps_and_yaws(fps_and_yaws)
+        print(stats.summary())
+    fileLoader.save_file(filename, fps_and_yaws)
+
+# Turns normalizing focal points on load and save on or off; files that are already loaded stay as they are
+def toggle_normalize_fps():
+    gV.normalize_fps = gV.normalize_fps_var.get()
+
+# Spawns the 'Save PNG' window, which asks for the image size
+def spawn_save_png_window():
+    png_window = tk.Toplevel(gV.window)
+    png_window.title("Save PNG")
+    png_window.resizable(False, False)
+
+    size_frame = tk.Frame(png_window)
+    size_frame.pack(pady=10, padx=10, anchor="w")
+    tk.Label(size_frame, text="Image Size: ").pack(side=tk.LEFT, padx=5, anchor="w")
+    size_var = tk.IntVar(master=png_window, value=PNG_EXPORT_SIZES[0])
+    tk.OptionMenu(size_frame, size_var, *PNG_EXPORT_SIZES).pack(side=tk.LEFT, anchor="e")
+
+    button_frame = tk.Frame(png_window)
+    button_frame.pack(pady=10, padx=10, side=tk.RIGHT, anchor="e")
+    tk.Button(button_frame, text="Cancel", width=10, command=png_window.destroy).pack(side=tk.RIGHT, padx=5)
+    tk.Button(button_frame, text="Save...", width=10, 
+              command=lambda: save_png(png_window, size_var.get())).pack(side=tk.RIGHT, padx=5)
+
+    png_window.focus_force()
+    png_window.grab_set()
+
+# Helper for saving the plot as a size x size PNG image
+def save_png(png_window : tk.Toplevel, size : int):
+    png_window.destroy()
     filename = filedialog.asksaveasfilename(initialfile = 'Untitled.png',
                                         defaultextension=".png",
                                         filetypes=[("All Files","*.*"),
@@ -168,58 +398,116 @@ def save_png():
     if filename is None or filename == "":
         return
 
-    output = Image.new("RGB", (1024, 1024), gV.display_settings["background_color"])
-    draw = ImageDraw.Draw(output)
-
-    # Draw Polygons
-    for fp, yaw_ranges in gV.fps_and_yaws:
-        for yaw_range in yaw_ranges:
-            polygon_points = find_polygon(fp, yaw_range)
-            screen_polygon_points = mario_to_screen(polygon_points)
-
-            draw.polygon(screen_polygon_points, 
-                         outline=gV.display_settings["valid_position_color"], 
-                         fill=gV.display_settings["valid_position_color"])
-
-    # Draw Test Points
-    true_points, false_points = get_valid_invalid_points()
-
-    true_sps = mario_to_screen(true_points)
-    false_sps = mario_to_screen(false_points)
-
-    for sp in true_sps:
-        gV.shapes.append(draw.ellipse([int(sp[0] - gV.display_settings["test_point_diameter"]/2), 
-                                      int(sp[1] - gV.display_settings["test_point_diameter"]/2),
-                                      int(sp[0] + gV.display_settings["test_point_diameter"]/2),
-                                      int(sp[1] + gV.display_settings["test_point_diameter"]/2)],
-                                      outline=gV.display_settings["test_point_success_color"],
-                                      fill=gV.display_settings["test_point_success_color"]))
-    for sp in false_sps:
-        gV.shapes.append(draw.ellipse([int(sp[0] - gV.display_settings["test_point_diameter"]/2), 
-                                      int(sp[1] - gV.display_settings["test_point_diameter"]/2),
-                                      int(sp[0] + gV.display_settings["test_point_diameter"]/2),
-                                      int(sp[1] + gV.display_settings["test_point_diameter"]/2)],
-                                      outline=gV.display_settings["test_point_failure_color"],
-                                      fill=gV.display_settings["test_point_failure_color"]))
-    
-    output.save(filename)
+    start_png_export(filename, size)
+
+# Starts rendering the plot to a PNG file on a worker thread and shows a progress window meanwhile
+#
+# Large images are rendered in strips by a pool of worker processes (see stripExport.py).
+def start_png_export(filename, size):
+    frame = perfStats.Frame("export")
+    # The scene is built on the exporter's thread, from copies like the render worker's inputs
+    scene_inputs = {"size": size,
+                    "fps_and_yaws": gV.fps_and_yaws.copy(),
+                    "points": list(gV.points),
+                    "flipped": gV.flipped,
+                    "display_settings": dict(gV.display_settings),
+                    "yaw_indices": gV.yaw_indices.copy(),
+                    "exact": gV.exact_yaws,
+                    "merge_mode": gV.polygon_merge_mode,
+                    "group_starts": list(gV.fp_file_starts),
+                    "heatmap_count": heatmap_count(),
+                    "raster_coverage": use_raster_rendering() and heatmap_count() is None,
+                    "shapes": drawn_shapes()}
+    jobs = 1 if size <= MAX_SINGLE_PROCESS_EXPORT_SIZE else os.cpu_count() or 1
+    exporter = stripExport.BackgroundPngExporter(filename, scene_inputs, jobs, frame)
+    progress_window, progress_bar = spawn_progress_window("Saving PNG", 
+                                                          "Saving " + os.path.basename(filename) + "...", 
+                                                          exporter.cancel)
+
+    exporter.start()
+    gV.window.after(LOAD_POLL_INTERVAL_MS, partial(poll_png_exporter, exporter, progress_window, progress_bar, 
+                                                   frame))
+
+# Updates the progress window until the export is done
+def poll_png_exporter(exporter : stripExport.BackgroundPngExporter, 
+                      progress_window : tk.Toplevel, progress_bar : ttk.Progressbar, frame : perfStats.Frame):
+    if exporter.cancelled():
+        # The worker stops after its current strip and removes the partial file
+        progress_window.destroy()
+        return
+
+    progress_bar["value"] = exporter.progress() * 100
+    if not exporter.finished():
+        gV.window.after(LOAD_POLL_INTERVAL_MS, partial(poll_png_exporter, exporter, progress_window, progress_bar, 
+                                                       frame))
+        return
+
+    progress_window.destroy()
+    if exporter.scene is not None:
+        frame.count("polygons", len(exporter.scene.shapes))
+        frame.count("points_classified", len(exporter.scene.points))
+        frame.count("strips", exporter.scene.strip_count)
+    frame.add_time("export", frame.elapsed() - frame.phases.get("geometry", 0.0))
+    perfStats.finish(frame)
+    if exporter.error is not None:
+        print("ERROR: Could not save " + exporter.filename + ": " + exporter.error)
+        spawn_popup("Save Failed!", "Could not save the PNG; see console.")
+
+# Helper for finding the (exterior, holes) shapes on the canvas, so exports do not compute them again
+#
+# Returns None if the canvas does not show polygons for every focal point.
+def drawn_shapes():
+    if gV.render_pending or gV.drawn_as_raster or gV.drawn_fp_count != len(gV.fps_and_yaws):
+        return None
+    if gV.polygon_merge_mode != "none":
+        # New focal points may still be being merged
+        if gV.merged_coverage is None or gV.merged_coverage.fp_count != len(gV.fps_and_yaws):
+            return None
+        return gV.merged_coverage.shapes()
+    return [(polygon_points, []) for polygons in gV.coverage_polygons for polygon_points in polygons]
 
 # Clears all focal point/yaw information and redraws the screen
 def clear_existing_fps():
-    gV.fps_and_yaws = []
-    draw_screen()
+    fp_count = len(gV.fps_and_yaws)
+    gV.fps_and_yaws.clear()
+    gV.yaw_indices.clear()
+    gV.fp_file_starts = []
+    clear_watched_files()
+    update_wedge_index(0, fp_count, 0)
+    if gV.render_pending:
+        # The pending redraw was computed from the old focal points
+        draw_screen()
+        return
+    clear_coverage()
+    update_screen()
 
 # Clears all test points and redraws the screen
 def clear_existing_test_points():
     gV.points = []
-    draw_screen()
+    if gV.render_pending:
+        # The pending redraw was computed from the old test points
+        draw_screen()
+        return
+    clear_test_point_items()
 
 # Clears everything and redraws the screen
 def clear_all():
-    gV.fps_and_yaws = []
+    fp_count = len(gV.fps_and_yaws)
+    gV.fps_and_yaws.clear()
+    gV.yaw_indices.clear()
+    gV.fp_file_starts = []
+    clear_watched_files()
+    update_wedge_index(0, fp_count, 0)
     gV.points = []
     draw_screen()
 
+# Helper for forgetting the loaded files, so the file watcher no longer follows them
+def clear_watched_files():
+    gV.fp_file_ids = []
+    gV.watchable_files = {}
+    if gV.file_watcher is not None:
+        gV.file_watcher.clear()
+
 # Spawns the 'Add Test Points' window
 def spawn_test_point_window():
     tp_window = tk.Toplevel(gV.window)
@@ -266,10 +554,93 @@ def add_test_point(x_entry : tk.Entry, z_entry : tk.Entry):
     if x_val is not None and z_val is not None:
         try:
             gV.points.append((float(x_val), float(z_val)))
-            draw_screen()
+            update_screen()
         except:
             spawn_popup("Invalid Format Warning!", "X/Z values must be valid numbers.")
 
+# Spawns file selection dialogs for a test point file and for where to save its results, then classifies it
+def spawn_import_test_points_window():
+    filename = filedialog.askopenfilename(initialdir = "/",
+                                          title = "Select a Test Point File",
+                                          filetypes = (("CSV/Text files",
+                                                        "*.csv *.txt"),
+                                                       ("Binary Test Point files",
+                                                        "*" + testPoints.FILE_EXTENSION),
+                                                       ("all files",
+                                                        "*.*")))
+    
+    if filename is None or filename == "":
+        return
+
+    # Cancelling the second dialog classifies without saving the results
+    output = filedialog.asksaveasfilename(title = "Save Results (Cancel to Skip)",
+                                          initialfile = 'results.csv',
+                                          defaultextension=".csv",
+                                          filetypes=[("All Files","*.*"),
+                                                     ("CSV Files","*.csv")])
+
+    start_classifying_test_points(filename, output if output else None)
+
+# Starts classifying a test point file on a worker thread and shows a progress window while it runs
+#
+# Only a random sample of at most gV.max_drawn_imported_points points is 
+# added to the plot (none if drawing imported points is turned off).
+def start_classifying_test_points(filename, output):
+    intersection = gV.polygon_merge_mode == "intersection"
+    sample_size = gV.max_drawn_imported_points if gV.draw_imported_test_points else 0
+    point_classifier = testPoints.BackgroundTestPointClassifier(filename, output, gV.fps_and_yaws.copy(), 
+                                                                gV.yaw_indices.copy(), gV.flipped, gV.exact_yaws,
+                                                                gV.fp_file_starts if intersection else None, 
+                                                                sample_size)
+    progress_window, progress_bar = spawn_progress_window("Classifying Test Points", 
+                                                          "Classifying " + os.path.basename(filename) + "...",
+                                                          point_classifier.cancel)
+
+    point_classifier.start()
+    gV.window.after(LOAD_POLL_INTERVAL_MS, partial(poll_test_point_classifier, point_classifier, 
+                                                   progress_window, progress_bar))
+
+# Updates the progress window until the classification is done, then reports and draws the results
+def poll_test_point_classifier(point_classifier : testPoints.BackgroundTestPointClassifier, 
+                               progress_window : tk.Toplevel, progress_bar : ttk.Progressbar):
+    if point_classifier.cancelled():
+        # The worker stops after its current chunk
+        progress_window.destroy()
+        return
+
+    progress_bar["value"] = point_classifier.progress() * 100
+    if not point_classifier.finished():
+        gV.window.after(LOAD_POLL_INTERVAL_MS, partial(poll_test_point_classifier, point_classifier, 
+                                                       progress_window, progress_bar))
+        return
+
+    progress_window.destroy()
+    if len(point_classifier.errors) > 0:
+        fileLoader.print_errors(point_classifier.errors)
+        spawn_popup("Invalid Format Warning!", "Skipped " + str(len(point_classifier.errors)) + " malformed line(s); see console.")
+
+    print("Classified", point_classifier.count, "test points,", point_classifier.valid_count, "valid" 
+          + ("" if point_classifier.output is None else " -> " + point_classifier.output))
+    if len(point_classifier.sample.points) > 0:
+        gV.points.extend(point_classifier.sample.points)
+        update_screen()
+
+# Spawns a file dialog and saves whether each test point is valid and its first accepting focal point
+def spawn_export_test_point_results_window():
+    filename = filedialog.asksaveasfilename(initialfile = 'results.csv',
+                                        defaultextension=".csv",
+                                        filetypes=[("All Files","*.*"),
+                                                   ("CSV Files","*.csv")])
+    
+    if filename is None or filename == "":
+        return
+
+    testPoints.write_results_file(filename, gV.points, find_accepting_fps(gV.points))
+
+# Enables/disables drawing a sample of the test points from imported files
+def toggle_draw_imported_test_points():
+    gV.draw_imported_test_points = gV.draw_imported_test_points_var.get()
+
 # Spawns a popup window with the specified title and message
 def spawn_popup(title : str, message : str):
    top= tk.Toplevel(gV.window)
@@ -283,7 +654,7 @@ def spawn_popup(title : str, message : str):
 def spawn_display_settings_window():
     ds_window = tk.Toplevel(gV.window)
     ds_window.title("Display Settings")
-    ds_window.geometry("250x250")
+    ds_window.geometry("250x330" if backends.has_numpy() else "250x250")
     ds_window.resizable(False, False)
 
     # Background Color
@@ -309,18 +680,31 @@ def spawn_display_settings_window():
     # Test Point Successful Color
     setup_color_setting(ds_window, "Test Point Color (Invalid): ", "test_point_failure_color", "Choose a new invalid test point color...")
 
+    # Heatmap Colormap and Threshold
+    colormap_var = tk.StringVar(master=ds_window, value=gV.display_settings["heatmap_colormap"])
+    threshold_str = tk.StringVar(master=ds_window, value=str(gV.display_settings["heatmap_threshold"]))
+    if backends.has_numpy():
+        colormap_frame = tk.Frame(ds_window)
+        colormap_frame.pack(pady=5, anchor="w")
+        tk.Label(colormap_frame, text="Heatmap Colormap: ").pack(side=tk.LEFT, padx=5, anchor="w")
+        tk.OptionMenu(colormap_frame, colormap_var, *heatmap.COLORMAPS).pack(side=tk.LEFT, anchor="e")
+
+        threshold_frame = tk.Frame(ds_window)
+        threshold_frame.pack(pady=5, anchor="w")
+        tk.Label(threshold_frame, text="Heatmap Threshold: ").pack(side=tk.LEFT, padx=5, anchor="w")
+        tk.Entry(threshold_frame, width=10, textvariable=threshold_str).pack(side=tk.LEFT, anchor="e")
+
     # Bottom Button Frame
     button_frame = tk.Frame(ds_window)
     button_frame.pack(pady=10, side=tk.RIGHT, anchor="e")
 
-    ok_button = tk.Button(button_frame, text="OK", width=10, height=4, command=partial(save_display_settings, ds_window, diameter_str))
+    ok_button = tk.Button(button_frame, text="OK", width=10, height=4, 
+                          command=partial(save_display_settings, ds_window, diameter_str, colormap_var, threshold_str))
     cancel_button = tk.Button(button_frame, text="Cancel", width=10, height=4, command=ds_window.destroy) 
 
     cancel_button.pack(side=tk.RIGHT, padx=5, anchor="e")
     ok_button.pack(side=tk.RIGHT, padx=5, anchor="e") 
 
-    gV.old_diplay_settings = copy.deepcopy(gV.display_settings)
-
     ds_window.focus_force()
     ds_window.grab_set()  
 
@@ -349,222 +733,872 @@ def change_display_color_setting(ds_window : tk.Toplevel, color_button : tk.Butt
     ds_window.grab_set()    
 
 # Helper for saving display settings
-def save_display_settings(ds_window : tk.Toplevel, diameter_str : tk.StringVar):
+#
+# Every entry is validated before any of them is applied, so an invalid entry 
+# leaves the display settings as they were.
+def save_display_settings(ds_window : tk.Toplevel, diameter_str : tk.StringVar, colormap_var : tk.StringVar, 
+                          threshold_str : tk.StringVar):
+    threshold = parse_heatmap_threshold(threshold_str)
+    if threshold is None:
+        spawn_popup("Invalid Format Warning!", "Heatmap threshold must be a positive integer.")
+        return
     
-    # Save Display Diameter
-    if not save_display_test_point_diameter(diameter_str):
+    diameter = parse_test_point_diameter(diameter_str)
+    if diameter is None:
         spawn_popup("Invalid Format Warning!", "Diameter must be a positive number.")
-        gV.display_settings = gV.old_display_settings
         return
+
+    gV.display_settings["heatmap_colormap"] = colormap_var.get()
+    gV.display_settings["heatmap_threshold"] = threshold
+    gV.display_settings["test_point_diameter"] = diameter
+    refresh_display_settings()
     
-    # If all save functions returned true, close settings window
+    # If all settings were valid, close settings window
     ds_window.destroy()
 
-# Helper for saving display diameter
-def save_display_test_point_diameter(diameter_str : tk.StringVar):
+# Helper for reading the test point diameter entry; returns None if it is not a positive number
+def parse_test_point_diameter(diameter_str : tk.StringVar):
     if diameter_str is None:
         print("BUG: Entries are none!")
-        return False
-    val = diameter_str.get()
-    if val is not None:
-        try:
-            diam_val = float(val)
-            if diam_val <= 0:
-                return False
-            gV.display_settings['test_point_diameter'] = diam_val
-            draw_screen()
-            return True
-
-        except Exception as e:
-            return False
-    return False
+        return None
+    try:
+        diameter = float(diameter_str.get())
+    except (TypeError, ValueError):
+        return None
+    if not diameter > 0:
+        return None
+    return diameter
+
+# Helper for reading the heatmap threshold entry; returns None if it is not a positive integer
+def parse_heatmap_threshold(threshold_str : tk.StringVar):
+    try:
+        threshold = int(threshold_str.get())
+    except ValueError:
+        return None
+    if threshold <= 0:
+        return None
+    return threshold
 
 # Enables/disables a 180 degree flip of the yaws
 def flip_yaws():
     gV.flipped = not gV.flipped
     draw_screen()
 
-# Helper for wrapping yaw values around
-def wrap_yaw(yaw):
-    while yaw < 0:
-        yaw += 65536
-    while yaw > 65535:
-        yaw -= 65536
-    return yaw
-
-# Helper for converting points in Mario X/Z to screen coordinates X/Y
-def mario_to_screen(pts):
-    screen_pts = []
-    for pt in pts:
-        screen_pts.append((pt[0] / 16 + 512, pt[1] / 16 + 512))
-    return screen_pts
-
-# Helper for computing the squared Euclidean distance between points
-def point_dist_squared(p1, p2):
-    return (p1[0] - p2[0])**2 + (p1[1] - p2[1])**2
-
-# Helper for computing relative yaw from one point, p1, to another point, p2
-def compute_p2p_yaw(p1, p2):
-    return wrap_yaw(16384 - int(math.atan2(p2[1] - p1[1], p2[0] - p1[0]) / math.pi * 32768))
-
-# Helper function for computing whether a yaw is within a yaw range
-def yaw_within_yaw_range(yaw, yaw_range):
-    if yaw_range[0] <= yaw_range[1]:
-        # Case 1: No wrap around
-        return yaw >= yaw_range[0] and yaw <= yaw_range[1]
-    else:
-        # Case 2: Wrap around 
-        return yaw >= yaw_range[0] or yaw <= yaw_range[1]
-
-# Helper for finding where a yaw line propogating from a focal point hits the boundary of the map
-def find_point_along_yaw_at_map_bounds(fp, yaw):
-    if yaw == 0:
-        return (fp[0], 8192)
-    elif yaw == 16384:
-        return (8192, fp[1])
-    elif yaw == 32768:
-        return (fp[0], -8192)
-    elif yaw == 49152:
-        return (-8192, fp[1])
-    else:
-        angle = wrap_yaw(16384 - yaw)/ 32768 * math.pi
-        slope = math.tan(angle)
-
-        if angle < math.pi / 2:
-            p1 = (8192, fp[1] + slope * (8192 - fp[0]))
-            p2 = (fp[0] + (8192 - fp[1]) / slope, 8192)
-        elif angle < math.pi:
-            p1 = (-8192, fp[1] + slope * (-8192 - fp[0]))
-            p2 = (fp[0] + (8192 - fp[1]) / slope, 8192)
-        elif angle < 3 * math.pi / 2:
-            p1 = (-8192, fp[1] + slope * (-8192 - fp[0]))
-            p2 = (fp[0] + (-8192 - fp[1]) / slope, -8192)
-        else:
-            p1 = (8192, fp[1] + slope * (8192 - fp[0]))
-            p2 = (fp[0] + (-8192 - fp[1]) / slope, -8192)
+# Switches between Python's atan2 and the game's table-based arctangent for yaw computations
+def toggle_exact_yaws():
+    gV.exact_yaws = not gV.exact_yaws
+    draw_screen()
 
-        p1_dist = point_dist_squared(fp, p1)
-        p2_dist = point_dist_squared(fp, p2)
+# Switches between polygon and raster rendering of the valid camera region
+def set_render_mode(mode : str):
+    gV.render_mode = mode
+    draw_screen()
 
-        return p1 if p1_dist < p2_dist else p2
+# Switches between drawing every wedge and drawing their union/intersection
+def set_polygon_merge_mode(mode : str):
+    gV.polygon_merge_mode = mode
+    draw_screen()
 
-# Helper for finding corner points enclosed by a yaw range    
-def find_enclosed_corner_points(fp, yaw_range):
-    yaw_adjusted_range = [wrap_yaw(yaw_range[0] + (0 if gV.flipped else 32768)), 
-                          wrap_yaw(yaw_range[1] + (0 if gV.flipped else 32768))]
+# Helper for deciding whether the valid camera region should be drawn as a raster image
+#
+# Merged coverage is always drawn as polygons, as merging is what keeps their count down.
+def use_raster_rendering():
+    if not backends.has_numpy():
+        return False
+    if heatmap_count() is not None:
+        return True
+    if gV.render_mode == "polygon" or gV.polygon_merge_mode != "none":
+        return False
+    if gV.render_mode == "raster":
+        return True
+    range_count = gV.fps_and_yaws.range_count()
+    return range_count > gV.raster_range_threshold
 
-    corner_points = [(-8192, -8192),
-                     (-8192, 8192),
-                     (8192, 8192),
-                     (8192, -8192)]
-    
-    corner_point_yaws = []
-    for cp in corner_points:
-        yaw = compute_p2p_yaw(fp, cp)
-        corner_point_yaws.append(yaw)
-
-    enclosed_corner_points = []
-    corner_counter = 0
-    for cpy in corner_point_yaws:
-        # Two cases: range wraps around or doesn't wrap around
-        if yaw_within_yaw_range(cpy, yaw_adjusted_range):
-            enclosed_corner_points.append(corner_points[corner_counter])
-        
-        corner_counter += 1
-
-    return enclosed_corner_points
-
-# Helper for finding the polygon corresponding to a focal point and yaw range
-def find_polygon(fp, yaw_range):
-    # Determine the yaw slope points
-    p1 = find_point_along_yaw_at_map_bounds(fp, wrap_yaw(yaw_range[0] + (0 if gV.flipped else 32768)))
-    p2 = find_point_along_yaw_at_map_bounds(fp, wrap_yaw(yaw_range[1] + (0 if gV.flipped else 32768)))
-
-    # Check for corner points
-    enclosed_corner_points = find_enclosed_corner_points(fp, yaw_range)
-
-    polygon_points = [fp, p1]
-    for ecp in enclosed_corner_points:
-        polygon_points.append(ecp)
-    polygon_points.append(p2)
-    polygon_points.append(fp)
-
-    return polygon_points
+# Helper for finding what the heatmap counts, or None if the coverage is not drawn as a heatmap
+def heatmap_count():
+    return HEATMAP_RENDER_MODES.get(gV.render_mode)
 
 # Helper for evaluating all test points as valid/invalid
 def get_valid_invalid_points():
-    true_points = []
-    false_points = copy.deepcopy(gV.points)
-
-    for fp, yaw_ranges in gV.fps_and_yaws:
-        new_true_points = []
-        for tp in false_points:
-            yaw = compute_p2p_yaw(fp, tp) if gV.flipped else compute_p2p_yaw(tp, fp)
-            for yaw_range in yaw_ranges:
-                if yaw_within_yaw_range(yaw, yaw_range):
-                    new_true_points.append(tp)
-                    break 
-        for tp in new_true_points:
-            true_points.append(tp)
-            false_points.remove(tp)
-    
-    return true_points, false_points
+    return classify_points(gV.fps_and_yaws, gV.points, gV.flipped, gV.yaw_indices, gV.exact_yaws,
+                           gV.fp_file_starts if gV.polygon_merge_mode == "intersection" else None)
+
+# Helper for finding the first focal point accepting each point, or -1
+#
+# In intersection mode a point has to be accepted by every loaded file.
+def find_accepting_fps(points):
+    perfStats.count("points_classified", len(points))
+    if gV.polygon_merge_mode == "intersection":
+        return find_first_accepting_fps_in_all_groups(gV.fps_and_yaws, points, gV.flipped, gV.fp_file_starts,
+                                                      gV.yaw_indices, gV.exact_yaws)
+    return find_first_accepting_fps(gV.fps_and_yaws, points, gV.flipped, gV.yaw_indices, gV.exact_yaws)
+
+# Canvas tags used to find and update items without redrawing everything
+COVERAGE_TAG = "coverage"
+HOLE_TAG = "hole"
+TEST_POINT_TAG = "test_point"
+VALID_POINT_TAG = "valid_point"
+INVALID_POINT_TAG = "invalid_point"
+HOVER_TAG = "hover"
+
+# Draws the valid camera region for the given focal points as one polygon per yaw range
+#
+# The focal points are drawn after the ones drawn so far, or before the one at first_fp_index.
+def draw_polygon_coverage(fps_and_yaws, first_fp_index=None):
+    with perfStats.phase("geometry"):
+        fp_polygons = [[find_polygon(fp, yaw_range, gV.flipped, gV.exact_yaws) for yaw_range in yaw_ranges]
+                       for fp, yaw_ranges in fps_and_yaws]
+    draw_polygons(fp_polygons, first_fp_index)
+
+# Helper for drawing polygons given in Mario coordinates as coverage, one list of polygons per focal point
+def draw_polygons(fp_polygons, first_fp_index=None):
+    if first_fp_index is None:
+        first_fp_index = len(gV.coverage_polygons)
+    gV.coverage_polygons[first_fp_index:first_fp_index] = fp_polygons
+    perfStats.count("polygons", sum(len(polygons) for polygons in fp_polygons))
+    fp_items = []
+    with perfStats.phase("canvas"):
+        for polygons in fp_polygons:
+            items = []
+            for polygon_points in polygons:
+                screen_polygon_points = gV.viewport.to_screen(polygon_points)
+
+                items.append(canvas.create_polygon(screen_polygon_points, 
+                                                   outline=gV.display_settings["valid_position_color"], 
+                                                   fill=gV.display_settings["valid_position_color"],
+                                                   tags=COVERAGE_TAG))
+            fp_items.append(items)
+    gV.coverage_items[first_fp_index:first_fp_index] = fp_items
+
+# Replaces the polygons of 'removed_count' focal points from first_fp_index on with those of new ones
+def replace_fp_polygons(first_fp_index, removed_count, new_fps_and_yaws):
+    removed = slice(first_fp_index, first_fp_index + removed_count)
+    with perfStats.phase("canvas"):
+        for items in gV.coverage_items[removed]:
+            for item in items:
+                canvas.delete(item)
+    del gV.coverage_items[removed]
+    del gV.coverage_polygons[removed]
+    draw_polygon_coverage(new_fps_and_yaws, first_fp_index)
+    gV.drawn_fp_count += len(new_fps_and_yaws) - removed_count
+
+# Classifies the drawn test points again after the focal points from first_fp_index on changed
+#
+# Points accepted by an earlier focal point keep it; every other point is
+# only checked against the focal points from first_fp_index on.
+def reclassify_points_from(first_fp_index):
+    indices = [i for i, first_fp in enumerate(gV.test_point_first_fps) if first_fp < 0 or first_fp >= first_fp_index]
+    perfStats.count("points_classified", len(indices))
+    with perfStats.phase("classification"):
+        first_fps = find_first_accepting_fps(gV.fps_and_yaws[first_fp_index:], [gV.points[i] for i in indices], 
+                                             gV.flipped, gV.yaw_indices[first_fp_index:], gV.exact_yaws)
+    with perfStats.phase("canvas"):
+        mark_points(indices, [first_fp + first_fp_index if first_fp >= 0 else -1 for first_fp in first_fps])
+
+# Merges the focal points that are not part of the merged coverage yet and redraws it
+#
+# Merging into a large region takes a while, so when rendering in the 
+# background it runs on the merge worker, one merge at a time: focal points 
+# added while a merge runs are merged together by the next one.
+def draw_merged_coverage():
+    coverage = gV.merged_coverage
+    if coverage is None:
+        coverage = polygonMerge.MergedCoverage(gV.polygon_merge_mode)
+    if coverage.fp_count == len(gV.fps_and_yaws):
+        return
+    batches = [(group, gV.fps_and_yaws[start:end]) 
+               for group, (start, end) in file_group_ranges(len(gV.fps_and_yaws), gV.fp_file_starts, 
+                                                            gV.polygon_merge_mode, coverage.fp_count)]
+
+    if not gV.render_in_background:
+        with perfStats.phase("geometry"):
+            gV.merged_coverage = merge_new_fps(coverage, batches, gV.flipped, gV.exact_yaws)
+        draw_merged_shapes()
+        return
+
+    if gV.merge_worker is None:
+        gV.merge_worker = renderWorker.RenderWorker()
+    elif gV.merge_worker.busy():
+        # poll_merge_worker catches up once the running merge is done
+        return
+    gV.merge_worker.submit(compute_merge, coverage, batches, gV.flipped, gV.exact_yaws, perfStats.Frame("merge"))
+    if gV.merge_poll_id is None:
+        gV.merge_poll_id = gV.window.after(RENDER_POLL_INTERVAL_MS, poll_merge_worker)
+
+# Returns a copy of a merged coverage with (group, focal points) batches added
+#
+# Returns None once 'cancelled' reports that the coverage is out of date.
+def merge_new_fps(coverage, batches, flipped, exact, cancelled=lambda: False):
+    merged = coverage.copy()
+    for group, fps_and_yaws in batches:
+        if cancelled():
+            return None
+        merged.add(fps_and_yaws, flipped, exact, group)
+    merged.shapes()
+    return merged
+
+# Merges new focal points on the merge worker, recording the time it takes; returns (coverage, frame)
+def compute_merge(coverage, batches, flipped, exact, frame, cancelled=lambda: False):
+    with frame.phase("geometry"):
+        return merge_new_fps(coverage, batches, flipped, exact, cancelled), frame
+
+# Draws the merge worker's result once it is done, then starts merging whatever was added meanwhile
+def poll_merge_worker():
+    gV.merge_poll_id = None
+    result = gV.merge_worker.take_result()
+    if result is None and gV.merge_worker.busy():
+        gV.merge_poll_id = gV.window.after(RENDER_POLL_INTERVAL_MS, poll_merge_worker)
+        return
 
-# Draws all camera regions specified by 'focal_points_and_yaws' to the screen
+    if result is not None:
+        generation, merged = result
+        if isinstance(merged, Exception):
+            print("ERROR: Merging polygons failed:", merged)
+            return
+        coverage, frame = merged
+        with perfStats.recording("merge", frame):
+            gV.merged_coverage = coverage
+            draw_merged_shapes()
+        canvas.tag_raise(TEST_POINT_TAG)
+        canvas.tag_raise(HOVER_TAG)
+    # Merges dropped by a full redraw are caught up on by the redraw itself
+    if not gV.render_pending and gV.polygon_merge_mode != "none":
+        draw_merged_coverage()
+
+# Draws the merged coverage, replacing what was drawn of it before
+#
+# The merged polygons change as a whole, so they are replaced rather than added to.
+def draw_merged_shapes():
+    perfStats.count("polygons", gV.merged_coverage.polygon_count())
+    with perfStats.phase("canvas"):
+        canvas.delete(COVERAGE_TAG)
+        for exterior, holes in gV.merged_coverage.shapes():
+            canvas.create_polygon(gV.viewport.to_screen(exterior), 
+                                  outline=gV.display_settings["valid_position_color"], 
+                                  fill=gV.display_settings["valid_position_color"],
+                                  tags=COVERAGE_TAG)
+            for hole in holes:
+                canvas.create_polygon(gV.viewport.to_screen(hole), 
+                                      outline=gV.display_settings["valid_position_color"], 
+                                      fill=gV.display_settings["background_color"],
+                                      tags=(COVERAGE_TAG, HOLE_TAG))
+        canvas.tag_lower(COVERAGE_TAG)
+
+    print(str(gV.merged_coverage.wedge_count) + " wedges -> " 
+          + str(gV.merged_coverage.polygon_count()) + " merged polygons")
+
+# Helper for splitting the focal points from first_fp_index on by the file they were loaded from
+#
+# Returns (group, (start, end)) pairs; everything is one group unless intersecting files.
+def file_group_ranges(fp_count, fp_file_starts, merge_mode, first_fp_index=0):
+    ranges = group_ranges(fp_count, fp_file_starts + [first_fp_index])
+    return [(bisect_right(fp_file_starts, start) - 1 if merge_mode == "intersection" else 0, (start, end)) 
+            for start, end in ranges if start >= first_fp_index]
+
+# Shows the coverage tiles of the current view, rendering the ones that are missing or out of date
+#
+# Tiles that scrolled out of view are removed from the canvas, but their masks
+# stay in the tile cache for when the view comes back.
+def show_raster_coverage():
+    if gV.tile_cache is None or gV.tile_cache.count != heatmap_count():
+        gV.tile_cache = tileCache.TileCache(gV.tile_cache_max_bytes, heatmap_count())
+
+    level = gV.viewport.level
+    visible = [(level, tx, tz) for tx, tz in gV.viewport.visible_tiles()]
+    for key in set(gV.tile_images) - set(visible):
+        canvas.delete(gV.tile_images.pop(key)[0])
+
+    hits, misses = gV.tile_cache.hits, gV.tile_cache.misses
+    with perfStats.phase("geometry"):
+        coverages = {key: gV.tile_cache.get(*key, gV.fps_and_yaws, gV.yaw_indices, gV.flipped, gV.exact_yaws) 
+                     for key in visible}
+    perfStats.count("tile_cache_hits", gV.tile_cache.hits - hits)
+    perfStats.count("tile_cache_misses", gV.tile_cache.misses - misses)
+    with perfStats.phase("canvas"):
+        draw_tiles(visible, coverages)
+
+# Helper for putting the given tiles on the canvas, creating images only for tiles that changed
+def draw_tiles(visible, coverages):
+    coloring = tile_coloring(coverages.values())
+    for key in visible:
+        sx, sz = gV.viewport.to_screen([gV.viewport.tile_origin(key[1], key[2])])[0]
+        drawn = gV.tile_images.get(key)
+        if drawn is not None and drawn[2] == (len(gV.fps_and_yaws), coloring):
+            canvas.coords(drawn[0], sx, sz)
+            continue
+
+        if gV.tile_cache.count is None:
+            ppm_data = raster.mask_to_ppm(coverages[key], *coloring)
+        else:
+            ppm_data = heatmap.counts_to_ppm(coverages[key], *coloring)
+
+        # Tk does not hold on to the image itself, so a reference has to be kept alive
+        image = tk.PhotoImage(master=gV.window, data=ppm_data, format="PPM")
+        if drawn is not None:
+            canvas.delete(drawn[0])
+        item = canvas.create_image(sx, sz, image=image, anchor=tk.NW, tags=COVERAGE_TAG)
+        gV.tile_images[key] = (item, image, (len(gV.fps_and_yaws), coloring))
+
+    canvas.tag_lower(COVERAGE_TAG)
+
+# Helper for finding the arguments that color the given tile masks/counts
+#
+# Heatmap colors are scaled to the largest count in view, so tiles are only 
+# up to date while they were drawn with the same scale.
+def tile_coloring(coverages):
+    if gV.tile_cache.count is None:
+        return gV.display_settings["valid_position_color"], gV.display_settings["background_color"]
+    max_count = max((int(counts.max(initial=0)) for counts in coverages), default=0)
+    return (gV.display_settings["heatmap_colormap"], gV.display_settings["heatmap_threshold"],
+            gV.display_settings["background_color"], max_count)
+
+# Helper for removing every coverage tile image from the canvas
+def clear_tile_images():
+    canvas.delete(COVERAGE_TAG)
+    gV.tile_images = {}
+
+# Helper for finding the canvas bounding box of a test point
+def test_point_bbox(tp):
+    sp = gV.viewport.to_screen([tp])[0]
+    return (int(sp[0] - gV.display_settings["test_point_diameter"]/2), 
+            int(sp[1] - gV.display_settings["test_point_diameter"]/2),
+            int(sp[0] + gV.display_settings["test_point_diameter"]/2),
+            int(sp[1] + gV.display_settings["test_point_diameter"]/2))
+
+# Helper for finding the color and tags of a valid/invalid test point
+def test_point_style(valid):
+    if valid:
+        return gV.display_settings["test_point_success_color"], (TEST_POINT_TAG, VALID_POINT_TAG)
+    return gV.display_settings["test_point_failure_color"], (TEST_POINT_TAG, INVALID_POINT_TAG)
+
+# Recolors already drawn test points that became valid after new focal points were added
+def mark_points_valid(point_indices, first_fps):
+    color, tags = test_point_style(True)
+    for i, first_fp in zip(point_indices, first_fps):
+        if first_fp < 0:
+            continue
+        gV.test_point_first_fps[i] = first_fp
+        canvas.itemconfigure(gV.test_point_items[i], outline=color, fill=color, tags=tags)
+
+# Recolors already drawn test points as valid or invalid
+def mark_points(point_indices, first_fps):
+    for i, first_fp in zip(point_indices, first_fps):
+        color, tags = test_point_style(first_fp >= 0)
+        gV.test_point_first_fps[i] = first_fp
+        canvas.itemconfigure(gV.test_point_items[i], outline=color, fill=color, tags=tags)
+
+# Draws everything that changed since the last draw: new focal points and new test points
+def update_screen():
+    # A pending full redraw catches up on everything once it is applied
+    if gV.render_pending:
+        return
+
+    # Switching between polygon and raster rendering requires a full redraw
+    if use_raster_rendering() != gV.drawn_as_raster:
+        draw_screen()
+        return
+
+    new_fps_and_yaws = gV.fps_and_yaws[gV.drawn_fp_count:]
+    new_points = gV.points[len(gV.test_point_items):]
+    if len(new_fps_and_yaws) > 0 or len(new_points) > 0:
+        with perfStats.recording("update"):
+            draw_new_items(new_fps_and_yaws, new_points)
+
+    canvas.tag_raise(TEST_POINT_TAG)
+    canvas.tag_raise(HOVER_TAG)
+
+# Helper for drawing the coverage of focal points and test points that were added since the last draw
+def draw_new_items(new_fps_and_yaws, new_points):
+    new_yaw_indices = gV.yaw_indices[gV.drawn_fp_count:]
+    if len(new_fps_and_yaws) > 0:
+        if gV.drawn_as_raster:
+            show_raster_coverage()
+        elif gV.polygon_merge_mode != "none":
+            draw_merged_coverage()
+        else:
+            draw_polygon_coverage(new_fps_and_yaws)
+
+        if gV.polygon_merge_mode == "intersection":
+            # A new file can also shrink the intersection, so every drawn point is checked again
+            drawn_points = gV.points[:len(gV.test_point_items)]
+            with perfStats.phase("classification"):
+                first_fps = find_accepting_fps(drawn_points)
+            with perfStats.phase("canvas"):
+                mark_points(range(len(drawn_points)), first_fps)
+        else:
+            # Only points that were invalid can change, and only the new focal points can accept them
+            invalid_indices = [i for i, first_fp in enumerate(gV.test_point_first_fps) if first_fp < 0]
+            invalid_points = [gV.points[i] for i in invalid_indices]
+            perfStats.count("points_classified", len(invalid_points))
+            with perfStats.phase("classification"):
+                first_fps = find_first_accepting_fps(new_fps_and_yaws, invalid_points, gV.flipped, 
+                                                     new_yaw_indices, gV.exact_yaws)
+            with perfStats.phase("canvas"):
+                mark_points_valid(invalid_indices, [first_fp + gV.drawn_fp_count if first_fp >= 0 else -1 
+                                                    for first_fp in first_fps])
+        gV.drawn_fp_count = len(gV.fps_and_yaws)
+
+    if len(new_points) > 0:
+        with perfStats.phase("classification"):
+            first_fps = find_accepting_fps(new_points)
+        with perfStats.phase("canvas"):
+            for tp, first_fp in zip(new_points, first_fps):
+                color, tags = test_point_style(first_fp >= 0)
+                gV.test_point_items.append(canvas.create_oval(*test_point_bbox(tp), outline=color, fill=color, 
+                                                              tags=tags))
+                gV.test_point_first_fps.append(first_fp)
+
+# Applies changed display settings to the existing canvas items
+def refresh_display_settings():
+    canvas.configure(bg=gV.display_settings["background_color"])
+
+    if gV.drawn_as_raster:
+        # Cached tiles only hold masks, so they can be shown in the new colors right away
+        clear_tile_images()
+        if raster_coverage_shown():
+            show_raster_coverage()
+    else:
+        canvas.itemconfigure(COVERAGE_TAG, 
+                             outline=gV.display_settings["valid_position_color"], 
+                             fill=gV.display_settings["valid_position_color"])
+        canvas.itemconfigure(HOLE_TAG, fill=gV.display_settings["background_color"])
+
+    for valid, tag in ((True, VALID_POINT_TAG), (False, INVALID_POINT_TAG)):
+        color, tags = test_point_style(valid)
+        canvas.itemconfigure(tag, outline=color, fill=color)
+
+    reposition_test_points()
+
+# Helper for moving the test points to where the current view shows them
+def reposition_test_points():
+    for tp, item in zip(gV.points, gV.test_point_items):
+        canvas.coords(item, *test_point_bbox(tp))
+
+# Removes all focal point polygons and marks every test point as invalid
+def clear_coverage():
+    clear_tile_images()
+    if gV.tile_cache is not None:
+        gV.tile_cache.clear()
+    if gV.merge_worker is not None:
+        gV.merge_worker.cancel()
+    gV.merged_coverage = None
+    gV.coverage_polygons = []
+    gV.coverage_items = []
+    gV.drawn_fp_count = 0
+
+    mark_all_points_invalid()
+
+# Helper for recoloring every drawn test point as invalid
+def mark_all_points_invalid():
+    color, tags = test_point_style(False)
+    canvas.itemconfigure(TEST_POINT_TAG, outline=color, fill=color)
+    canvas.dtag(VALID_POINT_TAG, VALID_POINT_TAG)
+    canvas.addtag_withtag(INVALID_POINT_TAG, TEST_POINT_TAG)
+    gV.test_point_first_fps = [-1] * len(gV.test_point_first_fps)
+
+# Removes all test point ovals
+def clear_test_point_items():
+    canvas.delete(TEST_POINT_TAG)
+    gV.test_point_items = []
+    gV.test_point_first_fps = []
+
+# Requests a redraw of all camera regions specified by 'focal_points_and_yaws' and all test points
+#
+# The geometry is computed on the render worker once no new requests came in 
+# for RENDER_DEBOUNCE_MS, so quickly repeated requests only cause one redraw.
+# Until the result is applied, the canvas keeps showing the previous drawing 
+# and incremental updates wait.
 def draw_screen():
+    gV.render_pending = True
+    if gV.profile_next_redraw:
+        # Profiling covers the whole redraw, so it runs right away on this thread
+        gV.profile_next_redraw = False
+        cancel_background_render()
+        perfStats.profile_call(lambda: apply_render(compute_render(render_inputs())), PROFILE_FILENAME)
+        return
+    if not gV.render_in_background:
+        apply_render(compute_render(render_inputs()))
+        return
+
+    if gV.render_worker is None:
+        gV.render_worker = renderWorker.RenderWorker()
+    # Whatever is being computed is out of date now
+    cancel_background_render()
+    gV.render_after_id = gV.window.after(RENDER_DEBOUNCE_MS, start_render)
+
+# Helper for dropping the redraw that is waiting to start or being computed, if any
+def cancel_background_render():
+    if gV.render_worker is not None:
+        gV.render_worker.cancel()
+    # A full redraw also merges everything again
+    if gV.merge_worker is not None:
+        gV.merge_worker.cancel()
+    if gV.render_after_id is not None:
+        gV.window.after_cancel(gV.render_after_id)
+        gV.render_after_id = None
+
+# Hands the current inputs to the render worker and starts polling for its result
+def start_render():
+    gV.render_after_id = None
+    gV.render_worker.submit(compute_render, render_inputs())
+    if gV.render_poll_id is None:
+        gV.render_poll_id = gV.window.after(RENDER_POLL_INTERVAL_MS, poll_render)
+
+# Applies the render worker's result once it is done and reschedules itself until then
+def poll_render():
+    gV.render_poll_id = None
+    result = gV.render_worker.take_result()
+    if result is None:
+        if gV.render_worker.busy():
+            gV.render_poll_id = gV.window.after(RENDER_POLL_INTERVAL_MS, poll_render)
+        return
+
+    generation, rendered = result
+    if isinstance(rendered, Exception):
+        gV.render_pending = False
+        print("ERROR: Redraw failed:", rendered)
+        return
+    apply_render(rendered)
+
+# Helper for collecting everything a full redraw depends on
+#
+# The lists are copied, so the render worker is not affected by focal points
+# or test points being added while it runs.
+def render_inputs():
+    return {"fps_and_yaws": gV.fps_and_yaws.copy(),
+            "yaw_indices": gV.yaw_indices.copy(),
+            "points": list(gV.points),
+            "fp_file_starts": list(gV.fp_file_starts),
+            "flipped": gV.flipped,
+            "exact": gV.exact_yaws,
+            "merge_mode": gV.polygon_merge_mode,
+            "raster": use_raster_rendering(),
+            "heatmap_count": heatmap_count(),
+            "tiles": [(gV.viewport.level, tx, tz) for tx, tz in gV.viewport.visible_tiles()],
+            "tile_cache_max_bytes": gV.tile_cache_max_bytes,
+            "frame": perfStats.Frame("redraw")}
+
+# Computes the geometry of a full redraw without touching the canvas; runs on the render worker
+#
+# Returns None once 'cancelled' reports that the inputs are out of date. 
+# Polygons are kept in Mario coordinates, as the view may change before the 
+# result is applied.
+def compute_render(inputs, cancelled=lambda: False):
+    with inputs["frame"].phase("geometry"):
+        rendered = compute_render_geometry(inputs, cancelled)
+    if rendered is None or cancelled():
+        return None
+
+    with inputs["frame"].phase("classification"):
+        if inputs["merge_mode"] == "intersection":
+            rendered["first_fps"] = find_first_accepting_fps_in_all_groups(inputs["fps_and_yaws"], inputs["points"], 
+                                                                           inputs["flipped"], inputs["fp_file_starts"], 
+                                                                           inputs["yaw_indices"], inputs["exact"])
+        else:
+            rendered["first_fps"] = find_first_accepting_fps(inputs["fps_and_yaws"], inputs["points"], 
+                                                             inputs["flipped"], inputs["yaw_indices"], inputs["exact"])
+    inputs["frame"].count("points_classified", len(inputs["points"]))
+    if rendered["tile_cache"] is not None:
+        inputs["frame"].count("tile_cache_misses", rendered["tile_cache"].misses)
+    return rendered
+
+# Helper for computing the coverage part of a full redraw; returns None if cancelled
+def compute_render_geometry(inputs, cancelled):
+    fps_and_yaws = inputs["fps_and_yaws"]
+    yaw_indices = inputs["yaw_indices"]
+    rendered = {"inputs": inputs, "tile_cache": None, "merged_coverage": None, "polygons": []}
+
+    if inputs["raster"]:
+        rendered["tile_cache"] = tileCache.TileCache(inputs["tile_cache_max_bytes"], inputs["heatmap_count"])
+        if len(fps_and_yaws) > 0:
+            for key in inputs["tiles"]:
+                if cancelled():
+                    return None
+                rendered["tile_cache"].get(*key, fps_and_yaws, yaw_indices, inputs["flipped"], inputs["exact"])
+    elif inputs["merge_mode"] != "none":
+        if len(fps_and_yaws) > 0:
+            rendered["merged_coverage"] = polygonMerge.MergedCoverage(inputs["merge_mode"])
+            for group, (start, end) in file_group_ranges(len(fps_and_yaws), inputs["fp_file_starts"], 
+                                                         inputs["merge_mode"]):
+                if cancelled():
+                    return None
+                rendered["merged_coverage"].add(fps_and_yaws[start:end], inputs["flipped"], inputs["exact"], group)
+            rendered["merged_coverage"].shapes()
+    else:
+        for fp, yaw_ranges in fps_and_yaws:
+            if cancelled():
+                return None
+            rendered["polygons"].append([find_polygon(fp, yaw_range, inputs["flipped"], inputs["exact"]) 
+                                         for yaw_range in yaw_ranges])
+    return rendered
+
+# Replaces everything on the canvas with a computed full redraw, then draws whatever was added since
+def apply_render(rendered):
+    with perfStats.recording("redraw", rendered["inputs"]["frame"]):
+        apply_render_items(rendered)
+
+# Helper for replacing the canvas items with the ones of a full redraw
+def apply_render_items(rendered):
+    inputs = rendered["inputs"]
+
     # Clear existing canvas
-    for shape in gV.shapes:
-        canvas.delete(shape)
+    canvas.delete(COVERAGE_TAG)
+    canvas.delete(TEST_POINT_TAG)
 
     canvas.configure(bg=gV.display_settings["background_color"])
-    gV.shapes = []
+    gV.tile_images = {}
+    gV.tile_cache = rendered["tile_cache"]
+    gV.merged_coverage = rendered["merged_coverage"]
+    gV.coverage_polygons = []
+    gV.coverage_items = []
+    gV.drawn_fp_count = len(inputs["fps_and_yaws"])
+    gV.drawn_as_raster = inputs["raster"]
+    gV.render_pending = False
+
+    if raster_coverage_shown():
+        show_raster_coverage()
+    elif gV.merged_coverage is not None:
+        draw_merged_shapes()
+    draw_polygons(rendered["polygons"])
+
+    gV.test_point_items = []
+    gV.test_point_first_fps = []
+    with perfStats.phase("canvas"):
+        for tp, first_fp in zip(inputs["points"], rendered["first_fps"]):
+            color, tags = test_point_style(first_fp >= 0)
+            gV.test_point_items.append(canvas.create_oval(*test_point_bbox(tp), outline=color, fill=color, tags=tags))
+            gV.test_point_first_fps.append(first_fp)
+
+    update_screen()
+
+# Moves everything on the canvas from where the view (old_level, old_x_min, old_z_min) showed it to the current view
+def follow_viewport(old_level, old_x_min, old_z_min):
+    with perfStats.recording("view"):
+        move_items(old_level, old_x_min, old_z_min)
+
+# Helper for moving and rescaling the canvas items, and adding the tiles that came into view
+def move_items(old_level, old_x_min, old_z_min):
+    factor = 2**(gV.viewport.level - old_level)
+    units = gV.viewport.units_per_pixel()
+    dx = (old_x_min - gV.viewport.x_min) / units
+    dz = (old_z_min - gV.viewport.z_min) / units
+
+    # The status line belongs to the old cursor position
+    canvas.delete(HOVER_TAG)
+
+    if factor == 1:
+        # Pure pans keep every item's shape, so a single move is enough
+        canvas.move(tk.ALL, dx, dz)
+    else:
+        if gV.drawn_as_raster:
+            clear_tile_images()
+        else:
+            canvas.scale(COVERAGE_TAG, 0, 0, factor, factor)
+            canvas.move(COVERAGE_TAG, dx, dz)
+        # Test points keep their size on screen
+        reposition_test_points()
+
+    if raster_coverage_shown():
+        show_raster_coverage()
+
+# Helper for checking whether coverage tiles should be on screen
+#
+# While a full redraw is pending the tile cache may belong to outdated settings, so no tiles are added.
+def raster_coverage_shown():
+    return gV.drawn_as_raster and gV.drawn_fp_count > 0 and not gV.render_pending
+
+# Callback for zooming in (steps > 0) or out around the mouse cursor
+def zoom_view(steps, event):
+    old_view = (gV.viewport.level, gV.viewport.x_min, gV.viewport.z_min)
+    if gV.viewport.zoom(steps, event.x, event.y) != 1:
+        follow_viewport(*old_view)
+
+# Callback for the mouse wheel on Windows and macOS; other platforms report wheel steps as buttons 4 and 5
+def on_mouse_wheel(event):
+    zoom_view(ZOOM_STEPS_PER_WHEEL_STEP if event.delta > 0 else -ZOOM_STEPS_PER_WHEEL_STEP, event)
+
+# Callback for starting to drag the view
+def start_pan(event):
+    gV.pan_anchor = (event.x, event.y)
+
+# Callback for dragging the view
+def pan_view(event):
+    if gV.pan_anchor is None:
+        return
+    old_view = (gV.viewport.level, gV.viewport.x_min, gV.viewport.z_min)
+    gV.viewport.pan(event.x - gV.pan_anchor[0], event.y - gV.pan_anchor[1])
+    gV.pan_anchor = (event.x, event.y)
+    follow_viewport(*old_view)
+
+# Shows the whole map again
+def reset_view():
+    old_view = (gV.viewport.level, gV.viewport.x_min, gV.viewport.z_min)
+    gV.viewport.reset()
+    follow_viewport(*old_view)
+
+# Makes the next full redraw run under cProfile; the stats are printed and saved to PROFILE_FILENAME
+def profile_next_redraw():
+    gV.profile_next_redraw = True
+    print("The next redraw will be profiled.")
+
+# Spawns a file dialog and saves the timings of the most recent frames as JSON
+def spawn_save_frame_timings_window():
+    filename = filedialog.asksaveasfilename(initialfile = 'frames.json',
+                                        defaultextension=".json",
+                                        filetypes=[("All Files","*.*"),
+                                                   ("JSON Files","*.json")])
     
-    # Draw Polygons
-    for fp, yaw_ranges in gV.fps_and_yaws:
-        for yaw_range in yaw_ranges:
-            polygon_points = find_polygon(fp, yaw_range)
-            screen_polygon_points = mario_to_screen(polygon_points)
+    if filename is None or filename == "":
+        return
 
-            gV.shapes.append(canvas.create_polygon(screen_polygon_points, 
-                                                   outline=gV.display_settings["valid_position_color"], 
-                                                   fill=gV.display_settings["valid_position_color"]))
-
-    # Draw Test Points
-    true_points, false_points = get_valid_invalid_points()
-
-    true_sps = mario_to_screen(true_points)
-    false_sps = mario_to_screen(false_points)
-
-    for sp in true_sps:
-        gV.shapes.append(canvas.create_oval(int(sp[0] - gV.display_settings["test_point_diameter"]/2), 
-                                            int(sp[1] - gV.display_settings["test_point_diameter"]/2),
-                                            int(sp[0] + gV.display_settings["test_point_diameter"]/2),
-                                            int(sp[1] + gV.display_settings["test_point_diameter"]/2),
-                                            outline=gV.display_settings["test_point_success_color"], 
-                                            fill=gV.display_settings["test_point_success_color"]))
-    for sp in false_sps:
-        gV.shapes.append(canvas.create_oval(int(sp[0] - gV.display_settings["test_point_diameter"]/2), 
-                                            int(sp[1] - gV.display_settings["test_point_diameter"]/2),
-                                            int(sp[0] + gV.display_settings["test_point_diameter"]/2),
-                                            int(sp[1] + gV.display_settings["test_point_diameter"]/2),
-                                            outline=gV.display_settings["test_point_failure_color"],
-                                            fill=gV.display_settings["test_point_failure_color"]))
+    perfStats.frame_log.save_json(filename)
+
+# Shows the timings and counters of a frame in the status bar
+def show_frame_stats(frame):
+    gV.perf_status_var.set(frame.summary())
+
+# Returns the wedge index of the loaded focal points, or None while it is still being built
+#
+# When rendering in the background, missing blocks of the index are built on 
+# the wedge worker instead of on the Tk thread.
+def current_wedge_index():
+    index = gV.wedge_index
+    if index is None or index.flipped != gV.flipped or index.indexed_fp_count() > len(gV.fps_and_yaws):
+        index = gV.wedge_index = wedgeIndex.WedgeIndex(gV.fps_and_yaws, gV.flipped, gV.exact_yaws)
+    index.exact = gV.exact_yaws
+    if not gV.render_in_background:
+        index.update()
+    if index.ready():
+        return index
+    build_wedge_index()
+    return None
+
+# Starts building the next missing block of the wedge index on the wedge worker, if it is not building one already
+def build_wedge_index():
+    if gV.wedge_index is None or not gV.render_in_background:
+        return
+    build = gV.wedge_index.next_build()
+    if build is None:
+        return
+    if gV.wedge_worker is None:
+        gV.wedge_worker = renderWorker.RenderWorker()
+    # A running build is out of date by now, as the index only hands out one build at a time
+    gV.wedge_worker.submit(compute_wedge_block, build)
+    if gV.wedge_poll_id is None:
+        gV.wedge_poll_id = gV.window.after(RENDER_POLL_INTERVAL_MS, poll_wedge_worker)
+
+# Computes a block of the wedge index on the wedge worker; returns (build, cells)
+def compute_wedge_block(build, cancelled=lambda: False):
+    return build, wedgeIndex.compute_block(build, cancelled)
+
+# Adds the wedge worker's block to the index once it is done, then builds the next missing one
+def poll_wedge_worker():
+    gV.wedge_poll_id = None
+    result = gV.wedge_worker.take_result()
+    if result is None and gV.wedge_worker.busy():
+        gV.wedge_poll_id = gV.window.after(RENDER_POLL_INTERVAL_MS, poll_wedge_worker)
+        return
 
-# Main Code
+    if result is not None and gV.wedge_index is not None:
+        generation, built = result
+        if isinstance(built, Exception):
+            print("ERROR: Indexing the wedges failed:", built)
+            gV.wedge_index = None
+            return
+        build, cells = built
+        # Blocks whose focal points changed meanwhile are ignored and built again
+        gV.wedge_index.install(build, cells)
+    build_wedge_index()
+
+# Updates the wedge index after the focal points [start, end) were replaced by 'count' others
+#
+# Only the blocks of the index containing changed focal points are built again.
+def update_wedge_index(start, end, count):
+    if gV.wedge_index is not None:
+        gV.wedge_index.replace(start, end, count)
+        build_wedge_index()
+
+# Helper for describing the (focal point index, range index) pairs accepting a position
+def describe_wedges(x, z, wedges, max_listed=None):
+    fp_count = len(set(fp_index for fp_index, range_index in wedges))
+    text = "X: {:.1f}  Z: {:.1f}  |  {} FP(s), {} range(s)".format(x, z, fp_count, len(wedges))
+    listed = wedges if max_listed is None else wedges[:max_listed]
+    descriptions = []
+    for fp_index, range_index in listed:
+        fp, yaw_range = gV.wedge_index.wedge(fp_index, range_index)
+        descriptions.append("#{} ({}, {}) [{}, {}]".format(fp_index, fp[0], fp[1], yaw_range[0], yaw_range[1]))
+    if len(listed) < len(wedges):
+        descriptions.append("...")
+    if len(descriptions) > 0:
+        text += ": " + ", ".join(descriptions)
+    return text
+
+# Helper for drawing a status line in the top left corner of the canvas
+def show_hover_status(text):
+    canvas.delete(HOVER_TAG)
+    text_item = canvas.create_text(4, 4, text=text, anchor="nw", fill="#FFFFFF", tags=HOVER_TAG)
+    canvas.create_rectangle(*canvas.bbox(text_item), fill="#000000", outline="", tags=HOVER_TAG)
+    canvas.tag_raise(text_item)
+
+# Callback for showing which focal points and yaw ranges accept the position under the mouse cursor
+def on_hover(event):
+    x, z = gV.viewport.to_mario(event.x, event.y)
+    index = current_wedge_index()
+    if index is None:
+        show_hover_status("X: {:.1f}  Z: {:.1f}  |  indexing...".format(x, z))
+        return
+    show_hover_status(describe_wedges(x, z, index.query(x, z), HOVER_MAX_LISTED_WEDGES))
+
+# Callback for removing the status line when the mouse cursor leaves the canvas
+def clear_hover(event):
+    canvas.delete(HOVER_TAG)
+
+# Callback for printing every focal point and yaw range accepting the position under the mouse cursor
+def print_hovered_wedges(event):
+    x, z = gV.viewport.to_mario(event.x, event.y)
+    index = current_wedge_index()
+    if index is None:
+        print("The wedges are still being indexed; try again in a moment.")
+        return
+    print(describe_wedges(x, z, index.query(x, z)))
 
-# Create TKinter Window/Canvas     
-setup_window()
+# Creates the window and canvas and runs the program
+def main():
+    global canvas
 
-setup_menu_bar()
+    # Create TKinter Window/Canvas     
+    setup_window()
 
-canvas_frame = tk.Frame()
+    setup_menu_bar()
 
-canvas = tk.Canvas(master=canvas_frame)
-canvas.configure(bg=gV.display_settings["background_color"])
-canvas.pack(fill = tk.BOTH, expand = 1)  
+    canvas_frame = tk.Frame()
 
-canvas_frame.pack(fill = tk.BOTH, expand = 1)
+    canvas = tk.Canvas(master=canvas_frame)
+    canvas.configure(bg=gV.display_settings["background_color"])
+    canvas.pack(fill = tk.BOTH, expand = 1)
+
+    canvas.bind("<ButtonPress-1>", start_pan)
+    canvas.bind("<B1-Motion>", pan_view)
+    canvas.bind("<MouseWheel>", on_mouse_wheel)
+    canvas.bind("<Button-4>", partial(zoom_view, ZOOM_STEPS_PER_WHEEL_STEP))
+    canvas.bind("<Button-5>", partial(zoom_view, -ZOOM_STEPS_PER_WHEEL_STEP))
+    canvas.bind("<Motion>", on_hover)
+    canvas.bind("<Leave>", clear_hover)
+    canvas.bind("<ButtonPress-3>", print_hovered_wedges)
+
+    canvas_frame.pack(fill = tk.BOTH, expand = 1)
+
+    # Status bar with the timings of the last frame; the window grows to keep the canvas size
+    gV.perf_status_var = tk.StringVar(master=gV.window)
+    status_bar = tk.Label(gV.window, textvariable=gV.perf_status_var, anchor="w", relief=tk.SUNKEN)
+    status_bar.pack(fill = tk.X, side = tk.BOTTOM, before = canvas_frame)
+    gV.window.geometry("1024x" + str(1024 + status_bar.winfo_reqheight()))
+    perfStats.frame_log.listener = show_frame_stats
 
-draw_screen()
+    draw_screen()
+
+    gV.window.mainloop()
 
-gV.window.mainloop()
+# Main Code
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import sys
+from polygonMerge import merge_fp_yaw_ranges
+
+
+"""
+Normalization of focal point/yaw range lists.
+
+Files concatenated from several search runs list the same focal point many
+times, and their yaw ranges overlap or touch, so the same area is drawn and
+tested over and over. Normalizing groups identical focal points (keeping the
+order in which they first appear) and merges the yaw ranges of each one into
+disjoint ranges, joining ranges that meet across 65535/0 the same way
+yaw_within_yaw_range treats wrap-around ranges. The accepted positions do not
+change. Focal points left without any yaw range in [0, 65535] are dropped.
+
+Usage:
+
+python normalization.py <input file> <output file>
+"""
+
+# Counts of focal points and yaw ranges before and after normalizing
+class NormalizationStats:
+    def __init__(self, fps_before, ranges_before, fps_after, ranges_after):
+        self.fps_before = fps_before
+        self.ranges_before = ranges_before
+        self.fps_after = fps_after
+        self.ranges_after = ranges_after
+
+    def removed_fps(self):
+        return self.fps_before - self.fps_after
+
+    def removed_ranges(self):
+        return self.ranges_before - self.ranges_after
+
+    def summary(self):
+        return ("Normalized {} focal points with {} yaw ranges to {} with {} (removed {} focal points, {} yaw ranges)"
+                .format(self.fps_before, self.ranges_before, self.fps_after, self.ranges_after,
+                        self.removed_fps(), self.removed_ranges()))
+
+# Groups identical focal points and merges their yaw ranges
+#
+# Returns the normalized list of (fp, yaw_ranges) records and a NormalizationStats.
+def normalize_fps_and_yaws(fps_and_yaws):
+    grouped = {}
+    ranges_before = 0
+    fps_before = 0
+    for fp, yaw_ranges in fps_and_yaws:
+        grouped.setdefault(tuple(fp), []).extend(yaw_ranges)
+        ranges_before += len(yaw_ranges)
+        fps_before += 1
+
+    normalized = []
+    ranges_after = 0
+    for fp, yaw_ranges in grouped.items():
+        merged = merge_fp_yaw_ranges(yaw_ranges)
+        if len(merged) == 0:
+            continue
+        normalized.append((fp, merged))
+        ranges_after += len(merged)
+
+    return normalized, NormalizationStats(fps_before, ranges_before, len(normalized), ranges_after)
+
+if __name__ == "__main__":
+    # fileLoader imports this module, so it is only imported when run as a script
+    import fileLoader
+
+    if len(sys.argv) != 3:
+        print("Usage: python normalization.py <input file> <output file>")
+        print("Merges duplicate focal points and overlapping yaw ranges; the output format follows the file extension.")
+        sys.exit(1)
+
+    normalized, stats = normalize_fps_and_yaws(fileLoader.read_file(sys.argv[1]))
+    fileLoader.save_file(sys.argv[2], normalized)
+    print(stats.summary())
@@ -0,0 +1,137 @@
+import time
+import json
+import pstats
+import cProfile
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+
+"""
+Timings and counters for the viewer's drawing pipeline.
+
+Every redraw, incremental update, view change, file load and PNG export is
+recorded as a Frame: its total wall time, the time spent in each phase of
+PHASES and counters such as the number of polygons drawn, test points
+classified and tile cache hits. The last MAX_FRAMES frames are kept in
+frame_log and can be saved as JSON.
+
+Code on the Tk thread records into the active frame with phase() and
+count(), which do nothing outside of recording(). Work on other threads
+(the render worker) records into a Frame object it is handed directly.
+"""
+
+# Pipeline phases, in the order they are reported
+PHASES = ("load", "geometry", "classification", "canvas", "export")
+
+# Number of frames kept in the log
+MAX_FRAMES = 100
+
+class Frame:
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.time()
+        self.seconds = None
+        self.phases = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+
+    # Context manager adding the time spent inside it to a phase
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Returns the seconds since the frame started
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def finish(self):
+        self.seconds = self.elapsed()
+
+    def to_dict(self):
+        return {"kind": self.kind, "started": self.started, "seconds": self.seconds,
+                "phases": dict(self.phases), "counters": dict(self.counters)}
+
+    # Returns a one line description, e.g. for a status bar
+    def summary(self):
+        phases = sorted(self.phases, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES))
+        text = "{}: {:.1f} ms".format(self.kind.capitalize(), 1000 * (self.seconds or 0.0))
+        if len(phases) > 0:
+            text += " (" + ", ".join("{} {:.1f} ms".format(name, 1000 * self.phases[name]) for name in phases) + ")"
+        if len(self.counters) > 0:
+            text += "  |  " + ", ".join("{} {}".format(name.replace("_", " "), self.counters[name])
+                                        for name in sorted(self.counters))
+        return text
+
+# The most recent frames; 'listener', if set, is called with every frame added
+class FrameLog:
+    def __init__(self, max_frames=MAX_FRAMES):
+        self.frames = deque(maxlen=max_frames)
+        self.listener = None
+
+    def add(self, frame):
+        self.frames.append(frame)
+        if self.listener is not None:
+            self.listener(frame)
+
+    def save_json(self, filename):
+        with open(filename, "w") as file:
+            json.dump({"frames": [frame.to_dict() for frame in self.frames]}, file, indent=2)
+
+frame_log = FrameLog()
+
+# Frame being recorded on the Tk thread
+active_frame = None
+
+# Context manager recording a frame of the given kind (or the given frame) into frame_log
+#
+# Frames do not nest: inside another recording, everything is added to the outer frame.
+@contextmanager
+def recording(kind, frame=None):
+    global active_frame
+    if active_frame is not None:
+        yield active_frame
+        return
+
+    active_frame = frame if frame is not None else Frame(kind)
+    try:
+        yield active_frame
+    finally:
+        finished, active_frame = active_frame, None
+        finished.finish()
+        frame_log.add(finished)
+
+# Finishes a frame recorded elsewhere (e.g. across several Tk callbacks) and adds it to frame_log
+def finish(frame):
+    frame.finish()
+    frame_log.add(frame)
+
+# Context manager adding the time spent inside it to a phase of the active frame
+def phase(name):
+    return nullcontext() if active_frame is None else active_frame.phase(name)
+
+# Adds to a counter of the active frame
+def count(name, amount=1):
+    if active_frame is not None:
+        active_frame.count(name, amount)
+
+# Helper for running a function under cProfile, saving the stats and printing the most expensive calls
+def profile_call(function, filename, top=25):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return function()
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+        print("Saved profile to", filename)
@@ -0,0 +1,87 @@
+from geometry import mario_to_screen, find_polygon
+from classifier import classify_points
+import polygonMerge
+import raster
+import heatmap
+from yawIndex import build_yaw_indices
+import backends
+
+
+"""
+Renders focal point/yaw range data and test points to a PIL image.
+
+This is the drawing code behind 'Save PNG', kept free of Tk so that images 
+can also be produced without a display (see batchRender.py). Requires Pillow,
+which is imported on first use.
+"""
+
+# Helper for drawing the valid camera region and test points into a new 1024x1024 image
+#
+# merge_mode is one of polygonMerge.MERGE_MODES; group_starts gives the first 
+# focal point of every loaded file after the first for "intersection".
+# With heatmap_count (one of heatmap.COUNT_MODES), the coverage counts are 
+# drawn in the display settings' heatmap colors instead; this needs NumPy.
+def render_image(fps_and_yaws, points, flipped, display_settings, yaw_indices=None, exact=False, 
+                 merge_mode="none", group_starts=None, heatmap_count=None):
+    Image, ImageDraw = backends.pil()
+    if yaw_indices is None:
+        yaw_indices = build_yaw_indices(fps_and_yaws)
+
+    if heatmap_count is not None:
+        counts = raster.coverage_counts(fps_and_yaws, yaw_indices, flipped, exact=exact, 
+                                        count_ranges=heatmap_count == "ranges")
+        output = Image.fromarray(heatmap.counts_to_rgb(counts, display_settings["heatmap_colormap"], 
+                                                       display_settings["heatmap_threshold"], 
+                                                       display_settings["background_color"]), "RGB")
+        draw = ImageDraw.Draw(output)
+    else:
+        output = Image.new("RGB", (1024, 1024), display_settings["background_color"])
+        draw = ImageDraw.Draw(output)
+        draw_polygons(draw, fps_and_yaws, flipped, display_settings, exact, merge_mode, group_starts)
+
+    # Draw Test Points
+    true_points, false_points = classify_points(fps_and_yaws, points, flipped, yaw_indices, exact, 
+                                                group_starts if merge_mode == "intersection" else None)
+
+    true_sps = mario_to_screen(true_points)
+    false_sps = mario_to_screen(false_points)
+
+    for sp in true_sps:
+        draw.ellipse([int(sp[0] - display_settings["test_point_diameter"]/2), 
+                      int(sp[1] - display_settings["test_point_diameter"]/2),
+                      int(sp[0] + display_settings["test_point_diameter"]/2),
+                      int(sp[1] + display_settings["test_point_diameter"]/2)],
+                      outline=display_settings["test_point_success_color"],
+                      fill=display_settings["test_point_success_color"])
+    for sp in false_sps:
+        draw.ellipse([int(sp[0] - display_settings["test_point_diameter"]/2), 
+                      int(sp[1] - display_settings["test_point_diameter"]/2),
+                      int(sp[0] + display_settings["test_point_diameter"]/2),
+                      int(sp[1] + display_settings["test_point_diameter"]/2)],
+                      outline=display_settings["test_point_failure_color"],
+                      fill=display_settings["test_point_failure_color"])
+
+    return output
+
+# Helper for drawing the valid camera region as polygons, either one per wedge or merged
+def draw_polygons(draw, fps_and_yaws, flipped, display_settings, exact=False, merge_mode="none", group_starts=None):
+    if merge_mode == "none":
+        for fp, yaw_ranges in fps_and_yaws:
+            for yaw_range in yaw_ranges:
+                polygon_points = find_polygon(fp, yaw_range, flipped, exact)
+                screen_polygon_points = mario_to_screen(polygon_points)
+
+                draw.polygon(screen_polygon_points, 
+                             outline=display_settings["valid_position_color"], 
+                             fill=display_settings["valid_position_color"])
+        return
+
+    coverage = polygonMerge.merge_coverage(fps_and_yaws, flipped, merge_mode, group_starts, exact)
+    for exterior, holes in coverage.shapes():
+        draw.polygon(mario_to_screen(exterior), 
+                     outline=display_settings["valid_position_color"], 
+                     fill=display_settings["valid_position_color"])
+        for hole in holes:
+            draw.polygon(mario_to_screen(hole), 
+                         outline=display_settings["valid_position_color"], 
+                         fill=display_settings["background_color"])
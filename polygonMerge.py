@@ -0,0 +1,136 @@
+from functools import reduce
+from geometry import find_polygon
+from yawIndex import merge_yaw_ranges
+from classifier import group_ranges
+import backends
+
+
+"""
+Merging of the per-yaw-range wedges into fewer, non-overlapping polygons.
+
+By default every (focal point, yaw range) pair is drawn as its own polygon,
+so overlapping ranges and focal points covering the same area paint the same
+pixels over and over. Two merge modes are offered instead:
+
+ - "union": the whole valid region as a small set of disjoint polygons
+ - "intersection": only the positions that are valid for every group of
+   focal points (normally one group per loaded file)
+
+Merging is done with Shapely, which is imported on first use. Without it, the
+union falls back to merging the overlapping ranges of each focal point, which
+needs no extra dependencies but leaves overlaps between focal points. Merged
+polygons may have holes; they are returned as (exterior, holes) shapes,
+largest first, so drawing each exterior and then its holes in the background
+color reproduces the region (islands inside a hole are always smaller than
+the polygon with the hole, so they are drawn later).
+"""
+
+MERGE_MODES = ("none", "union", "intersection")
+
+# Helper for merging the overlapping yaw ranges of one focal point, joining ranges that meet across 65535/0
+def merge_fp_yaw_ranges(yaw_ranges):
+    merged = merge_yaw_ranges(yaw_ranges)
+    if len(merged) > 1 and merged[0][0] == 0 and merged[-1][1] == 65535:
+        merged = [(merged[-1][0], merged[0][1])] + merged[1:-1]
+    return merged
+
+# Helper for building one wedge polygon per merged yaw range of each focal point
+def merged_wedge_polygons(fps_and_yaws, flipped, exact=False):
+    return [find_polygon(fp, yaw_range, flipped, exact)
+            for fp, yaw_ranges in fps_and_yaws for yaw_range in merge_fp_yaw_ranges(yaw_ranges)]
+
+# Incrementally merged coverage of focal points added in batches
+class MergedCoverage:
+    def __init__(self, mode):
+        if mode not in ("union", "intersection"):
+            raise ValueError("Unknown merge mode " + str(mode))
+        if mode == "intersection" and not backends.has_shapely():
+            raise ValueError("Intersecting FP files requires Shapely")
+        self.mode = mode
+        self.fp_count = 0
+        self.wedge_count = 0
+        # Group -> merged geometry (Shapely) or list of polygons (fallback)
+        self._groups = {}
+        self._shapes = None
+
+    # Adds focal points belonging to one group to the coverage
+    def add(self, fps_and_yaws, flipped, exact=False, group=0):
+        self.fp_count += len(fps_and_yaws)
+        self.wedge_count += sum(len(yaw_ranges) for fp, yaw_ranges in fps_and_yaws)
+        polygons = [polygon for polygon in merged_wedge_polygons(fps_and_yaws, flipped, exact)
+                    if polygon_area(polygon) > 0]
+        self._shapes = None
+
+        if not backends.has_shapely():
+            self._groups.setdefault(group, []).extend(polygons)
+            return
+
+        geometry, ops = backends.shapely()
+        merged = ops.unary_union([geometry.Polygon(polygon) for polygon in polygons])
+        if group in self._groups:
+            merged = self._groups[group].union(merged)
+        # Wedges ending at the map bounds leave collinear vertices along them, one or two per wedge
+        self._groups[group] = merged.simplify(0)
+
+    # Returns a coverage that focal points can be added to without changing this one
+    def copy(self):
+        coverage = MergedCoverage(self.mode)
+        coverage.fp_count = self.fp_count
+        coverage.wedge_count = self.wedge_count
+        # Shapely geometries are immutable, so only the fallback's polygon lists are copied
+        coverage._groups = {group: merged if backends.has_shapely() else list(merged)
+                            for group, merged in self._groups.items()}
+        coverage._shapes = self._shapes
+        return coverage
+
+    # Returns the merged region as a list of (exterior, holes) shapes, largest first
+    def shapes(self):
+        if self._shapes is not None:
+            return self._shapes
+        if len(self._groups) == 0:
+            self._shapes = []
+        elif not backends.has_shapely():
+            self._shapes = [(polygon, []) for group in sorted(self._groups) for polygon in self._groups[group]]
+        else:
+            geometries = [self._groups[group] for group in sorted(self._groups)]
+            if self.mode == "union":
+                region = reduce(lambda a, b: a.union(b), geometries)
+            else:
+                region = reduce(lambda a, b: a.intersection(b), geometries)
+            self._shapes = geometry_to_shapes(region.simplify(0))
+        return self._shapes
+
+    # Number of polygons drawn for the merged region, holes included
+    def polygon_count(self):
+        return sum(1 + len(holes) for exterior, holes in self.shapes())
+
+# Helper for computing the area of a polygon given as a list of points
+def polygon_area(points):
+    return abs(sum(x0 * z1 - x1 * z0 for (x0, z0), (x1, z1) in zip(points, points[1:] + points[:1]))) / 2
+
+# Helper for listing the polygons of a Shapely geometry, which may be nested in multi-part geometries
+#
+# Lower dimensional leftovers of an intersection (shared edges or points) cover nothing and are dropped.
+def geometry_polygons(region):
+    if region.is_empty:
+        return []
+    if region.geom_type == "Polygon":
+        return [region]
+    return [polygon for part in getattr(region, "geoms", []) for polygon in geometry_polygons(part)]
+
+# Helper for turning a Shapely geometry into (exterior, holes) point lists, largest first
+def geometry_to_shapes(region):
+    polygons = geometry_polygons(region)
+    polygons.sort(key=lambda polygon: polygon.area, reverse=True)
+    return [(list(polygon.exterior.coords), [list(interior.coords) for interior in polygon.interiors])
+            for polygon in polygons]
+
+# Helper for merging focal points in one go, e.g. for image export
+#
+# group_starts lists the first focal point index of every group after the first
+# and only matters for "intersection". Returns a MergedCoverage.
+def merge_coverage(fps_and_yaws, flipped, mode, group_starts=None, exact=False):
+    coverage = MergedCoverage(mode)
+    for group, (start, end) in enumerate(group_ranges(len(fps_and_yaws), group_starts)):
+        coverage.add(fps_and_yaws[start:end], flipped, exact, group if mode == "intersection" else 0)
+    return coverage
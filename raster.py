@@ -0,0 +1,201 @@
+import backends
+import gameTrig
+
+
+"""
+Raster rendering of the valid camera region.
+
+Instead of drawing one polygon per (focal point, yaw range) pair, the region
+is evaluated directly on a grid of sample points. A sample is covered if the
+yaw between it and some focal point falls within that focal point's yaw 
+ranges, which is exactly the area enclosed by the wedges built by 
+find_polygon. The grid matches mario_to_screen: the map [-8192, 8192] is 
+scaled down by 16 and sampled at pixel centers. Requires NumPy, which is 
+imported on first use.
+"""
+
+# Size of the rendered coverage image in pixels
+SCREEN_SIZE = 1024
+
+# Helper for finding the Mario coordinates of the centers of the screen pixels along one axis
+def screen_sample_coords(size=SCREEN_SIZE):
+    np = backends.numpy()
+    return (np.arange(size, dtype=np.float64) + 0.5) * (16384 / size) - 8192
+
+# Helper for building a 65536 entry table of the yaws accepted by a yaw index
+def yaw_lookup_table(yaw_index):
+    np = backends.numpy()
+    starts = np.frombuffer(yaw_index.starts, dtype=np.uint16).astype(np.int64)
+    ends = np.frombuffer(yaw_index.ends, dtype=np.uint16).astype(np.int64)
+
+    # Merged index ranges are disjoint, so a running sum of +1/-1 markers is 1 exactly inside them
+    markers = np.zeros(65537, dtype=np.int8)
+    markers[starts] += 1
+    markers[ends + 1] -= 1
+    return np.cumsum(markers[:-1], dtype=np.int8).astype(bool)
+
+# Helper for building a 65536 entry table of how many of the (raw, possibly overlapping) yaw ranges accept each yaw
+def yaw_count_table(yaw_ranges):
+    np = backends.numpy()
+    ranges = np.clip(np.array(yaw_ranges, dtype=np.int64).reshape(-1, 2), 0, 65535)
+    markers = np.zeros(65537, dtype=np.int32)
+    np.add.at(markers, ranges[:, 0], 1)
+    np.add.at(markers, ranges[:, 1] + 1, -1)
+    # Wrapping ranges cover [start, 65535] and [0, end]
+    markers[0] += np.count_nonzero(ranges[:, 0] > ranges[:, 1])
+    return np.cumsum(markers[:-1], dtype=np.int32)
+
+# Helper for computing the yaws from one focal point to every point of a sample grid
+def grid_yaws(fp, xs, zs, flipped, exact=False):
+    return sample_yaws(fp, xs[None, :], zs[:, None], flipped, exact)
+
+# Helper for computing the yaws from one focal point to sample points given as broadcastable x and z arrays
+def sample_yaws(fp, xs, zs, flipped, exact=False):
+    np = backends.numpy()
+    if exact:
+        return np.take(gameTrig.octant_angle_table(), sample_table_indices(fp, xs, zs, flipped))
+    dx, dz = sample_deltas(fp, xs, zs, flipped)
+
+    # Casting truncates towards zero like int() in compute_p2p_yaw, and masking wraps like wrap_yaw
+    angles = (np.arctan2(dz, dx) / np.pi * 32768).astype(np.int32)
+    return (16384 - angles) & 0xFFFF
+
+# Helper for computing the offsets between an FP and sample points, in the direction the yaws are measured
+def sample_deltas(fp, xs, zs, flipped):
+    if flipped:
+        return xs - fp[0], zs - fp[1]
+    return fp[0] - xs, fp[1] - zs
+
+# Helper for computing gameTrig.atan2s_table_indices from an FP to sample points
+def sample_table_indices(fp, xs, zs, flipped):
+    np = backends.numpy()
+    # The game works on single precision positions
+    fp = np.array(fp, dtype=np.float32)
+    dx, dz = sample_deltas(fp, xs.astype(np.float32), zs.astype(np.float32), flipped)
+    return gameTrig.atan2s_table_indices(dz, dx)
+
+# Helper for checking which sample points (broadcastable x and z arrays) an FP's yaw ranges accept
+def accepted_samples(fp, yaw_index, xs, zs, flipped, exact=False):
+    return lookup_samples(yaw_lookup_table(yaw_index), fp, xs, zs, flipped, exact)
+
+# Helper for looking up the entries of a 65536 entry yaw table for the yaws from an FP to sample points
+def lookup_samples(table, fp, xs, zs, flipped, exact=False):
+    np = backends.numpy()
+    if exact:
+        # Looking up the 8 * 1025 possible atan2s results up front skips building the yaws themselves
+        return np.take(table[gameTrig.octant_angle_table()], sample_table_indices(fp, xs, zs, flipped))
+    return table[sample_yaws(fp, xs, zs, flipped)]
+
+# Yaws towards a region's corners are computed with the float formula, which can
+# be a few units off from the exact one, so region arcs are widened by this much
+REGION_YAW_MARGIN = 64
+
+# Helper for finding the FPs whose yaw ranges may reach the rectangle [x_min, x_max] x [z_min, z_max]
+#
+# fps is an N x 2 array of FP positions and key_starts/key_ends are their 
+# flattened yaw indices (see yawIndex.flatten_yaw_indices). Seen from an FP
+# outside the rectangle, the rectangle spans the arc between the yaws towards
+# its corners, which is less than half a turn, so only FPs with a yaw range
+# overlapping that arc (or inside the rectangle) are kept. Returns their indices.
+def reaching_fps(fps, key_starts, key_ends, x_min, z_min, x_max, z_max, flipped, margin=REGION_YAW_MARGIN):
+    np = backends.numpy()
+    if len(key_starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    corner_xs = np.array([[x_min, x_min, x_max, x_max]], dtype=np.float64)
+    corner_zs = np.array([[z_min, z_max, z_min, z_max]], dtype=np.float64)
+    yaws = sample_yaws((fps[:, 0, None], fps[:, 1, None]), corner_xs, corner_zs, flipped).astype(np.int64)
+
+    # Signed offsets from the first corner's yaw bound the arc
+    offsets = (yaws - yaws[:, :1] + 32768) % 65536 - 32768
+    low = offsets.min(axis=1) - margin
+    high = offsets.max(axis=1) + margin
+    inside = (x_min <= fps[:, 0]) & (fps[:, 0] <= x_max) & (z_min <= fps[:, 1]) & (fps[:, 1] <= z_max)
+    everything = inside | (high - low >= 65535)
+
+    starts = np.where(everything, 0, (yaws[:, 0] + low) % 65536)
+    ends = np.where(everything, 65535, (yaws[:, 0] + high) % 65536)
+    wraps = starts > ends
+
+    # Wrapping arcs are checked as [start, 65535] and [0, end]
+    key_offsets = np.arange(len(fps), dtype=np.int64) * 65536
+    reach = _keys_overlap(key_starts, key_ends, key_offsets + starts, key_offsets + np.where(wraps, 65535, ends))
+    reach |= wraps & _keys_overlap(key_starts, key_ends, key_offsets, key_offsets + ends)
+    return np.flatnonzero(reach)
+
+# Helper for checking which key intervals [first_keys, last_keys] overlap a flattened yaw range
+def _keys_overlap(key_starts, key_ends, first_keys, last_keys):
+    np = backends.numpy()
+    # Only the last range starting at or before an interval's end can reach into it.
+    # Ranges of earlier focal points always end before this focal point's keys begin.
+    range_ids = np.searchsorted(key_starts, last_keys, side="right") - 1
+    return (range_ids >= 0) & (key_ends[np.maximum(range_ids, 0)] >= first_keys)
+
+# Once fewer than this fraction of the samples is left uncovered, only those samples are checked against later FPs
+UNCOVERED_COMPACTION_FRACTION = 0.25
+
+# Helper for computing which points of a sample grid are valid camera positions
+#
+# Returns a boolean array indexed by [z, x]. With many FPs most of the grid is
+# covered early on, so later FPs are only checked against the samples that are
+# still uncovered, and the loop stops as soon as everything is covered.
+def coverage_mask(fps_and_yaws, yaw_indices, flipped, xs=None, zs=None, exact=False):
+    np = backends.numpy()
+    xs = screen_sample_coords() if xs is None else xs
+    zs = screen_sample_coords() if zs is None else zs
+
+    mask = np.zeros((len(zs), len(xs)), dtype=bool)
+    uncovered = None
+    for (fp, yaw_ranges), yaw_index in zip(fps_and_yaws, yaw_indices):
+        if len(yaw_index) == 0:
+            continue
+
+        if uncovered is None:
+            mask |= accepted_samples(fp, yaw_index, xs[None, :], zs[:, None], flipped, exact)
+            if np.count_nonzero(mask) >= (1 - UNCOVERED_COMPACTION_FRACTION) * mask.size:
+                uncovered = np.flatnonzero(~mask)
+                uncovered_xs = xs[uncovered % len(xs)]
+                uncovered_zs = zs[uncovered // len(xs)]
+        else:
+            accepted = accepted_samples(fp, yaw_index, uncovered_xs, uncovered_zs, flipped, exact)
+            mask.ravel()[uncovered[accepted]] = True
+            kept = ~accepted
+            uncovered = uncovered[kept]
+            uncovered_xs = uncovered_xs[kept]
+            uncovered_zs = uncovered_zs[kept]
+
+        if uncovered is not None and len(uncovered) == 0:
+            break
+    return mask
+
+# Helper for counting how many FPs (or, with count_ranges, yaw ranges) accept each point of a sample grid
+#
+# Returns a uint32 array indexed by [z, x]. Each FP's ranges are folded into 
+# a single yaw table first, so the grid is visited once per FP no matter how
+# many ranges it has.
+def coverage_counts(fps_and_yaws, yaw_indices, flipped, xs=None, zs=None, exact=False, count_ranges=False):
+    np = backends.numpy()
+    xs = screen_sample_coords() if xs is None else xs
+    zs = screen_sample_coords() if zs is None else zs
+
+    counts = np.zeros((len(zs), len(xs)), dtype=np.uint32)
+    for (fp, yaw_ranges), yaw_index in zip(fps_and_yaws, yaw_indices):
+        if len(yaw_index) == 0:
+            continue
+        table = yaw_count_table(yaw_ranges).astype(np.uint32) if count_ranges else yaw_lookup_table(yaw_index)
+        counts += lookup_samples(table, fp, xs[None, :], zs[:, None], flipped, exact)
+    return counts
+
+# Helper for converting a '#RRGGBB' color string into an (R, G, B) tuple
+def hex_to_rgb(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+# Helper for turning a coverage mask into binary PPM data that tk.PhotoImage can load directly
+def mask_to_ppm(mask, valid_color, background_color):
+    np = backends.numpy()
+    pixels = np.empty(mask.shape + (3,), dtype=np.uint8)
+    pixels[:] = hex_to_rgb(background_color)
+    pixels[mask] = hex_to_rgb(valid_color)
+
+    header = "P6 {} {} 255\n".format(mask.shape[1], mask.shape[0]).encode("ascii")
+    return header + pixels.tobytes()
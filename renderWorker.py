@@ -0,0 +1,74 @@
+import threading
+
+
+"""
+Background thread for the compute phase of full redraws.
+
+Computing the geometry of a full redraw can take a long time, while only the
+canvas updates themselves have to happen on the Tk thread. A RenderWorker
+runs one computation at a time on a daemon thread. Submitting a new
+computation replaces any queued one and makes the one in progress stale:
+stale computations are told to stop through the 'cancelled' callable they
+are given, and their results are dropped, so only the newest result is ever
+handed back. The worker never touches Tk; results are picked up by polling
+take_result from the Tk thread.
+"""
+
+class RenderWorker:
+    def __init__(self):
+        self.generation = 0
+        self._condition = threading.Condition()
+        self._job = None
+        self._result = None
+        self._running = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Queues compute(*args, cancelled=...) to replace any queued or running computation; returns its generation
+    def submit(self, compute, *args):
+        with self._condition:
+            self.generation += 1
+            self._job = (self.generation, compute, args)
+            self._result = None
+            self._condition.notify()
+            return self.generation
+
+    # Makes the queued and running computations stale without starting a new one
+    def cancel(self):
+        with self._condition:
+            self.generation += 1
+            self._job = None
+            self._result = None
+
+    # Returns whether a computation is queued or running
+    def busy(self):
+        with self._condition:
+            return self._job is not None or self._running
+
+    # Returns (generation, result or exception) of the newest computation once it is done, or None
+    def take_result(self):
+        with self._condition:
+            result, self._result = self._result, None
+            return result
+
+    def _is_stale(self, generation):
+        return generation != self.generation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None:
+                    self._condition.wait()
+                generation, compute, args = self._job
+                self._job = None
+                self._running = True
+
+            try:
+                result = compute(*args, cancelled=lambda: self._is_stale(generation))
+            except Exception as e:
+                result = e
+
+            with self._condition:
+                self._running = False
+                if not self._is_stale(generation):
+                    self._result = (generation, result)
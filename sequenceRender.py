@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import glob
+import math
+import hashlib
+import argparse
+import multiprocessing
+import defaults
+import fileLoader
+import stripExport
+import batchRender
+import backends
+from geometry import find_polygon
+
+
+"""
+Renders a sequence of FP/yaw files (one per frame, e.g. from a TAS) to
+numbered PNG frames and an animated GIF.
+
+Every frame is rendered with the same geometry and colors as 'Save PNG'. The
+frames are spread across a pool of worker processes in runs of consecutive
+frames, and each worker keeps the wedge polygons of the last frame it
+rendered: focal points and yaw ranges that did not change between frames are
+not computed again.
+
+Frames are written as frame_00000.png, frame_00001.png, ... (ready for e.g.
+'ffmpeg -framerate 10 -i frames/frame_%05d.png sequence.mp4'), and a manifest
+records which input file and settings each frame was rendered from. Running
+the same command again after an interruption only renders the frames that
+are missing or whose input or settings changed.
+
+Usage:
+
+python sequenceRender.py "frames/*.txt" --output-dir renders --jobs 8 --gif sequence.gif
+"""
+
+MANIFEST_FILENAME = "sequence.json"
+
+# Frames of the GIF are scaled down to at most this many pixels along each side
+MAX_GIF_SIZE = 1024
+
+# Number of runs of consecutive frames handed to each worker; more runs balance
+# the load better, fewer reuse more wedges
+RUNS_PER_JOB = 4
+
+# Wedge polygons of the frame this worker process rendered last, by (fp, yaw range)
+_wedge_cache = {}
+
+# Helper for finding the numbered filename of a frame
+def frame_filename(output_dir, index):
+    return os.path.join(output_dir, "frame_{:05d}.png".format(index))
+
+# Helper for finding the wedge polygons of a frame, reusing the ones of the worker's previous frame
+#
+# Returns the (exterior, holes) shapes and how many of them were reused.
+def frame_shapes(fps_and_yaws, flipped, exact):
+    global _wedge_cache
+    wedges = {}
+    shapes = []
+    reused = 0
+    for fp, yaw_ranges in fps_and_yaws:
+        for yaw_range in yaw_ranges:
+            key = (tuple(fp), tuple(yaw_range))
+            polygon = wedges.get(key, _wedge_cache.get(key))
+            if polygon is None:
+                polygon = find_polygon(fp, yaw_range, flipped, exact)
+            else:
+                reused += 1
+            wedges[key] = polygon
+            shapes.append((polygon, []))
+    _wedge_cache = wedges
+    return shapes, reused
+
+# Renders one frame; runs in a worker process
+#
+# The frame is written under a temporary name first, so an interrupted run
+# never leaves a partial frame behind that looks complete.
+# Returns (index, input filename, output filename, error message or None, wedges reused, wedges).
+def render_frame(job):
+    index, filename, output, points, flipped, exact, size, display_settings = job
+    try:
+        errors = []
+        fps_and_yaws = fileLoader.read_file(filename, errors)
+        for line_counter, message in errors:
+            print("INVALID FORMAT (" + filename + "):", message)
+
+        shapes, reused = frame_shapes(fps_and_yaws, flipped, exact)
+        scene = stripExport.build_scene(size, fps_and_yaws, points, flipped, display_settings, exact=exact,
+                                        shapes=shapes)
+        stripExport.export_png(output + ".part", scene)
+        os.replace(output + ".part", output)
+        return index, filename, output, None, reused, len(shapes)
+    except Exception as e:
+        return index, filename, output, str(e), 0, 0
+
+# Helper for describing the settings frames are rendered with, to tell whether existing frames can be kept
+def render_settings(points, flipped, exact, size, display_settings):
+    points_hash = hashlib.sha1(json.dumps(points).encode("utf-8")).hexdigest()
+    return {"points": points_hash, "flipped": flipped, "exact": exact, "size": size,
+            "display_settings": display_settings}
+
+# Helper for describing an input file, so a frame is rendered again if its file changes
+def input_description(filename):
+    stat = os.stat(filename)
+    return {"input": os.path.abspath(filename), "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+# Helper for finding which frames of an earlier run can be kept
+#
+# Frames whose input or settings changed are deleted, so that the manifest
+# written for this run only describes frames that match it. Partial frames
+# left behind by an interrupted run are deleted as well.
+def reusable_frames(output_dir, settings, inputs):
+    for part in glob.glob(os.path.join(glob.escape(output_dir), "frame_*.png.part")):
+        os.remove(part)
+
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+    old_inputs = manifest.get("frames", []) if manifest.get("settings") == settings else []
+
+    reusable = set()
+    for index in range(max(len(inputs), len(old_inputs))):
+        output = frame_filename(output_dir, index)
+        if not os.path.exists(output):
+            continue
+        if index < len(inputs) and index < len(old_inputs) and inputs[index] == old_inputs[index]:
+            reusable.add(index)
+        else:
+            os.remove(output)
+    return reusable
+
+# Helper for combining the frames into an animated GIF that loops forever
+def write_gif(filename, frame_filenames, frame_duration):
+    Image, ImageDraw = backends.pil()
+
+    # Frames are converted one at a time, so they never all have to be in memory
+    def gif_frames():
+        for frame in frame_filenames[1:]:
+            yield gif_frame(Image.open(frame))
+
+    def gif_frame(image):
+        image = image.convert("RGB")
+        image.thumbnail((MAX_GIF_SIZE, MAX_GIF_SIZE))
+        return image.quantize()
+
+    first = gif_frame(Image.open(frame_filenames[0]))
+    first.save(filename, save_all=True, append_images=gif_frames(), duration=frame_duration, loop=0)
+
+# Renders every missing frame of a sequence across a process pool and writes the GIF
+#
+# Each worker gets runs of consecutive frames, so it can reuse the wedges of
+# the frame it rendered before. 'gif' is the GIF's filename, or None for no
+# GIF; it is only written once every frame exists. Returns the number of
+# frames that failed to render.
+def render_sequence(filenames, output_dir, points=None, flipped=True, display_settings=None, jobs=None,
+                    exact=False, size=1024, gif=None, frame_duration=100):
+    points = [] if points is None else points
+    display_settings = defaults.DISPLAY_SETTINGS if display_settings is None else display_settings
+    os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        inputs = [input_description(filename) for filename in filenames]
+    except OSError as e:
+        print("ERROR: Could not read", e.filename + ":", e.strerror)
+        return len(filenames)
+    settings = render_settings(points, flipped, exact, size, display_settings)
+    done = reusable_frames(output_dir, settings, inputs)
+    # The manifest is written before rendering, as a frame only exists once it is complete
+    with open(os.path.join(output_dir, MANIFEST_FILENAME), "w") as file:
+        json.dump({"settings": settings, "frames": inputs}, file, indent=1)
+
+    render_jobs = [(index, filename, frame_filename(output_dir, index), points, flipped, exact, size, display_settings)
+                   for index, filename in enumerate(filenames) if index not in done]
+    if len(done) > 0:
+        print("Keeping", len(done), "frame(s) rendered before.")
+
+    failures = 0
+    reused_wedges = 0
+    total_wedges = 0
+    if len(render_jobs) > 0:
+        processes = jobs if jobs is not None else os.cpu_count() or 1
+        chunksize = max(1, math.ceil(len(render_jobs) / (processes * RUNS_PER_JOB)))
+        with multiprocessing.Pool(processes=processes) as pool:
+            for index, filename, output, error, reused, wedges in pool.imap_unordered(render_frame, render_jobs,
+                                                                                      chunksize):
+                if error is None:
+                    reused_wedges += reused
+                    total_wedges += wedges
+                    print("Rendered frame", index, "(" + filename + ") ->", output)
+                else:
+                    failures += 1
+                    print("FAILED: frame", index, "(" + filename + "):", error)
+        print("Reused", reused_wedges, "of", total_wedges, "wedge(s) from the previous frame.")
+
+    if gif is not None and len(filenames) > 0:
+        if failures > 0:
+            print("WARNING: Not writing", gif, "as some frames failed to render.")
+        else:
+            write_gif(gif, [frame_filename(output_dir, index) for index in range(len(filenames))], frame_duration)
+            print("Wrote", gif)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a sequence of FP/yaw files to numbered PNG frames and an "
+                                                 "animated GIF.")
+    parser.add_argument("files", nargs="+", help="FP/yaw files (text or binary) or glob patterns, one per frame, "
+                                                 "in order; glob matches are sorted by name")
+    parser.add_argument("--test-points", action="append", default=[],
+                        help="file with one 'x,z' test point per line; may be given more than once")
+    parser.add_argument("--output-dir", default="frames", help="directory for the frames (default: frames)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--no-flip", action="store_true", help="render with 'Flip Yaws' turned off")
+    parser.add_argument("--exact", action="store_true", help="compute yaws with the game's table-based arctangent")
+    parser.add_argument("--size", type=int, default=1024,
+                        help="width and height of the frames in pixels, up to " + str(stripExport.MAX_EXPORT_SIZE)
+                             + " (default: 1024)")
+    parser.add_argument("--gif", help="filename of the animated GIF (default: sequence.gif in the output directory)")
+    parser.add_argument("--no-gif", action="store_true", help="only write the frames")
+    parser.add_argument("--frame-duration", type=int, default=100, help="milliseconds per GIF frame (default: 100)")
+    args = parser.parse_args(argv)
+
+    if not backends.has_pil():
+        print("ERROR: Pillow is required to render PNG images.")
+        return 1
+    if not 1 <= args.size <= stripExport.MAX_EXPORT_SIZE:
+        print("ERROR: The image size must be between 1 and " + str(stripExport.MAX_EXPORT_SIZE) + " pixels.")
+        return 1
+
+    points = []
+    for test_point_file in args.test_points:
+        points.extend(fileLoader.read_test_points(test_point_file))
+
+    gif = None
+    if not args.no_gif:
+        gif = args.gif if args.gif is not None else os.path.join(args.output_dir, "sequence.gif")
+
+    filenames = batchRender.expand_input_files(args.files)
+    failures = render_sequence(filenames, args.output_dir, points, flipped=defaults.FLIPPED and not args.no_flip,
+                               display_settings=defaults.DISPLAY_SETTINGS, jobs=args.jobs, exact=args.exact,
+                               size=args.size, gif=gif, frame_duration=args.frame_duration)
+    print("Rendered", len(filenames) - failures, "of", len(filenames), "frame(s).")
+    return 1 if failures > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+import os
+import zlib
+import struct
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import nullcontext
+from geometry import find_polygon
+from classifier import classify_points
+from viewport import MAP_MIN, MAP_SIZE
+from yawIndex import build_yaw_indices, flatten_yaw_indices
+from fpStore import fp_array
+import polygonMerge
+import raster
+import heatmap
+import backends
+
+
+"""
+Large PNG export, rendered and written in horizontal strips.
+
+An export of the whole map at up to MAX_EXPORT_SIZE x MAX_EXPORT_SIZE pixels
+(one pixel per unit at the native 16384) does not fit in memory as a single
+image, so it is rendered STRIP_HEIGHT rows at a time and every strip is
+compressed into the PNG file as soon as it is done. Memory use only depends
+on the width of the image.
+
+The geometry is prepared once in an ExportScene: the wedge polygons (or
+merged shapes) are converted to pixel coordinates and sorted into the strips
+they touch, so each strip only draws what reaches it. Polygons the viewer
+already computed can be passed in instead of computing them again. In raster
+and heatmap mode the coverage of each strip is computed with NumPy instead,
+only from the focal points whose yaw ranges can reach the strip.
+
+Strips can be rendered in worker processes; they are still written in
+order, and only a few strips per worker are in flight at a time.
+"""
+
+# Largest supported export size (pixels along each side)
+MAX_EXPORT_SIZE = MAP_SIZE
+
+# Number of image rows rendered at a time
+STRIP_HEIGHT = 256
+
+# Number of strips waiting to be written per worker process
+STRIPS_IN_FLIGHT_PER_JOB = 2
+
+# Compressed data is written in PNG chunks of about this many bytes
+IDAT_CHUNK_SIZE = 1 << 20
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Writes an 8 bit RGB PNG row by row without holding the whole image
+class PngStripWriter:
+    def __init__(self, filename, width, height, compression_level=6):
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._file = open(filename, "wb")
+        self._compressor = zlib.compressobj(compression_level)
+        self._pending = []
+        self._pending_size = 0
+
+        self._file.write(PNG_SIGNATURE)
+        # Bit depth 8, color type 2 (RGB), default compression/filter, no interlacing
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Appends rows given as raw RGB bytes (3 bytes per pixel, whole rows only)
+    def write_rows(self, rgb):
+        stride = 3 * self.width
+        row_count = len(rgb) // stride
+        if row_count * stride != len(rgb) or self.rows_written + row_count > self.height:
+            raise ValueError("Rows do not fit the image size")
+
+        # Every row starts with its filter type; 0 leaves the bytes unfiltered
+        rows = b"".join(b"\x00" + rgb[i:i + stride] for i in range(0, len(rgb), stride))
+        self._add_compressed(self._compressor.compress(rows))
+        self.rows_written += row_count
+
+    # Finishes the file; rows that were never written are left out, which makes the PNG invalid
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written == self.height:
+                self._add_compressed(self._compressor.flush())
+                self._flush_pending()
+                self._write_chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+    def _add_compressed(self, data):
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= IDAT_CHUNK_SIZE:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if self._pending_size > 0:
+            self._write_chunk(b"IDAT", b"".join(self._pending))
+        self._pending = []
+        self._pending_size = 0
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+# Everything needed to render any strip of an export; picklable so it can be sent to worker processes
+#
+# 'coverage' is "polygons" (shapes, sorted into strips), "mask" (raster
+# coverage) or "counts" (heatmap with colors scaled to max_count).
+class ExportScene:
+    def __init__(self, size, coverage, display_settings, strip_height=STRIP_HEIGHT):
+        self.size = size
+        self.coverage = coverage
+        self.display_settings = display_settings
+        self.strip_height = strip_height
+        self.strip_count = -(-size // strip_height)
+
+        self.shapes = []
+        self.strip_shapes = [[] for i in range(self.strip_count)]
+
+        self.fps_and_yaws = []
+        self.yaw_indices = []
+        # Focal point positions and flattened yaw indices, used to skip the focal points that cannot reach a strip
+        self.fp_positions = None
+        self.key_starts = None
+        self.key_ends = None
+        self.flipped = True
+        self.exact = False
+        self.count_ranges = False
+        self.max_count = None
+
+        # (pixel x, pixel y, valid) per test point, and the test points reaching each strip
+        self.points = []
+        self.strip_points = [[] for i in range(self.strip_count)]
+
+    # Helper for converting Mario coordinates to pixel coordinates of the export
+    def to_pixels(self, pts):
+        scale = self.size / MAP_SIZE
+        return [((x - MAP_MIN) * scale, (z - MAP_MIN) * scale) for x, z in pts]
+
+    # Helper for listing item in every strip between the pixel rows y_min and y_max
+    def _add_to_strips(self, strips, item, y_min, y_max):
+        first = max(int(y_min) // self.strip_height, 0)
+        last = min(int(y_max) // self.strip_height, self.strip_count - 1)
+        for strip in range(first, last + 1):
+            strips[strip].append(item)
+
+    # Adds (exterior, holes) shapes given in Mario coordinates
+    def add_shapes(self, shapes):
+        for exterior, holes in shapes:
+            shape = (self.to_pixels(exterior), [self.to_pixels(hole) for hole in holes])
+            ys = [y for x, y in shape[0]]
+            # Outlines may round onto the neighboring rows
+            self._add_to_strips(self.strip_shapes, len(self.shapes), min(ys) - 1, max(ys) + 1)
+            self.shapes.append(shape)
+
+    # Adds test points given in Mario coordinates with whether they are valid
+    def add_points(self, points, valid):
+        radius = self.display_settings["test_point_diameter"] / 2
+        for x, y in self.to_pixels(points):
+            self._add_to_strips(self.strip_points, len(self.points), y - radius, y + radius + 1)
+            self.points.append((x, y, valid))
+
+# Builds the ExportScene for a size x size pixel image of the valid camera region and test points
+#
+# The options match pngExport.render_image; with raster_coverage the region
+# is computed per pixel like the viewer's raster mode (needs NumPy). 'shapes'
+# are (exterior, holes) polygons in Mario coordinates that were already
+# computed for these focal points (e.g. the ones the viewer drew); they are
+# computed here if not given.
+def build_scene(size, fps_and_yaws, points, flipped, display_settings, yaw_indices=None, exact=False,
+                merge_mode="none", group_starts=None, heatmap_count=None, raster_coverage=False, shapes=None,
+                strip_height=STRIP_HEIGHT):
+    if not 1 <= size <= MAX_EXPORT_SIZE:
+        raise ValueError("Export size must be between 1 and " + str(MAX_EXPORT_SIZE) + " pixels")
+    if yaw_indices is None:
+        yaw_indices = build_yaw_indices(fps_and_yaws)
+
+    if heatmap_count is not None:
+        scene = ExportScene(size, "counts", display_settings, strip_height)
+        scene.count_ranges = heatmap_count == "ranges"
+        # Colors are scaled to the largest count of a screen sized preview, as the full counts are never in memory at once
+        preview_size = min(size, raster.SCREEN_SIZE)
+        scene.max_count = int(raster.coverage_counts(fps_and_yaws, yaw_indices, flipped,
+                                                     raster.screen_sample_coords(preview_size),
+                                                     raster.screen_sample_coords(preview_size), exact,
+                                                     scene.count_ranges).max(initial=0))
+    elif raster_coverage:
+        scene = ExportScene(size, "mask", display_settings, strip_height)
+    else:
+        scene = ExportScene(size, "polygons", display_settings, strip_height)
+        if shapes is None:
+            shapes = coverage_shapes(fps_and_yaws, flipped, exact, merge_mode, group_starts)
+        scene.add_shapes(shapes)
+
+    if scene.coverage != "polygons":
+        # Copied, so strips rendered later are not affected by focal points loaded meanwhile
+        # (e.g. by watch mode) and the scene does not pin the buffers of an FPStore
+        scene.fps_and_yaws = fps_and_yaws.copy()
+        scene.yaw_indices = yaw_indices.copy()
+        scene.fp_positions = fp_array(fps_and_yaws).copy()
+        scene.key_starts, scene.key_ends = flatten_yaw_indices(yaw_indices)
+        scene.flipped = flipped
+        scene.exact = exact
+
+    true_points, false_points = classify_points(fps_and_yaws, points, flipped, yaw_indices, exact,
+                                                group_starts if merge_mode == "intersection" else None)
+    scene.add_points(true_points, True)
+    scene.add_points(false_points, False)
+    return scene
+
+# Helper for computing the (exterior, holes) shapes that pngExport.draw_polygons draws
+def coverage_shapes(fps_and_yaws, flipped, exact=False, merge_mode="none", group_starts=None):
+    if merge_mode == "none":
+        return [(find_polygon(fp, yaw_range, flipped, exact), [])
+                for fp, yaw_ranges in fps_and_yaws for yaw_range in yaw_ranges]
+    return polygonMerge.merge_coverage(fps_and_yaws, flipped, merge_mode, group_starts, exact).shapes()
+
+# Renders one strip of a scene; returns its rows as raw RGB bytes
+def render_strip(scene, strip):
+    Image, ImageDraw = backends.pil()
+    settings = scene.display_settings
+    first_row = strip * scene.strip_height
+    row_count = min(scene.strip_height, scene.size - first_row)
+
+    if scene.coverage == "polygons":
+        image = Image.new("RGB", (scene.size, row_count), settings["background_color"])
+        draw = ImageDraw.Draw(image)
+        for shape_index in scene.strip_shapes[strip]:
+            exterior, holes = scene.shapes[shape_index]
+            draw.polygon([(x, y - first_row) for x, y in exterior],
+                         outline=settings["valid_position_color"], fill=settings["valid_position_color"])
+            for hole in holes:
+                draw.polygon([(x, y - first_row) for x, y in hole],
+                             outline=settings["valid_position_color"], fill=settings["background_color"])
+    else:
+        xs = raster.screen_sample_coords(scene.size)
+        zs = xs[first_row:first_row + row_count]
+        # Like coverage tiles, each strip is only computed from the focal points whose yaw ranges can reach it
+        fp_indices = raster.reaching_fps(scene.fp_positions, scene.key_starts, scene.key_ends,
+                                         xs[0], zs[0], xs[-1], zs[-1], scene.flipped).tolist()
+        fps_and_yaws = [scene.fps_and_yaws[i] for i in fp_indices]
+        yaw_indices = [scene.yaw_indices[i] for i in fp_indices]
+        if scene.coverage == "counts":
+            counts = raster.coverage_counts(fps_and_yaws, yaw_indices, scene.flipped, xs, zs,
+                                            scene.exact, scene.count_ranges)
+            pixels = heatmap.counts_to_rgb(counts, settings["heatmap_colormap"], settings["heatmap_threshold"],
+                                           settings["background_color"], scene.max_count)
+        else:
+            mask = raster.coverage_mask(fps_and_yaws, yaw_indices, scene.flipped, xs, zs, scene.exact)
+            np = backends.numpy()
+            pixels = np.empty(mask.shape + (3,), dtype=np.uint8)
+            pixels[:] = raster.hex_to_rgb(settings["background_color"])
+            pixels[mask] = raster.hex_to_rgb(settings["valid_position_color"])
+        image = Image.fromarray(pixels, "RGB")
+        draw = ImageDraw.Draw(image)
+
+    # Test points are drawn after the coverage, valid ones first like pngExport.render_image
+    radius = settings["test_point_diameter"] / 2
+    for valid in (True, False):
+        color = settings["test_point_success_color"] if valid else settings["test_point_failure_color"]
+        for point_index in scene.strip_points[strip]:
+            x, y, point_valid = scene.points[point_index]
+            if point_valid == valid:
+                draw.ellipse([int(x - radius), int(y - radius) - first_row,
+                              int(x + radius), int(y + radius) - first_row], outline=color, fill=color)
+
+    return image.tobytes()
+
+# Scene of the current export in a worker process
+_worker_scene = None
+
+def _init_worker(scene):
+    global _worker_scene
+    _worker_scene = scene
+
+def _render_worker_strip(strip):
+    return render_strip(_worker_scene, strip)
+
+# Renders a scene and writes it to a PNG file, strip by strip
+#
+# With jobs > 1 the strips are rendered in that many worker processes.
+# 'progress' (called with the fraction done) and 'cancelled' (checked between
+# strips) may be None; a cancelled export removes the partial file. Returns
+# whether the export was completed.
+def export_png(filename, scene, jobs=1, progress=None, cancelled=None):
+    completed = False
+    try:
+        with PngStripWriter(filename, scene.size, scene.size) as writer:
+            if jobs <= 1:
+                strips = (render_strip(scene, strip) for strip in range(scene.strip_count))
+                completed = _write_strips(writer, scene, strips, progress, cancelled)
+            else:
+                # Workers are started fresh so they do not inherit the viewer's threads and window
+                context = multiprocessing.get_context("spawn")
+                with context.Pool(jobs, initializer=_init_worker, initargs=(scene,)) as pool:
+                    completed = _write_strips(writer, scene, _pooled_strips(pool, scene, jobs), progress, cancelled)
+    finally:
+        if not completed and os.path.exists(filename):
+            os.remove(filename)
+    return completed
+
+# Generator yielding the rendered strips of a scene in order while keeping a bounded number in flight
+def _pooled_strips(pool, scene, jobs):
+    in_flight = deque()
+    next_strip = 0
+    while next_strip < scene.strip_count or len(in_flight) > 0:
+        while next_strip < scene.strip_count and len(in_flight) < jobs * STRIPS_IN_FLIGHT_PER_JOB:
+            in_flight.append(pool.apply_async(_render_worker_strip, (next_strip,)))
+            next_strip += 1
+        yield in_flight.popleft().get()
+
+# Helper for writing rendered strips; returns False if cancelled before the last one
+def _write_strips(writer, scene, strips, progress, cancelled):
+    for strip, rgb in enumerate(strips):
+        if cancelled is not None and cancelled():
+            return False
+        writer.write_rows(rgb)
+        if progress is not None:
+            progress((strip + 1) / scene.strip_count)
+    return True
+
+# Builds a scene and exports it on a worker thread; mirrors fileLoader.BackgroundFileLoader
+#
+# 'scene_inputs' are the keyword arguments of build_scene; they must not be
+# changed while the export runs (pass copies of the viewer's state). Building
+# the scene is timed as the "geometry" phase of 'frame', if given, and the
+# scene is kept in 'scene' once built.
+class BackgroundPngExporter:
+    def __init__(self, filename, scene_inputs, jobs=1, frame=None):
+        self.filename = filename
+        self.scene_inputs = scene_inputs
+        self.scene = None
+        self.jobs = jobs
+        self.frame = frame
+        self.error = None
+        self.completed = False
+        self.fraction_done = 0.0
+
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def finished(self):
+        return self._finished.is_set()
+
+    def progress(self):
+        return self.fraction_done
+
+    def _run(self):
+        try:
+            with self.frame.phase("geometry") if self.frame is not None else nullcontext():
+                self.scene = build_scene(**self.scene_inputs)
+            if self.cancelled():
+                return
+            self.completed = export_png(self.filename, self.scene, self.jobs, self._set_progress, self.cancelled)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self._finished.set()
+
+    def _set_progress(self, fraction):
+        self.fraction_done = fraction
@@ -0,0 +1,289 @@
+import os
+import sys
+import math
+import random
+import struct
+import argparse
+import threading
+from array import array
+import defaults
+import fileLoader
+import binaryFormat
+from yawIndex import build_yaw_indices
+from classifier import find_first_accepting_fps, find_first_accepting_fps_in_all_groups
+
+
+"""
+Bulk test point files and streaming classification.
+
+Test points can be read from text/CSV files with one 'x,z' pair per line (an
+optional header line is skipped) or from compact binary files (.vhtp):
+
+ - Header (32 bytes): magic b"VHTP", uint16 version, uint16 reserved,
+   uint64 point count N, 16 reserved bytes
+ - float64[2 * N]: test points as x0, z0, x1, z1, ... (little-endian)
+
+Large files are classified in chunks of CHUNK_SIZE points, and the results
+are written out as CSV lines 'x,z,valid,first_fp' (first_fp is -1 for
+invalid points) as soon as each chunk is done, so memory use does not grow
+with the number of points. Only a bounded random sample of the points is
+kept for drawing.
+
+Usage:
+
+python testPoints.py classify fps.txt points.csv results.csv
+python testPoints.py convert points.csv points.vhtp
+"""
+
+MAGIC = b"VHTP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ16x")
+FILE_EXTENSION = ".vhtp"
+
+# Number of test points classified at a time
+CHUNK_SIZE = 65536
+
+RESULT_HEADER = "x,z,valid,first_fp\n"
+
+# Helper for checking whether a file starts with the binary test point format's magic bytes
+def is_binary_test_point_file(filename):
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+# Helper for writing test points, given as an iterable of point lists, to a binary file
+def write_binary_test_points(filename, point_batches):
+    count = 0
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for points in point_batches:
+            values = array('d', [value for point in points for value in point])
+            if sys.byteorder != "little":
+                values.byteswap()
+            values.tofile(file)
+            count += len(points)
+
+        # The count is only known once everything is written
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, 0, count))
+    return count
+
+# Read-only, memory-mapped view of a binary test point file; values holds x0, z0, x1, z1, ...
+class BinaryTestPointFile(binaryFormat.MappedBinaryFile):
+    def __init__(self, filename):
+        super().__init__(filename, HEADER, MAGIC, VERSION, "binary test point file", 
+                         lambda count: HEADER.size + 16 * count)
+        self.count, = self.header_fields
+        self.values = self.section(HEADER.size, self.size, 'd')
+
+    def __len__(self):
+        return self.count
+
+    # Generator yielding lists of (x, z) test points
+    def iter_batches(self, batch_size=CHUNK_SIZE):
+        for first in range(0, self.count, batch_size):
+            values = self.values[2 * first:2 * min(first + batch_size, self.count)].tolist()
+            yield list(zip(values[0::2], values[1::2]))
+
+# Generator yielding (points, fraction of the file read) batches of test points from a text or binary file
+#
+# Errors for malformed lines are appended to 'errors' as (line_number, message).
+def iter_test_point_batches(filename, errors, batch_size=CHUNK_SIZE):
+    if is_binary_test_point_file(filename):
+        with BinaryTestPointFile(filename) as binary_file:
+            read = 0
+            for points in binary_file.iter_batches(batch_size):
+                read += len(points)
+                yield points, read / max(len(binary_file), 1)
+        return
+
+    total_bytes = max(os.path.getsize(filename), 1)
+    with open(filename, "rb") as file:
+        for points, bytes_read in fileLoader.iter_test_point_batches(file, errors, batch_size):
+            yield points, bytes_read / total_bytes
+
+# Helper for finding the first accepting focal point of each point, requiring every group if group_starts is given
+def classify_batch(fps_and_yaws, points, flipped, yaw_indices, exact=False, group_starts=None):
+    if group_starts is None:
+        return find_first_accepting_fps(fps_and_yaws, points, flipped, yaw_indices, exact)
+    return find_first_accepting_fps_in_all_groups(fps_and_yaws, points, flipped, group_starts, yaw_indices, exact)
+
+# Helper for writing classified test points as 'x,z,valid,first_fp' lines
+def write_results(file, points, first_fps):
+    file.write("".join("{!r},{!r},{},{}\n".format(x, z, 1 if first_fp >= 0 else 0, first_fp)
+                       for (x, z), first_fp in zip(points, first_fps)))
+
+# Helper for writing a whole list of classified test points to a results file
+def write_results_file(filename, points, first_fps):
+    with open(filename, "w") as file:
+        file.write(RESULT_HEADER)
+        write_results(file, points, first_fps)
+
+# Fixed size uniform random sample of a stream of classified test points (reservoir sampling)
+#
+# Skips ahead to the next replaced point instead of drawing a random number
+# per point (Li's algorithm L), so adding large batches stays cheap.
+class PointSample:
+    def __init__(self, capacity, seed=0):
+        self.capacity = capacity
+        self.points = []
+        self.first_fps = []
+        self.seen = 0
+        self._random = random.Random(seed)
+        self._weight = 1.0
+        self._next = 0
+
+    def add(self, points, first_fps):
+        start = self.seen
+        self.seen += len(points)
+        if self.capacity <= 0:
+            return
+
+        # Fill the reservoir first
+        fill = min(self.capacity - len(self.points), len(points))
+        if fill > 0:
+            self.points.extend(points[:fill])
+            self.first_fps.extend(first_fps[:fill])
+            if len(self.points) == self.capacity:
+                self._weight = math.exp(math.log(self._uniform()) / self.capacity)
+                self._next = self.capacity + self._skip()
+
+        if len(self.points) < self.capacity:
+            return
+        while self._next < self.seen:
+            slot = self._random.randrange(self.capacity)
+            self.points[slot] = points[self._next - start]
+            self.first_fps[slot] = first_fps[self._next - start]
+            self._weight *= math.exp(math.log(self._uniform()) / self.capacity)
+            self._next += self._skip() + 1
+
+    # Helper for drawing how many points are passed over before the next replacement
+    def _skip(self):
+        return int(math.log(self._uniform()) / math.log(1 - self._weight))
+
+    # Helper for drawing a random number in (0, 1), which can safely be passed to log
+    def _uniform(self):
+        value = 0.0
+        while value == 0.0:
+            value = self._random.random()
+        return value
+
+# Helper for classifying a test point file, streaming the results to a CSV file
+#
+# Any of 'output' (results filename), 'sample' (a PointSample), 'progress'
+# (called with the fraction done) and 'cancelled' (checked between chunks)
+# may be None. Returns (number of points, number of valid points).
+def classify_test_point_file(filename, output, fps_and_yaws, flipped, yaw_indices=None, exact=False,
+                             group_starts=None, errors=None, sample=None, progress=None, cancelled=None):
+    line_errors = [] if errors is None else errors
+    if yaw_indices is None:
+        yaw_indices = build_yaw_indices(fps_and_yaws)
+
+    result_file = open(output, "w") if output is not None else None
+    count = 0
+    valid_count = 0
+    try:
+        if result_file is not None:
+            result_file.write(RESULT_HEADER)
+        for points, fraction in iter_test_point_batches(filename, line_errors):
+            if cancelled is not None and cancelled():
+                break
+            first_fps = classify_batch(fps_and_yaws, points, flipped, yaw_indices, exact, group_starts)
+            if result_file is not None:
+                write_results(result_file, points, first_fps)
+            if sample is not None:
+                sample.add(points, first_fps)
+            count += len(points)
+            valid_count += sum(1 for first_fp in first_fps if first_fp >= 0)
+            if progress is not None:
+                progress(fraction)
+    finally:
+        if result_file is not None:
+            result_file.close()
+
+    if errors is None:
+        fileLoader.print_errors(line_errors)
+    return count, valid_count
+
+# Classifies a test point file on a worker thread; mirrors fileLoader.BackgroundFileLoader
+class BackgroundTestPointClassifier:
+    def __init__(self, filename, output, fps_and_yaws, yaw_indices, flipped, exact=False, group_starts=None,
+                 sample_size=0):
+        self.filename = filename
+        self.output = output
+        self.errors = []
+        self.sample = PointSample(sample_size)
+        self.count = 0
+        self.valid_count = 0
+        self.fraction_done = 0.0
+
+        self._args = (fps_and_yaws, flipped, yaw_indices, exact, group_starts)
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def finished(self):
+        return self._finished.is_set()
+
+    def progress(self):
+        return self.fraction_done
+
+    def _run(self):
+        try:
+            self.count, self.valid_count = classify_test_point_file(
+                self.filename, self.output, *self._args, errors=self.errors, sample=self.sample,
+                progress=self._set_progress, cancelled=self.cancelled)
+        except (OSError, ValueError) as e:
+            self.errors.append((0, "Could not classify " + self.filename + ": " + str(e)))
+        finally:
+            self._finished.set()
+
+    def _set_progress(self, fraction):
+        self.fraction_done = fraction
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify and convert large test point files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    classify_parser = subparsers.add_parser("classify", help="write 'x,z,valid,first_fp' for every test point")
+    classify_parser.add_argument("fp_file", help="FP/yaw file (text or binary)")
+    classify_parser.add_argument("points", help="test point file (text/CSV or " + FILE_EXTENSION + ")")
+    classify_parser.add_argument("output", help="CSV file to write the results to")
+    classify_parser.add_argument("--no-flip", action="store_true", help="classify with 'Flip Yaws' turned off")
+    classify_parser.add_argument("--exact", action="store_true",
+                                 help="compute yaws with the game's table-based arctangent")
+
+    convert_parser = subparsers.add_parser("convert", help="convert a text test point file to " + FILE_EXTENSION)
+    convert_parser.add_argument("input", help="text/CSV test point file")
+    convert_parser.add_argument("output", help="binary test point file to write")
+    args = parser.parse_args(argv)
+
+    if args.command == "classify":
+        fps_and_yaws = fileLoader.read_file(args.fp_file)
+
+        def report(fraction):
+            print("\rClassified {:.0%}".format(fraction), end="", flush=True)
+
+        count, valid_count = classify_test_point_file(args.points, args.output, fps_and_yaws,
+                                                      defaults.FLIPPED and not args.no_flip, exact=args.exact,
+                                                      progress=report)
+        print("\rClassified", count, "test points,", valid_count, "valid ->", args.output)
+        return 0
+
+    errors = []
+    count = write_binary_test_points(args.output, (points for points, fraction in
+                                                   iter_test_point_batches(args.input, errors)))
+    fileLoader.print_errors(errors)
+    print("Wrote", count, "test points to", args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
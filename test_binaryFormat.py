@@ -0,0 +1,118 @@
+import random
+import pytest
+import binaryFormat
+import fileLoader
+from binaryFormat import BinaryFPFile, HEADER, VERSION
+from fpStore import FPStore
+
+
+"""
+Tests for the binary FP/yaw format (.vhfp) of binaryFormat.py: round trips
+through the text format, header validation and reading in batches.
+
+Run with 'python -m pytest'.
+"""
+
+# Helper for building random ((x, z), [(start, end), ...]) records, some of them without yaw ranges
+def random_records(count, seed):
+    generator = random.Random(seed)
+    return [((generator.uniform(-8192, 8192), float(generator.randint(-8192, 8192))),
+             [(generator.randint(0, 65535), generator.randint(0, 65535)) for _ in range(generator.randint(0, 3))])
+            for _ in range(count)]
+
+# Helper for writing random records to a binary file; returns the file's name and the records
+def binary_file(tmp_path, count, seed=1):
+    records = random_records(count, seed)
+    filename = str(tmp_path / "fps.vhfp")
+    binaryFormat.write_binary_file(filename, records)
+    return filename, records
+
+# Helper for changing the bytes of a file with a function of its contents
+def rewrite(filename, change):
+    with open(filename, "rb") as file:
+        data = file.read()
+    with open(filename, "wb") as file:
+        file.write(change(data))
+
+def test_text_binary_text_round_trip(tmp_path):
+    records = random_records(50, 2)
+    text = str(tmp_path / "fps.txt")
+    binary = str(tmp_path / "fps.vhfp")
+    text_again = str(tmp_path / "fps_again.txt")
+    fileLoader.write_text_file(text, records)
+
+    binaryFormat.convert_text_to_binary(text, binary)
+    assert binaryFormat.is_binary_file(binary) and not binaryFormat.is_binary_file(text)
+    assert list(binaryFormat.read_binary_file(binary)) == records
+    binaryFormat.convert_binary_to_text(binary, text_again)
+    with open(text) as file, open(text_again) as file_again:
+        assert file.read() == file_again.read()
+
+    # read_file detects the format by itself
+    assert list(fileLoader.read_file(binary)) == fileLoader.read_file(text) == records
+
+def test_file_size(tmp_path):
+    filename, records = binary_file(tmp_path, 10)
+    with BinaryFPFile(filename) as binary:
+        assert binary.size == binaryFormat.file_size(10, sum(len(yaw_ranges) for fp, yaw_ranges in records))
+        assert len(binary) == 10
+
+def test_empty_file(tmp_path):
+    filename = str(tmp_path / "empty.vhfp")
+    binaryFormat.write_binary_file(filename, [])
+    with BinaryFPFile(filename) as binary:
+        assert len(binary) == 0
+        assert list(binary.iter_batches()) == []
+        assert len(binary.read_store()) == 0
+
+def test_out_of_range_yaws_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        binaryFormat.write_binary_file(str(tmp_path / "bad.vhfp"), [((0.0, 0.0), [(0, 65536)])])
+
+@pytest.mark.parametrize("change, message", [
+    (lambda data: data[:-1], "truncated"),
+    (lambda data: data + b"\0", "truncated"),
+    (lambda data: data[:HEADER.size - 1], "too short"),
+    (lambda data: b"XXXX" + data[4:], "is not a"),
+    (lambda data: data[:4] + (VERSION + 1).to_bytes(2, "little") + data[6:], "unsupported"),
+])
+def test_invalid_files(tmp_path, change, message):
+    filename, records = binary_file(tmp_path, 5)
+    rewrite(filename, change)
+    with pytest.raises(ValueError, match=message):
+        BinaryFPFile(filename)
+
+def test_invalid_offsets(tmp_path):
+    filename, records = binary_file(tmp_path, 5)
+    # Point the last offset past the yaw ranges, keeping the file size
+    offsets_end = HEADER.size + 16 * 5 + 8 * 6
+    rewrite(filename, lambda data: data[:offsets_end - 8] + (2**40).to_bytes(8, "little") + data[offsets_end:])
+    with BinaryFPFile(filename) as binary:
+        with pytest.raises(ValueError):
+            binary.read_store()
+
+@pytest.mark.parametrize("batch_size", [1, 3, 9, 10, 11, 2000])
+def test_iter_batches(tmp_path, batch_size):
+    filename, records = binary_file(tmp_path, 10)
+    with BinaryFPFile(filename) as binary:
+        batches = list(binary.iter_batches(batch_size))
+        assert [len(batch) for batch in batches[:-1]] == [batch_size] * (len(batches) - 1)
+        assert 0 < len(batches[-1]) <= batch_size
+        # Every batch is an FPStore of its own, with offsets starting at 0
+        assert all(isinstance(batch, FPStore) and batch.first_range(0) == 0 for batch in batches)
+        assert [record for batch in batches for record in batch] == records
+        assert list(binary) == records
+
+@pytest.mark.parametrize("first, last", [(0, 0), (0, 10), (3, 7), (9, 10), (4, 100)])
+def test_read_store(tmp_path, first, last):
+    filename, records = binary_file(tmp_path, 10)
+    with BinaryFPFile(filename) as binary:
+        assert list(binary.read_store(first, last)) == records[first:last]
+
+def test_store_outlives_file(tmp_path):
+    filename, records = binary_file(tmp_path, 10)
+    with BinaryFPFile(filename) as binary:
+        store = binary.read_store()
+    # The store holds copies, so it is still usable once the map is closed
+    store.append(((0.0, 0.0), [(1, 2)]))
+    assert list(store) == records + [((0.0, 0.0), [(1, 2)])]
@@ -0,0 +1,103 @@
+import random
+import pytest
+import backends
+from classifier import classify_points, find_first_accepting_fps, find_first_accepting_fps_in_all_groups
+from fpStore import FPStore
+from geometry import compute_p2p_yaw, yaw_within_yaw_range
+
+
+"""
+Tests for classifier.py: the NumPy and pure-Python paths are checked against
+each other and against a direct check of every raw yaw range.
+
+Run with 'python -m pytest'.
+"""
+
+# Helper for building random records with wrap-around ranges, ranges touching 0/65535 and focal points without ranges
+def random_records(count, seed):
+    generator = random.Random(seed)
+    yaw = lambda: generator.choice([0, 65535, generator.randint(0, 65535), generator.randint(60000, 65535),
+                                    generator.randint(0, 5000)])
+    return [((float(generator.randint(-50, 50) * 20), generator.uniform(-1000, 1000)),
+             [(yaw(), yaw()) for _ in range(generator.randint(0, 3))]) for _ in range(count)]
+
+# Helper for building test points, some of them on top of or in line with focal points
+def random_points(records, count, seed):
+    generator = random.Random(seed)
+    points = []
+    for _ in range(count):
+        (x, z), yaw_ranges = generator.choice(records)
+        points.append(generator.choice([(x, z), (x, generator.uniform(-1000, 1000)), (generator.uniform(-1000, 1000), z),
+                                        (generator.uniform(-1200, 1200), generator.uniform(-1200, 1200))]))
+    return points
+
+# Reference: the first focal point with a raw yaw range accepting each point
+def reference_first_fps(records, points, flipped, exact):
+    first_fps = []
+    for tp in points:
+        first_fp = -1
+        for fp_index, (fp, yaw_ranges) in enumerate(records):
+            yaw = compute_p2p_yaw(fp, tp, exact) if flipped else compute_p2p_yaw(tp, fp, exact)
+            if any(yaw_within_yaw_range(yaw, yaw_range) for yaw_range in yaw_ranges):
+                first_fp = fp_index
+                break
+        first_fps.append(first_fp)
+    return first_fps
+
+# Helper for running a classifier function with and without NumPy
+def both_paths(monkeypatch, function, *args, **kwargs):
+    with_numpy = function(*args, **kwargs)
+    with monkeypatch.context() as patch:
+        patch.setattr(backends, "has_numpy", lambda: False)
+        without_numpy = function(*args, **kwargs)
+    return with_numpy, without_numpy
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+@pytest.mark.parametrize("flipped", [True, False])
+@pytest.mark.parametrize("exact", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_paths_agree(monkeypatch, flipped, exact, seed):
+    records = random_records(40, seed)
+    points = random_points(records, 150, seed)
+    expected = reference_first_fps(records, points, flipped, exact)
+    for fps_and_yaws in (records, FPStore(records)):
+        with_numpy, without_numpy = both_paths(monkeypatch, find_first_accepting_fps, fps_and_yaws, points, flipped,
+                                               exact=exact)
+        assert with_numpy == without_numpy == expected
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+@pytest.mark.parametrize("flipped", [True, False])
+@pytest.mark.parametrize("group_starts", [None, [], [15], [10, 25, 25, 39], [0, 40, 100]])
+def test_groups_paths_agree(monkeypatch, flipped, group_starts):
+    records = random_records(40, 7)
+    points = random_points(records, 150, 8)
+    with_numpy, without_numpy = both_paths(monkeypatch, find_first_accepting_fps_in_all_groups, FPStore(records),
+                                           points, flipped, group_starts)
+    assert with_numpy == without_numpy
+
+    # A point is valid if every group accepts it, at the largest of the groups' first accepting focal points
+    bounds = sorted(set([0] + [start for start in group_starts or [] if 0 < start < len(records)] + [len(records)]))
+    expected = [0] * len(points)
+    for start, end in zip(bounds, bounds[1:]):
+        group_first_fps = reference_first_fps(records[start:end], points, flipped, False)
+        expected = [-1 if first < 0 or group_first < 0 else max(first, group_first + start)
+                    for first, group_first in zip(expected, group_first_fps)]
+    assert with_numpy == expected
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+@pytest.mark.parametrize("flipped", [True, False])
+def test_classify_points_paths_agree(monkeypatch, flipped):
+    records = random_records(30, 9)
+    points = random_points(records, 100, 10)
+    for group_starts in (None, [12]):
+        with_numpy, without_numpy = both_paths(monkeypatch, classify_points, FPStore(records), points, flipped,
+                                               group_starts=group_starts)
+        assert with_numpy == without_numpy
+        true_points, false_points = with_numpy
+        assert sorted(true_points + false_points) == sorted(points)
+
+def test_no_focal_points_or_points():
+    assert find_first_accepting_fps([], [(0.0, 0.0)], True) == [-1]
+    assert find_first_accepting_fps(FPStore([((0.0, 0.0), [])]), [(1.0, 1.0)], True) == [-1]
+    assert find_first_accepting_fps(FPStore([((0.0, 0.0), [(0, 65535)])]), [], True) == []
+    assert find_first_accepting_fps_in_all_groups([], [(0.0, 0.0)], True, [0]) == [-1]
@@ -0,0 +1,100 @@
+import random
+import pytest
+import backends
+import coverageGrid
+from coverageGrid import CoverageGrid, build_coverage_grid
+from yawIndex import build_yaw_indices
+import raster
+
+
+"""
+Tests for coverageGrid.py: small grids built in this process are checked
+against raster.coverage_mask over the same integer positions.
+
+Run with 'python -m pytest'.
+"""
+
+pytestmark = pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+
+GRID_MIN = -40
+GRID_SIZE = 64
+
+# Helper for building random records near the grid, some of them inside it, with narrow and wrap-around ranges
+def random_records(count, seed):
+    generator = random.Random(seed)
+    records = []
+    for _ in range(count):
+        starts = [generator.choice([generator.randint(0, 65535), generator.randint(64000, 65535)])
+                  for _ in range(generator.randint(0, 2))]
+        records.append(((generator.uniform(-100, 100), float(generator.randint(-100, 100))),
+                        [(start, (start + generator.randint(0, 4000)) % 65536) for start in starts]))
+    return records
+
+# Helper for building a small grid with tiles that do not divide it evenly; returns it with the expected mask
+def small_grid(tmp_path, seed, flipped=True, tile_size=24):
+    np = backends.numpy()
+    records = random_records(6, seed)
+    filename = str(tmp_path / "grid.vhcg")
+    build_coverage_grid(records, filename, flipped, jobs=1, tile_size=tile_size, grid_min=GRID_MIN,
+                        grid_size=GRID_SIZE)
+    coords = np.arange(GRID_MIN, GRID_MIN + GRID_SIZE, dtype=np.float64)
+    return filename, raster.coverage_mask(records, build_yaw_indices(records), flipped, coords, coords)
+
+@pytest.mark.parametrize("flipped", [True, False])
+@pytest.mark.parametrize("seed", range(3))
+def test_is_valid(tmp_path, flipped, seed):
+    filename, mask = small_grid(tmp_path, seed, flipped)
+    with CoverageGrid(filename) as grid:
+        assert (grid.minimum, grid.size, grid.flipped, grid.exact) == (GRID_MIN, GRID_SIZE, flipped, False)
+        for z in range(GRID_SIZE):
+            for x in range(GRID_SIZE):
+                assert grid.is_valid(GRID_MIN + x, GRID_MIN + z) == mask[z, x]
+        # Positions off the grid are never valid
+        for x, z in [(GRID_MIN - 1, 0), (0, GRID_MIN - 1), (GRID_MIN + GRID_SIZE, 0), (0, GRID_MIN + GRID_SIZE)]:
+            assert not grid.is_valid(x, z)
+
+# Rectangles given as (x_min, z_min, x_max, z_max), including ones clipped at or entirely off the grid's edges
+RECTS = [(GRID_MIN, GRID_MIN, GRID_MIN + GRID_SIZE - 1, GRID_MIN + GRID_SIZE - 1), (-30, -20, -3, 5),
+         (-5, -5, -5, -5), (-37, -35, -30, -29), (-100, -100, -30, -35), (10, 10, 100, 100),
+         (-100, 0, 100, 2), (-39, -100, -39, 100), (30, 30, 20, 40), (100, 100, 200, 200)]
+
+@pytest.mark.parametrize("rect", RECTS)
+def test_rectangles(tmp_path, rect):
+    np = backends.numpy()
+    filename, mask = small_grid(tmp_path, 4)
+    x_min, z_min, x_max, z_max = rect
+    zs, xs = np.nonzero(mask)
+    expected = [(int(x) + GRID_MIN, int(z) + GRID_MIN) for x, z in zip(xs, zs)
+                if x_min <= x + GRID_MIN <= x_max and z_min <= z + GRID_MIN <= z_max]
+    with CoverageGrid(filename) as grid:
+        assert grid.valid_cells_in_rect(*rect) == expected
+        assert grid.count_valid_in_rect(*rect) == len(expected)
+
+@pytest.mark.parametrize("tile_size", [8, 64, 1024])
+def test_tile_sizes(tmp_path, tile_size):
+    filename, mask = small_grid(tmp_path, 2, tile_size=tile_size)
+    with CoverageGrid(filename) as grid:
+        assert grid.count_valid_in_rect(GRID_MIN, GRID_MIN, GRID_MIN + GRID_SIZE, GRID_MIN + GRID_SIZE) == mask.sum()
+
+@pytest.mark.parametrize("tile_size", [0, -8, 12])
+def test_invalid_tile_sizes(tmp_path, tile_size):
+    with pytest.raises(ValueError):
+        build_coverage_grid([], str(tmp_path / "grid.vhcg"), True, jobs=1, tile_size=tile_size, grid_size=GRID_SIZE)
+
+def test_invalid_files(tmp_path):
+    filename = str(tmp_path / "grid.vhcg")
+    build_coverage_grid([], filename, True, jobs=1, tile_size=32, grid_min=GRID_MIN, grid_size=GRID_SIZE)
+    with open(filename, "rb") as file:
+        data = file.read()
+    for bad_data, message in [(data[:-1], "truncated"), (data[:10], "too short"),
+                              (b"XXXX" + data[4:], "not a coverage grid")]:
+        with open(filename, "wb") as file:
+            file.write(bad_data)
+        with pytest.raises(ValueError, match=message):
+            CoverageGrid(filename)
+
+def test_invalid_tile_size_command(tmp_path):
+    fp_file = str(tmp_path / "fps.txt")
+    with open(fp_file, "w") as file:
+        file.write("0.0,0.0:0,100\n")
+    assert coverageGrid.main(["build", fp_file, str(tmp_path / "grid.vhcg"), "--tile-size", "0"]) == 1
@@ -0,0 +1,199 @@
+import os
+import random
+import pytest
+import fileLoader
+import fileWatcher
+from fileWatcher import LineTable, WatchedFile
+
+
+"""
+Tests for fileWatcher.WatchedFile: after every change to a file, applying the
+FileChanges from check() to the focal points read before has to give the same
+focal points as reading the whole file again.
+
+Run with 'python -m pytest'.
+"""
+
+# Helper for a line with a focal point and one yaw range
+def record_line(i):
+    return "{}.5,{}:{},{}\n".format(i, -i, i % 65536, (i * 7) % 65536)
+
+# Follows a file like the viewer does: loads it once, then applies the changes found by checks
+class Follower:
+    def __init__(self, filename):
+        self.filename = filename
+        self.mtime_ns = os.stat(filename).st_mtime_ns
+        lines = LineTable()
+        self.records = []
+        with open(filename, "rb") as file:
+            for batch, bytes_read in fileLoader.iter_record_batches(file, [], lines=lines):
+                self.records.extend(batch)
+        self.watched = WatchedFile(0, filename, lines)
+        self.errors = []
+
+    # Writes the file, making sure its modification time changes even if the size does not
+    def write(self, data):
+        with open(self.filename, "wb") as file:
+            file.write(data.encode())
+        self.mtime_ns += 1000000
+        os.utime(self.filename, ns=(self.mtime_ns, self.mtime_ns))
+
+    # Checks the file and applies its changes; returns them
+    def check(self):
+        changes = self.watched.check()
+        for change in changes:
+            end = change.first_record + change.removed_count
+            self.records[change.first_record:end] = change.records
+            self.errors.extend(change.errors)
+        return changes
+
+    # Helper for asserting that the followed focal points match a full reload
+    def assert_matches_file(self):
+        assert self.records == fileLoader.read_file(self.filename, [])
+
+@pytest.fixture
+def follower(tmp_path):
+    filename = str(tmp_path / "fps.txt")
+    with open(filename, "w") as file:
+        file.write("".join(record_line(i) for i in range(10)))
+    return Follower(filename)
+
+# Helper for reading a file as text
+def contents(filename):
+    with open(filename) as file:
+        return file.read()
+
+def test_unchanged_file(follower):
+    assert follower.check() == []
+    follower.write(contents(follower.filename))
+    assert follower.check() == []
+
+def test_append(follower):
+    follower.write(contents(follower.filename) + record_line(10) + record_line(11))
+    changes = follower.check()
+    assert [(c.first_record, c.removed_count, len(c.records)) for c in changes] == [(10, 0, 2)]
+    follower.assert_matches_file()
+
+def test_large_append_is_split(follower):
+    count = 2 * fileWatcher.MAX_CHANGE_RECORDS + 5
+    follower.write(contents(follower.filename) + "".join(record_line(i) for i in range(10, 10 + count)))
+    changes = follower.check()
+    assert [len(c.records) for c in changes] == [fileWatcher.MAX_CHANGE_RECORDS] * 2 + [5]
+    follower.assert_matches_file()
+
+@pytest.mark.parametrize("index", [0, 4, 9])
+def test_edit_one_line(follower, index):
+    lines = contents(follower.filename).splitlines(True)
+    # The same number of bytes, so only the modification time tells the change apart
+    lines[index] = lines[index][:-2] + str((int(lines[index][-2]) + 1) % 10) + "\n"
+    follower.write("".join(lines))
+    changes = follower.check()
+    assert [(c.first_record, c.removed_count, len(c.records)) for c in changes] == [(index, 1, 1)]
+    follower.assert_matches_file()
+
+def test_insert_and_remove_lines(follower):
+    lines = contents(follower.filename).splitlines(True)
+    lines[3:5] = [record_line(100), "# comment\n", "\n", record_line(101), record_line(102)]
+    follower.write("".join(lines))
+    follower.check()
+    follower.assert_matches_file()
+
+    del lines[1:6]
+    follower.write("".join(lines))
+    follower.check()
+    follower.assert_matches_file()
+
+def test_malformed_lines(follower):
+    lines = contents(follower.filename).splitlines(True)
+    lines[2] = "not a focal point\n"
+    follower.write("".join(lines))
+    follower.check()
+    follower.assert_matches_file()
+    assert [line for line, message in follower.errors] == [3]
+
+    # Fixing the line brings its focal point back
+    lines[2] = record_line(2)
+    follower.write("".join(lines))
+    follower.check()
+    follower.assert_matches_file()
+    assert len(follower.records) == 10
+
+@pytest.mark.parametrize("keep", [0, 1, 5])
+def test_truncation(follower, keep):
+    follower.write("".join(contents(follower.filename).splitlines(True)[:keep]))
+    follower.check()
+    follower.assert_matches_file()
+    assert len(follower.records) == keep
+
+    # Lines appended after a truncation are read like any other
+    follower.write(contents(follower.filename) + record_line(50))
+    follower.check()
+    follower.assert_matches_file()
+
+def test_truncation_mid_line(follower):
+    text = contents(follower.filename)
+    # Cutting a line short leaves an incomplete line, which is only read once it stopped changing
+    follower.write(text[:len(text) - 4])
+    follower.check()
+    assert len(follower.records) == 9
+    follower.check()
+    follower.assert_matches_file()
+
+def test_partially_written_line(follower):
+    text = contents(follower.filename)
+    line = record_line(10)
+    follower.write(text + line[:5])
+    assert follower.check() == []
+    assert len(follower.records) == 10
+
+    # Still being written: it changed since the last check, so it is not read yet
+    follower.write(text + line[:-1])
+    assert follower.check() == []
+
+    # Unchanged for a check, so it is read, even without a newline
+    assert len(follower.check()) == 1
+    follower.assert_matches_file()
+
+    # Once it gets its newline and more yaw ranges, its focal point is replaced
+    follower.write(text + line[:-1] + ",1,2\n" + record_line(11))
+    changes = follower.check()
+    assert [(c.first_record, c.removed_count, len(c.records)) for c in changes] == [(10, 1, 2)]
+    follower.assert_matches_file()
+
+def test_file_loaded_with_partial_line(tmp_path):
+    filename = str(tmp_path / "fps.txt")
+    with open(filename, "w") as file:
+        file.write(record_line(0) + record_line(1)[:-1])
+    follower = Follower(filename)
+    follower.write(record_line(0) + record_line(1) + record_line(2))
+    follower.check()
+    follower.assert_matches_file()
+    assert len(follower.records) == 3
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_edits(follower, seed):
+    generator = random.Random(seed)
+    lines = contents(follower.filename).splitlines(True)
+    for step in range(30):
+        kind = generator.choice(["append", "insert", "delete", "edit", "truncate", "partial"])
+        position = generator.randint(0, len(lines))
+        new_lines = [generator.choice([record_line(generator.randint(0, 1000)), "# comment\n", "\n", "bad\n"])
+                     for _ in range(generator.randint(1, 4))]
+        if kind == "append":
+            lines += new_lines
+        elif kind == "insert":
+            lines[position:position] = new_lines
+        elif kind == "delete":
+            del lines[position:position + generator.randint(1, 3)]
+        elif kind == "edit":
+            lines[position:position + 1] = new_lines[:1]
+        elif kind == "truncate":
+            lines = lines[:position]
+        text = "".join(lines)
+        if kind == "partial":
+            text += record_line(generator.randint(0, 1000))[:generator.randint(1, 8)]
+        follower.write(text)
+        follower.check()
+        # A partially written line is read after one more check
+        follower.check()
+        follower.assert_matches_file()
@@ -0,0 +1,191 @@
+import random
+import pytest
+from fpStore import FPStore, fp_array
+import backends
+
+
+"""
+Tests for fpStore.FPStore, checked against a plain list of records.
+
+Run with 'python -m pytest'.
+"""
+
+# Slice bounds covering negative, empty, reversed and out-of-range slices of a 6 element store
+BOUNDS = [None, -100, -7, -6, -3, -1, 0, 1, 3, 5, 6, 7, 100]
+
+# Helper for building random ((x, z), [(start, end), ...]) records, some of them without yaw ranges
+def random_records(count, seed):
+    generator = random.Random(seed)
+    return [((generator.uniform(-8192, 8192), float(generator.randint(-8192, 8192))),
+             [(generator.randint(0, 65535), generator.randint(0, 65535)) for _ in range(generator.randint(0, 3))])
+            for _ in range(count)]
+
+# Helper for checking a store against the list of records it should hold
+def assert_same(store, records):
+    assert len(store) == len(records)
+    assert list(store) == records
+    assert store.range_count() == sum(len(yaw_ranges) for fp, yaw_ranges in records)
+
+def test_records_round_trip():
+    records = random_records(20, 1)
+    store = FPStore(records)
+    assert_same(store, records)
+    assert store[-1] == records[-1]
+    with pytest.raises(IndexError):
+        store[20]
+    with pytest.raises(IndexError):
+        store[-21]
+
+@pytest.mark.parametrize("start", BOUNDS)
+@pytest.mark.parametrize("stop", BOUNDS)
+def test_slicing(start, stop):
+    records = random_records(6, 2)
+    assert_same(FPStore(records)[start:stop], records[start:stop])
+
+@pytest.mark.parametrize("start", BOUNDS)
+@pytest.mark.parametrize("stop", BOUNDS)
+def test_slice_assignment(start, stop):
+    records = random_records(6, 3)
+    new_records = random_records(2, 4)
+    store = FPStore(records)
+    store[start:stop] = new_records
+    records[start:stop] = new_records
+    assert_same(store, records)
+
+    # Assigning another store goes through the bulk copy instead of the records
+    store[start:stop] = FPStore(new_records)
+    records[start:stop] = new_records
+    assert_same(store, records)
+
+@pytest.mark.parametrize("start", BOUNDS)
+@pytest.mark.parametrize("stop", BOUNDS)
+def test_slice_deletion(start, stop):
+    records = random_records(6, 5)
+    store = FPStore(records)
+    del store[start:stop]
+    del records[start:stop]
+    assert_same(store, records)
+
+@pytest.mark.parametrize("index", [0, 3, 5, -1, -6])
+def test_item_deletion(index):
+    records = random_records(6, 6)
+    store = FPStore(records)
+    del store[index]
+    del records[index]
+    assert_same(store, records)
+
+@pytest.mark.parametrize("index", [6, -7])
+def test_item_deletion_out_of_range(index):
+    store = FPStore(random_records(6, 7))
+    with pytest.raises(IndexError):
+        del store[index]
+
+def test_steps_are_rejected():
+    store = FPStore(random_records(6, 8))
+    with pytest.raises(ValueError):
+        store[::2]
+    with pytest.raises(ValueError):
+        del store[::-1]
+    with pytest.raises(TypeError):
+        store[0] = ((0.0, 0.0), [])
+
+def test_extend_store_rebases_offsets():
+    first = random_records(5, 9)
+    second = random_records(7, 10)
+    store = FPStore(first)
+    # Extending with a slice, whose offsets start at 0 again, and with a store built from scratch
+    store.extend(FPStore(first + second)[5:])
+    store.extend(FPStore(second))
+    assert_same(store, first + second + second)
+    assert store.offset_array().tolist() == [0] + list(_running_range_counts(first + second + second))
+
+# Helper for the offsets a list of records should have after the leading 0
+def _running_range_counts(records):
+    total = 0
+    for fp, yaw_ranges in records:
+        total += len(yaw_ranges)
+        yield total
+
+def test_extend_empty_store():
+    records = random_records(4, 11)
+    store = FPStore(records)
+    store.extend(FPStore())
+    store.extend(FPStore(records)[2:2])
+    assert_same(store, records)
+
+def test_clear_and_copy():
+    records = random_records(5, 12)
+    store = FPStore(records)
+    copy = store.copy()
+    store.clear()
+    assert_same(store, [])
+    assert_same(copy, records)
+    store.append(records[0])
+    assert_same(store, records[:1])
+
+@pytest.mark.parametrize("yaw_range", [(-1, 100), (100, 65536), (70000, 0)])
+def test_out_of_range_yaws(yaw_range):
+    records = random_records(3, 13)
+    store = FPStore(records)
+    with pytest.raises(ValueError):
+        store.append(((1.0, 2.0), [(0, 1), yaw_range]))
+    with pytest.raises(ValueError):
+        FPStore([((1.0, 2.0), [yaw_range])])
+    # A rejected record leaves the store unchanged
+    assert_same(store, records)
+
+def test_from_buffers_rebases_offsets():
+    records = random_records(8, 14)
+    store = FPStore(records)
+    part = FPStore.from_buffers(store._fps[6:], store._offsets[3:], store._yaws[2 * store.first_range(3):])
+    assert_same(part, records[3:])
+    with pytest.raises(ValueError):
+        FPStore.from_buffers(store._fps[2:], store._offsets, store._yaws)
+
+def test_range_lookups():
+    records = random_records(10, 15)
+    store = FPStore(records)
+    r = 0
+    for i, (fp, yaw_ranges) in enumerate(records):
+        assert store.focal_point(i) == fp
+        assert store.first_range(i) == r
+        for yaw_range in yaw_ranges:
+            assert store.range_owner(r) == i
+            assert store.yaw_range(r) == yaw_range
+            r += 1
+
+# Changes that resize the arrays, each applied to a fresh 6 element store
+CHANGES = {
+    "append": lambda store: store.append(((1.0, 2.0), [(3, 4)])),
+    "extend": lambda store: store.extend(FPStore(random_records(2, 16))),
+    "clear": lambda store: store.clear(),
+    "delete": lambda store: store.__delitem__(slice(1, 3)),
+    "assign": lambda store: store.__setitem__(slice(1, 3), random_records(3, 17)),
+}
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+@pytest.mark.parametrize("view", ["fp_array", "offset_array", "yaw_array"])
+@pytest.mark.parametrize("change", sorted(CHANGES))
+def test_change_with_live_view(view, change):
+    records = random_records(6, 18)
+    store = FPStore(records)
+    array = getattr(store, view)()
+    with pytest.raises(BufferError):
+        CHANGES[change](store)
+    # The failed change leaves every array as it was, and the view still shows the store
+    assert_same(store, records)
+    assert array.tolist() == getattr(store, view)().tolist()
+
+    del array
+    CHANGES[change](store)
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+def test_empty_store():
+    store = FPStore()
+    assert_same(store, [])
+    assert_same(store[:], [])
+    assert store.fp_array().shape == (0, 2)
+    assert store.offset_array().tolist() == [0]
+    assert store.yaw_array().shape == (0, 2)
+    assert fp_array([]).shape == (0, 2)
+    assert_same(FPStore.from_buffers(store._fps, store._offsets, store._yaws), [])
@@ -0,0 +1,87 @@
+import random
+import pytest
+from gameTrig import ARCTAN_TABLE_SIZE, arctan_table, atan2s, atan2s_array, atan2s_table_indices, octant_angle_table
+import backends
+
+
+"""
+Tests for gameTrig.py: known angles of atan2s, and the vectorized functions
+checked against the scalar one.
+
+Run with 'python -m pytest'.
+"""
+
+# (y, x, angle) along the axes and diagonals, where atan2s switches octants
+OCTANT_BOUNDARIES = [
+    (1, 0, 0x0000), (1, 1, 0x2000), (0, 1, 0x4000), (-1, 1, 0x6000),
+    (-1, 0, 0x8000), (-1, -1, 0xA000), (0, -1, 0xC000), (1, -1, 0xE000),
+]
+
+# (y, x, angle) for zero vectors and negative zeros, which count as positive like in the game
+ZEROS = [
+    (0.0, 0.0, 0x0000), (-0.0, 0.0, 0x0000), (0.0, -0.0, 0x0000), (-0.0, -0.0, 0x0000),
+    (-0.0, 1.0, 0x4000), (1.0, -0.0, 0x0000), (-1.0, -0.0, 0x8000), (-0.0, -1.0, 0xC000),
+]
+
+requires_numpy = pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+
+# Helper for the float32 values next to a float32 value
+def float32_neighbors(value):
+    import numpy as np
+    return [float(np.nextafter(np.float32(value), np.float32(direction))) for direction in (-np.inf, np.inf)]
+
+def test_arctan_table():
+    table = arctan_table()
+    assert len(table) == ARCTAN_TABLE_SIZE
+    assert table[0] == 0
+    assert table[512] == 4836
+    assert table[1024] == 0x2000
+    assert all(a <= b for a, b in zip(table, table[1:]))
+
+@pytest.mark.parametrize("y, x, angle", OCTANT_BOUNDARIES + ZEROS)
+def test_known_angles(y, x, angle):
+    assert atan2s(y, x) == angle
+    # The angle does not depend on the length of the vector
+    assert atan2s(y * 1000.5, x * 1000.5) == angle
+
+@requires_numpy
+@pytest.mark.parametrize("y, x, angle", OCTANT_BOUNDARIES + ZEROS)
+def test_known_angles_vectorized(y, x, angle):
+    assert int(atan2s_array(y, x)) == angle
+    assert int(octant_angle_table()[atan2s_table_indices(y, x)]) == angle
+
+@requires_numpy
+def test_vectorized_matches_scalar_near_boundaries():
+    import numpy as np
+    # Vectors just off the axes and diagonals, where the octant and table index change
+    ys = []
+    xs = []
+    for y, x, angle in OCTANT_BOUNDARIES:
+        for scale in (1.0, 3.0, 1000.0):
+            for ny in [y * scale] + float32_neighbors(y * scale):
+                for nx in [x * scale] + float32_neighbors(x * scale):
+                    ys.append(ny)
+                    xs.append(nx)
+    expected = [atan2s(y, x) for y, x in zip(ys, xs)]
+    assert atan2s_array(np.array(ys), np.array(xs)).tolist() == expected
+
+@requires_numpy
+@pytest.mark.parametrize("seed", range(5))
+def test_vectorized_matches_scalar(seed):
+    import numpy as np
+    generator = random.Random(seed)
+    value = lambda: generator.choice([generator.uniform(-16384, 16384), float(generator.randint(-50, 50)),
+                                      generator.uniform(-1e-3, 1e-3), generator.uniform(-1e30, 1e30)])
+    ys = [value() for _ in range(2000)]
+    xs = [value() for _ in range(2000)]
+    expected = [atan2s(y, x) for y, x in zip(ys, xs)]
+    assert atan2s_array(np.array(ys), np.array(xs)).tolist() == expected
+
+@requires_numpy
+def test_vectorized_broadcasting():
+    import numpy as np
+    # A row and a column give the angles of a whole grid, like raster.py's sample points
+    coords = np.arange(-20, 21, dtype=np.float64) * 0.75
+    angles = atan2s_array(coords[:, None], coords[None, :])
+    assert angles.shape == (len(coords), len(coords))
+    assert angles.tolist() == [[atan2s(y, x) for x in coords.tolist()] for y in coords.tolist()]
@@ -0,0 +1,65 @@
+import random
+import pytest
+import testPoints
+from binaryFormat import MAGIC
+
+
+"""
+Tests for the binary test point format (.vhtp) of testPoints.py: round trips
+from text files, header validation and reading in batches.
+
+Run with 'python -m pytest'.
+"""
+
+# Helper for changing the bytes of a file with a function of its contents
+def rewrite(filename, change):
+    with open(filename, "rb") as file:
+        data = file.read()
+    with open(filename, "wb") as file:
+        file.write(change(data))
+
+# Helper for writing random test points to a text file; returns the file's name and the points
+def text_test_points(tmp_path, count, seed=3):
+    generator = random.Random(seed)
+    points = [(generator.uniform(-8192, 8192), float(generator.randint(-8192, 8192))) for _ in range(count)]
+    filename = str(tmp_path / "points.csv")
+    with open(filename, "w") as file:
+        file.write("x,z\n")
+        for x, z in points:
+            file.write(str(x) + "," + str(z) + "\n")
+    return filename, points
+
+@pytest.mark.parametrize("batch_size", [1, 4, 25, 26, 1000])
+def test_test_point_round_trip(tmp_path, batch_size):
+    text, points = text_test_points(tmp_path, 25)
+    binary = str(tmp_path / "points.vhtp")
+    assert testPoints.main(["convert", text, binary]) == 0
+    assert testPoints.is_binary_test_point_file(binary) and not testPoints.is_binary_test_point_file(text)
+
+    for filename in (text, binary):
+        errors = []
+        batches = list(testPoints.iter_test_point_batches(filename, errors, batch_size))
+        assert errors == []
+        assert [point for batch, fraction in batches for point in batch] == points
+        assert [len(batch) for batch, fraction in batches[:-1]] == [batch_size] * (len(batches) - 1)
+        assert batches[-1][1] == 1.0
+
+def test_test_points_written_in_batches(tmp_path):
+    filename = str(tmp_path / "points.vhtp")
+    assert testPoints.write_binary_test_points(filename, [[(1.0, 2.0)], [], [(3.5, -4.0), (5.0, 6.0)]]) == 3
+    with testPoints.BinaryTestPointFile(filename) as binary:
+        assert len(binary) == 3
+        assert list(binary.iter_batches(2)) == [[(1.0, 2.0), (3.5, -4.0)], [(5.0, 6.0)]]
+
+@pytest.mark.parametrize("change, message", [
+    (lambda data: data[:-8], "truncated"),
+    (lambda data: data[:10], "too short"),
+    (lambda data: MAGIC + data[4:], "is not a"),
+    (lambda data: data[:4] + (testPoints.VERSION + 1).to_bytes(2, "little") + data[6:], "unsupported"),
+])
+def test_invalid_test_point_files(tmp_path, change, message):
+    filename = str(tmp_path / "points.vhtp")
+    testPoints.write_binary_test_points(filename, [[(1.0, 2.0), (3.0, 4.0)]])
+    rewrite(filename, change)
+    with pytest.raises(ValueError, match=message):
+        testPoints.BinaryTestPointFile(filename)
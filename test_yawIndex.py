@@ -0,0 +1,124 @@
+import random
+import pytest
+from fpStore import FPStore
+from yawIndex import YawIndex, YawIndexStore, build_yaw_indices, merge_yaw_ranges
+import backends
+
+
+"""
+Tests for the yaw indices of yawIndex.py, checked against merge_yaw_ranges.
+
+Run with 'python -m pytest'.
+"""
+
+# Helper for building random records with yaws near the 65535/0 boundary and ranges that touch or overlap
+def random_records(count, seed):
+    generator = random.Random(seed)
+    yaw = lambda: generator.choice([0, 1, 65534, 65535, generator.randint(0, 65535), generator.randint(100, 110)])
+    return [((generator.uniform(-8192, 8192), generator.uniform(-8192, 8192)),
+             [(yaw(), yaw()) for _ in range(generator.randint(0, 5))]) for _ in range(count)]
+
+# Helper for turning yaw indices into lists of (start, end) ranges
+def ranges(yaw_indices):
+    return [list(zip(index.starts, index.ends)) for index in yaw_indices]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_build_matches_merge(seed):
+    records = random_records(30, seed)
+    expected = [merge_yaw_ranges(yaw_ranges) for fp, yaw_ranges in records]
+    # Lists of records are merged one focal point at a time, FPStores in bulk if NumPy is installed
+    assert ranges(build_yaw_indices(records)) == expected
+    assert ranges(build_yaw_indices(FPStore(records))) == expected
+
+def test_build_without_ranges():
+    assert len(build_yaw_indices(FPStore())) == 0
+    store = build_yaw_indices(FPStore([((0.0, 0.0), []), ((1.0, 1.0), [])]))
+    assert ranges(store) == [[], []]
+    assert store.range_count() == 0
+
+@pytest.mark.parametrize("seed", range(5))
+def test_contains(seed):
+    records = random_records(20, seed)
+    store = build_yaw_indices(records)
+    generator = random.Random(seed)
+    for i, (fp, yaw_ranges) in enumerate(records):
+        index = YawIndex(yaw_ranges)
+        for yaw in [0, 65535, 100, 110, 111] + [generator.randint(0, 65535) for _ in range(50)]:
+            assert store.contains(i, yaw) == index.contains(yaw) == store[i].contains(yaw)
+
+@pytest.mark.parametrize("start", [None, -10, -3, 0, 2, 6, 10])
+@pytest.mark.parametrize("stop", [None, -10, -3, 0, 2, 6, 10])
+def test_list_behavior(start, stop):
+    records = random_records(6, 1)
+    indices = [YawIndex(yaw_ranges) for fp, yaw_ranges in random_records(6, 1)]
+    new_indices = [YawIndex(yaw_ranges) for fp, yaw_ranges in random_records(2, 2)]
+    store = build_yaw_indices(records)
+    assert ranges(store[start:stop]) == ranges(indices[start:stop])
+
+    store[start:stop] = new_indices
+    indices[start:stop] = new_indices
+    assert ranges(store) == ranges(indices)
+
+    del store[start:stop]
+    del indices[start:stop]
+    assert ranges(store) == ranges(indices)
+
+    store.extend(YawIndexStore(new_indices))
+    indices.extend(new_indices)
+    assert ranges(store) == ranges(indices)
+    assert ranges(store.copy()) == ranges(indices)
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+def test_flatten_store_matches_list():
+    from yawIndex import flatten_yaw_indices
+    store = build_yaw_indices(random_records(25, 3))
+    for flat_store, flat_list in zip(flatten_yaw_indices(store, 4), flatten_yaw_indices(list(store), 4)):
+        assert flat_store.tolist() == flat_list.tolist()
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+@pytest.mark.parametrize("first_index", [0, 7])
+def test_flatten_wrap_around(first_index):
+    from yawIndex import flatten_yaw_indices
+    import numpy as np
+    # Wrap-around ranges are split at 65535/0, so every key range lies within its focal point's 65536 keys
+    records = [((0.0, 0.0), [(65000, 100)]), ((1.0, 1.0), []), ((2.0, 2.0), [(65535, 0), (200, 300)]),
+               ((3.0, 3.0), [(10, 5)])]
+    store = build_yaw_indices(FPStore(records))
+    key_starts, key_ends = flatten_yaw_indices(store, first_index)
+    bases = [(first_index + i) * 65536 for i in range(len(records))]
+    assert key_starts.tolist() == [bases[0], bases[0] + 65000, bases[2], bases[2] + 200, bases[2] + 65535, 
+                                   bases[3], bases[3] + 10]
+    assert key_ends.tolist() == [bases[0] + 100, bases[0] + 65535, bases[2], bases[2] + 300, bases[2] + 65535, 
+                                 bases[3] + 5, bases[3] + 65535]
+
+    # A searchsorted lookup of the keys, as done by the vectorized paths, agrees with contains()
+    for i in range(len(records)):
+        yaws = np.array([0, 1, 5, 6, 9, 10, 100, 101, 199, 200, 300, 301, 64999, 65000, 65534, 65535])
+        keys = bases[i] + yaws
+        j = np.searchsorted(key_starts, keys, side="right") - 1
+        found = (j >= 0) & (keys <= key_ends[np.maximum(j, 0)])
+        assert found.tolist() == [store.contains(i, int(yaw)) for yaw in yaws]
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+def test_flatten_empty():
+    from yawIndex import flatten_yaw_indices
+    for yaw_indices in (YawIndexStore(), [], build_yaw_indices(FPStore([((0.0, 0.0), [])]))):
+        key_starts, key_ends = flatten_yaw_indices(yaw_indices)
+        assert len(key_starts) == len(key_ends) == 0
+
+@pytest.mark.skipif(not backends.has_numpy(), reason="requires NumPy")
+@pytest.mark.parametrize("view", ["offset_array", "start_array", "end_array"])
+def test_change_with_live_view(view):
+    records = random_records(6, 4)
+    store = build_yaw_indices(records)
+    expected = ranges(store)
+    array = getattr(store, view)()
+    for change in (lambda: store.append(YawIndex([(1, 2)])), lambda: store.append_yaw_ranges([(1, 2)]),
+                   lambda: store.extend(store.copy()), store.clear, lambda: store.__delitem__(slice(1, 3)),
+                   lambda: store.__setitem__(slice(1, 3), [YawIndex([(5, 6)])])):
+        with pytest.raises(BufferError):
+            change()
+        assert ranges(store) == expected
+    del array
+    store.clear()
+    assert len(store) == 0
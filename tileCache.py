@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from viewport import TILE_PIXELS, BASE_UNITS_PER_PIXEL, MAP_MIN
+from yawIndex import flatten_yaw_indices
+from fpStore import fp_array
+import raster
+import backends
+
+
+"""
+Least recently used cache of coverage tiles for the zoomable plot.
+
+Tiles are keyed by (zoom level, tx, tz) and hold the raster coverage mask of
+TILE_PIXELS x TILE_PIXELS pixel centers, computed only from the focal points
+whose yaw ranges can reach the tile. Each tile remembers how many focal
+points it covers, so focal points added later are merged in incrementally
+instead of recomputing the tile. Masks are cached rather than images, so
+changing colors does not throw tiles away. A cache created with a count mode
+holds coverage count rasters for the heatmap instead, which are merged by
+adding up counts. Once the cache grows beyond its memory cap, the least
+recently used tiles are dropped. Requires NumPy.
+"""
+
+# Default memory cap for cached tile masks (1024 tiles of 256 x 256 pixels)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Helper for finding the Mario coordinates of the pixel centers of a tile along one axis
+def tile_sample_coords(level, t):
+    np = backends.numpy()
+    units = BASE_UNITS_PER_PIXEL / 2**level
+    return MAP_MIN + (t * TILE_PIXELS + np.arange(TILE_PIXELS, dtype=np.float64) + 0.5) * units
+
+# Helper for computing the coverage of a tile from the focal points at the given indices, indexed by [z, x]
+#
+# count is None for a coverage mask, or one of heatmap.COUNT_MODES for coverage counts.
+def render_tile(level, tx, tz, fps_and_yaws, yaw_indices, fp_indices, flipped, exact=False, count=None):
+    xs = tile_sample_coords(level, tx)
+    zs = tile_sample_coords(level, tz)
+    fps_and_yaws = [fps_and_yaws[i] for i in fp_indices]
+    yaw_indices = [yaw_indices[i] for i in fp_indices]
+    if count is None:
+        return raster.coverage_mask(fps_and_yaws, yaw_indices, flipped, xs, zs, exact)
+    return raster.coverage_counts(fps_and_yaws, yaw_indices, flipped, xs, zs, exact, count == "ranges")
+
+class TileCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, count=None):
+        self.max_bytes = max_bytes
+        self.count = count
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        # (level, tx, tz) -> [mask, number of focal points merged into it]
+        self._tiles = OrderedDict()
+        # Focal point positions and flattened yaw indices used to skip focal points that can't reach a tile,
+        # kept as chunks that grow along with the focal points
+        self._fp_chunks = []
+        self._key_chunks = []
+        self._culling_arrays = None
+        self._culled_fp_count = 0
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def __contains__(self, key):
+        return key in self._tiles
+
+    # Drops every tile; needed whenever already covered focal points change (e.g. flipping yaws)
+    def clear(self):
+        self._tiles.clear()
+        self.nbytes = 0
+        self._fp_chunks = []
+        self._key_chunks = []
+        self._culling_arrays = None
+        self._culled_fp_count = 0
+
+    # Brings the culling arrays up to date with newly added focal points and returns them
+    def update_culling_arrays(self, fps_and_yaws, yaw_indices):
+        if self._culling_arrays is not None and self._culled_fp_count == len(fps_and_yaws):
+            return self._culling_arrays
+        np = backends.numpy()
+        first = self._culled_fp_count
+        # Slicing copies, so the chunk does not pin the buffers of an FPStore
+        self._fp_chunks.append(fp_array(fps_and_yaws[first:]))
+        self._key_chunks.append(flatten_yaw_indices(yaw_indices[first:], first))
+        self._culled_fp_count = len(fps_and_yaws)
+        self._culling_arrays = (np.concatenate(self._fp_chunks), 
+                                np.concatenate([keys[0] for keys in self._key_chunks]),
+                                np.concatenate([keys[1] for keys in self._key_chunks]))
+        # Only the combined arrays are kept, so the chunks are not stored twice
+        self._fp_chunks = [self._culling_arrays[0]]
+        self._key_chunks = [self._culling_arrays[1:]]
+        return self._culling_arrays
+
+    # Returns the bytes used by the culling arrays (16 per focal point and 16 per merged yaw range)
+    def culling_nbytes(self):
+        return 0 if self._culling_arrays is None else sum(array.nbytes for array in self._culling_arrays)
+
+    # Helper for finding the focal points from first_fp on that can reach a tile
+    def _reaching_fps(self, level, tx, tz, fps_and_yaws, yaw_indices, flipped, first_fp=0):
+        fps, key_starts, key_ends = self.update_culling_arrays(fps_and_yaws, yaw_indices)
+        xs = tile_sample_coords(level, tx)
+        zs = tile_sample_coords(level, tz)
+        fp_indices = raster.reaching_fps(fps, key_starts, key_ends, xs[0], zs[0], xs[-1], zs[-1], flipped)
+        return fp_indices[fp_indices >= first_fp].tolist()
+
+    # Returns the up to date mask (or counts) of a tile, rendering it or merging in new focal points as needed
+    def get(self, level, tx, tz, fps_and_yaws, yaw_indices, flipped, exact=False):
+        key = (level, tx, tz)
+        entry = self._tiles.get(key)
+        if entry is None:
+            self.misses += 1
+            fp_indices = self._reaching_fps(level, tx, tz, fps_and_yaws, yaw_indices, flipped)
+            entry = [render_tile(level, tx, tz, fps_and_yaws, yaw_indices, fp_indices, flipped, exact, self.count), 
+                     len(fps_and_yaws)]
+            self._tiles[key] = entry
+            self.nbytes += entry[0].nbytes
+            self._evict(keep=key)
+            return entry[0]
+
+        self.hits += 1
+        self._tiles.move_to_end(key)
+        if entry[1] < len(fps_and_yaws):
+            fp_indices = self._reaching_fps(level, tx, tz, fps_and_yaws, yaw_indices, flipped, entry[1])
+            new_coverage = render_tile(level, tx, tz, fps_and_yaws, yaw_indices, fp_indices, flipped, exact, self.count)
+            if self.count is None:
+                entry[0] |= new_coverage
+            else:
+                entry[0] += new_coverage
+            entry[1] = len(fps_and_yaws)
+        return entry[0]
+
+    # Helper for dropping least recently used tiles until the cache fits its memory cap
+    def _evict(self, keep):
+        while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+            key, entry = next(iter(self._tiles.items()))
+            if key == keep:
+                break
+            del self._tiles[key]
+            self.nbytes -= entry[0].nbytes
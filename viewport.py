@@ -0,0 +1,81 @@
+import math
+
+
+"""
+Zoom and pan state of the plot.
+
+At zoom level 0 the whole map [-8192, 8192] fits the 1024 pixel canvas at 16
+units per pixel, exactly like geometry.mario_to_screen. Every level doubles
+the magnification. The visible area is tracked as the Mario coordinates of
+the canvas' top left corner, and the map is split into square tiles of
+TILE_PIXELS pixels per level so coverage can be rendered and cached per tile.
+"""
+
+VIEW_SIZE = 1024
+BASE_UNITS_PER_PIXEL = 16
+MAX_ZOOM_LEVEL = 8
+TILE_PIXELS = 256
+
+MAP_MIN = -8192
+MAP_SIZE = 16384
+
+class Viewport:
+    def __init__(self):
+        self.reset()
+
+    # Shows the whole map again
+    def reset(self):
+        self.level = 0
+        self.x_min = MAP_MIN
+        self.z_min = MAP_MIN
+
+    # Number of Mario units covered by one canvas pixel
+    def units_per_pixel(self, level=None):
+        return BASE_UNITS_PER_PIXEL / 2**(self.level if level is None else level)
+
+    # Helper for converting Mario coordinates to canvas coordinates
+    def to_screen(self, pts):
+        scale = 1 / self.units_per_pixel()
+        return [((pt[0] - self.x_min) * scale, (pt[1] - self.z_min) * scale) for pt in pts]
+
+    # Helper for converting canvas coordinates to Mario coordinates
+    def to_mario(self, sx, sz):
+        units = self.units_per_pixel()
+        return self.x_min + sx * units, self.z_min + sz * units
+
+    # Moves the view so that the map follows a drag of (dx, dz) canvas pixels
+    def pan(self, dx, dz):
+        units = self.units_per_pixel()
+        self.x_min -= dx * units
+        self.z_min -= dz * units
+
+    # Zooms in (positive steps) or out around the canvas point (sx, sz), which stays in place
+    #
+    # Returns the factor the canvas was scaled by, 1 if the zoom level was already at its limit.
+    def zoom(self, steps, sx, sz):
+        level = min(max(self.level + steps, 0), MAX_ZOOM_LEVEL)
+        if level == self.level:
+            return 1
+        x, z = self.to_mario(sx, sz)
+        factor = 2**(level - self.level)
+        self.level = level
+        units = self.units_per_pixel()
+        self.x_min = x - sx * units
+        self.z_min = z - sz * units
+        return factor
+
+    # Helper for finding the Mario coordinates of a tile's top left corner at the current zoom level
+    def tile_origin(self, tx, tz):
+        size = TILE_PIXELS * self.units_per_pixel()
+        return MAP_MIN + tx * size, MAP_MIN + tz * size
+
+    # Lists the (tx, tz) tiles of the current zoom level that overlap the canvas
+    def visible_tiles(self, view_width=VIEW_SIZE, view_height=VIEW_SIZE):
+        units = self.units_per_pixel()
+        size = TILE_PIXELS * units
+        count = int(MAP_SIZE / size)
+        first_x = max(math.floor((self.x_min - MAP_MIN) / size), 0)
+        last_x = min(math.ceil((self.x_min + view_width * units - MAP_MIN) / size), count)
+        first_z = max(math.floor((self.z_min - MAP_MIN) / size), 0)
+        last_z = min(math.ceil((self.z_min + view_height * units - MAP_MIN) / size), count)
+        return [(tx, tz) for tz in range(first_z, last_z) for tx in range(first_x, last_x)]
@@ -0,0 +1,384 @@
+from geometry import compute_p2p_yaw, yaw_within_yaw_range
+from viewport import MAP_MIN, MAP_SIZE
+import raster
+import backends
+
+
+"""
+Spatial index answering which (focal point, yaw range) pairs accept a position.
+
+The map is divided into a uniform grid of GRID_CELLS x GRID_CELLS cells, and
+every wedge (the region find_polygon draws for one yaw range) is listed in
+the cells it can reach. Rather than the wedge's bounding box, which for
+wedges running out to the map bounds covers most of the map, a cell is only
+listed if the yaw range overlaps the arc between the yaws towards the cell's
+corners (see raster.reaching_fps). A query looks up the position's cell and
+checks only the wedges listed there, computing yaws the same way as the
+classifier, instead of checking every focal point.
+
+The index refers to the focal points and yaw ranges of an FPStore instead of
+keeping its own copies, so the cells' wedges are all it adds per wedge. They
+are kept in blocks of consecutive focal points with up to BLOCK_RANGES yaw
+ranges each, either as lists of wedge ids per cell or, for wedges reaching
+many cells, as one bit per cell and wedge. A block over its budget of
+MAX_BYTES_PER_RANGE bytes per yaw range (about twice what the FPStore uses)
+has its cells merged into a coarser grid, whose cells list more wedges for
+queries to check.
+
+Building a block takes a while, so it is split into next_build(), which only
+describes the missing focal points, compute_block(), which can run on a
+worker thread, and install(). When focal points of the store are replaced,
+only the blocks containing them are built again (see replace()).
+Building the grid requires NumPy; without it, queries scan every wedge.
+"""
+
+# Number of cells along each axis of the map; finer grids list long wedges in many more cells
+GRID_CELLS = 32
+CELL_SIZE = MAP_SIZE / GRID_CELLS
+
+# Yaw ranges per block: smaller blocks are rebuilt faster after a change, and 
+# blocks of at most 65536 ranges store their wedge ids as uint16
+BLOCK_RANGES = 8192
+
+# Upper bound on the number of (wedge, cell) pairs tested at once while building
+BUILD_CHUNK_ELEMENTS = 1 << 22
+
+# Memory budget of a block per yaw range; blocks over it are stored on coarser
+# grids (see _cells_from_pairs), whose cells list more wedges for queries to check
+MAX_BYTES_PER_RANGE = 16
+
+# Blocks may always use this many bytes, so small data sets keep the finest grid
+MIN_BLOCK_BUDGET = 1 << 16
+
+# Cells with fewer candidate wedges than this are checked one wedge at a time, which is faster for few wedges
+VECTORIZE_MIN_CANDIDATES = 32
+
+# The cells reached by the wedges of consecutive focal points
+class WedgeBlock:
+    def __init__(self, first_fp, fp_count, first_range, range_count):
+        self.first_fp = first_fp
+        self.fp_count = fp_count
+        self.first_range = first_range
+        self.range_count = range_count
+        # The wedges of every cell (CellLists or CellBits) once built, or None while building;
+        # wedge ids count from first_range
+        self.cells = None
+
+# The wedges of a block listed per cell of a grid_cells x grid_cells grid: the
+# wedges in cell c are wedge_ids[offsets[c]:offsets[c + 1]]
+class CellLists:
+    def __init__(self, grid_cells, offsets, wedge_ids):
+        self.grid_cells = grid_cells
+        self.offsets = offsets
+        self.wedge_ids = wedge_ids
+
+    def wedges(self, cell):
+        return self.wedge_ids[self.offsets[cell]:self.offsets[cell + 1]]
+
+    # Returns the (cell, wedge) pairs as two arrays, ordered by cell
+    def pairs(self):
+        np = backends.numpy()
+        return np.repeat(np.arange(self.grid_cells**2), np.diff(self.offsets)), self.wedge_ids
+
+    def nbytes(self):
+        return self.offsets.nbytes + self.wedge_ids.nbytes
+
+# The wedges of a block as one bit per (cell, wedge), which is smaller than
+# lists once wedges reach more than a few dozen cells each
+class CellBits:
+    def __init__(self, grid_cells, bits, wedge_count):
+        self.grid_cells = grid_cells
+        self.bits = bits
+        self.wedge_count = wedge_count
+
+    def wedges(self, cell):
+        np = backends.numpy()
+        return np.flatnonzero(np.unpackbits(self.bits[cell], count=self.wedge_count, bitorder="little"))
+
+    # Returns the (cell, wedge) pairs as two arrays, ordered by cell
+    def pairs(self):
+        np = backends.numpy()
+        return np.nonzero(np.unpackbits(self.bits, axis=1, count=self.wedge_count, bitorder="little"))
+
+    def nbytes(self):
+        return self.bits.nbytes
+
+# The work of building one block: its focal points (a copy, so it can be built
+# on another thread) and the block it extends, if any
+class WedgeBuild:
+    def __init__(self, block, fps_and_yaws, flipped, base=None):
+        self.block = block
+        self.fps_and_yaws = fps_and_yaws
+        self.flipped = flipped
+        self.base = base
+
+class WedgeIndex:
+    def __init__(self, fps_and_yaws, flipped, exact=False):
+        # The indexed fpStore.FPStore; wedge i is yaw range i of the store, counting the ranges of all focal points
+        self.fps_and_yaws = fps_and_yaws
+        self.flipped = flipped
+        # Cells are found with a margin around the yaws, so they do not depend on 'exact'; only queries do
+        self.exact = exact
+        # Blocks ordered by focal point, including the one being built
+        self._blocks = []
+
+    # Returns the number of focal points covered by built blocks
+    def indexed_fp_count(self):
+        return sum(block.fp_count for block in self._blocks if block.cells is not None)
+
+    # Returns whether every focal point of the store is indexed, so queries are complete
+    def ready(self):
+        if not backends.has_numpy():
+            return True
+        return self.indexed_fp_count() == len(self.fps_and_yaws)
+
+    # Returns the bytes used by the cells' wedges
+    def nbytes(self):
+        return sum(block.cells.nbytes() for block in self._blocks if block.cells is not None)
+
+    # Returns a WedgeBuild for the first focal points that are not indexed yet, or None
+    #
+    # Only one block is built at a time: while one is, this returns None. Small
+    # additions (e.g. lines appended to a watched file) extend the block before 
+    # them instead of becoming blocks of their own.
+    def next_build(self):
+        if not backends.has_numpy() or any(block.cells is None for block in self._blocks):
+            return None
+        gap = self._first_gap()
+        if gap is None:
+            return None
+        position, start, stop = gap
+        store = self.fps_and_yaws
+        first_range = store.first_range(start)
+        stop = min(stop, max(start + 1, store.range_owner(first_range + BLOCK_RANGES)))
+        range_count = store.first_range(stop) - first_range
+
+        base = self._blocks[position - 1] if position > 0 else None
+        if (base is None or base.first_fp + base.fp_count != start 
+                or base.range_count + range_count > BLOCK_RANGES):
+            base = None
+        if base is not None:
+            position -= 1
+            del self._blocks[position]
+            block = WedgeBlock(base.first_fp, base.fp_count + stop - start, base.first_range, 
+                               base.range_count + range_count)
+        else:
+            block = WedgeBlock(start, stop - start, first_range, range_count)
+        self._blocks.insert(position, block)
+        return WedgeBuild(block, store[start:stop], self.flipped, base)
+
+    # Helper for finding the first focal points not covered by a block; returns (block position, start, stop) or None
+    def _first_gap(self):
+        expected = 0
+        for position, block in enumerate(self._blocks):
+            if block.first_fp > expected:
+                return position, expected, block.first_fp
+            expected = block.first_fp + block.fp_count
+        if expected < len(self.fps_and_yaws):
+            return len(self._blocks), expected, len(self.fps_and_yaws)
+        return None
+
+    # Adds the cells computed for a build; builds made out of date by replace() are ignored
+    def install(self, build, cells):
+        if cells is not None and any(block is build.block for block in self._blocks):
+            build.block.cells = cells
+
+    # Builds every missing block on the calling thread
+    def update(self):
+        build = self.next_build()
+        while build is not None:
+            self.install(build, compute_block(build))
+            build = self.next_build()
+
+    # Updates the index after the focal points store[start:end] were replaced by 'count' others
+    #
+    # Blocks containing replaced focal points, or focal points inserted between 
+    # two of theirs, are dropped so they are built again; later blocks are only 
+    # renumbered. A block being built is dropped the same way, which makes its 
+    # build out of date.
+    def replace(self, start, end, count):
+        kept = []
+        for block in self._blocks:
+            if block.first_fp < end and start < block.first_fp + block.fp_count:
+                continue
+            if block.first_fp >= end:
+                block.first_fp += count - (end - start)
+                block.first_range = self.fps_and_yaws.first_range(block.first_fp)
+            kept.append(block)
+        self._blocks = kept
+
+    # Returns the sorted (focal point index, range index) pairs whose wedges contain (x, z)
+    #
+    # The result only covers indexed focal points, so it is complete once ready()
+    # returns True. Positions outside the map are not covered by the grid and
+    # are checked against every wedge.
+    def query(self, x, z):
+        cell_x = int((x - MAP_MIN) // CELL_SIZE)
+        cell_z = int((z - MAP_MIN) // CELL_SIZE)
+        if not backends.has_numpy() or not (0 <= cell_x < GRID_CELLS and 0 <= cell_z < GRID_CELLS):
+            return self._scan(x, z, range(self.fps_and_yaws.range_count()))
+
+        np = backends.numpy()
+        candidates = [np.zeros(0, dtype=np.uint64)]
+        for block in self._blocks:
+            if block.cells is not None:
+                # Cells of coarser grids cover whole groups of cells of the finest one
+                scale = GRID_CELLS // block.cells.grid_cells
+                cell = (cell_z // scale) * block.cells.grid_cells + cell_x // scale
+                candidates.append(block.first_range + block.cells.wedges(cell).astype(np.uint64))
+        candidates = np.concatenate(candidates)
+        if len(candidates) < VECTORIZE_MIN_CANDIDATES:
+            return self._scan(x, z, candidates.tolist())
+
+        # Candidates are checked all at once, with the same yaw computation and range check as geometry.py
+        offsets = self.fps_and_yaws.offset_array()
+        wedge_fps = np.searchsorted(offsets, candidates, side="right") - 1
+        fps = self.fps_and_yaws.fp_array()[wedge_fps]
+        yaws = raster.sample_yaws((fps[:, 0], fps[:, 1]), np.array(x, dtype=np.float64), 
+                                  np.array(z, dtype=np.float64), self.flipped, self.exact).astype(np.int64)
+        yaw_ranges = self.fps_and_yaws.yaw_array()[candidates].astype(np.int64)
+        starts = yaw_ranges[:, 0]
+        ends = yaw_ranges[:, 1]
+        inside = np.where(starts <= ends, (yaws >= starts) & (yaws <= ends), (yaws >= starts) | (yaws <= ends))
+
+        order = np.argsort(candidates[inside])
+        accepted_fps = wedge_fps[inside][order]
+        accepted_ranges = (candidates[inside][order] - offsets[accepted_fps]).astype(np.int64)
+        return list(zip(accepted_fps.tolist(), accepted_ranges.tolist()))
+
+    # Helper for checking a list of candidate wedges one at a time
+    def _scan(self, x, z, candidates):
+        tp = (x, z)
+        yaws = {}
+        accepting = []
+        for wedge in candidates:
+            fp_index = self.fps_and_yaws.range_owner(wedge)
+            if fp_index not in yaws:
+                fp = self.fps_and_yaws.focal_point(fp_index)
+                yaws[fp_index] = compute_p2p_yaw(fp, tp, self.exact) if self.flipped else compute_p2p_yaw(tp, fp, self.exact)
+            if yaw_within_yaw_range(yaws[fp_index], self.fps_and_yaws.yaw_range(wedge)):
+                accepting.append((fp_index, wedge - self.fps_and_yaws.first_range(fp_index)))
+        accepting.sort()
+        return accepting
+
+    # Returns the position of a focal point and one of its yaw ranges
+    def wedge(self, fp_index, range_index):
+        return (self.fps_and_yaws.focal_point(fp_index), 
+                self.fps_and_yaws.yaw_range(self.fps_and_yaws.first_range(fp_index) + range_index))
+
+# Computes the cells of a WedgeBuild; safe to run on a worker thread
+#
+# Returns None once 'cancelled' reports that the build is no longer needed.
+def compute_block(build, cancelled=lambda: False):
+    np = backends.numpy()
+    fps_and_yaws = build.fps_and_yaws
+    first_wedge = 0 if build.base is None else build.base.range_count
+    fps = fps_and_yaws.fp_array()
+    yaw_ranges = fps_and_yaws.yaw_array().astype(np.int32)
+    wedge_fps = np.repeat(np.arange(len(fps_and_yaws)), np.diff(fps_and_yaws.offset_array()).astype(np.int64))
+    starts = yaw_ranges[:, 0]
+    lengths = (yaw_ranges[:, 1] - starts) & 0xFFFF
+
+    cell_chunks = [np.zeros(0, dtype=np.int64)]
+    wedge_chunks = [np.zeros(0, dtype=np.int64)]
+    chunk_size = max(1, BUILD_CHUNK_ELEMENTS // GRID_CELLS**2)
+    for chunk_start in range(0, len(wedge_fps), chunk_size):
+        if cancelled():
+            return None
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        chunk_fps, fp_slots = np.unique(wedge_fps[chunk], return_inverse=True)
+        arc_starts, arc_lengths = _cell_arcs(fps[chunk_fps], build.flipped)
+        arc_starts = arc_starts[fp_slots]
+        arc_lengths = arc_lengths[fp_slots]
+
+        # Two arcs on the circle overlap if either one's start lies within the other
+        wedge_starts = starts[chunk, None, None]
+        overlap = (wedge_starts - arc_starts) & 0xFFFF <= arc_lengths
+        overlap |= (arc_starts - wedge_starts) & 0xFFFF <= lengths[chunk, None, None]
+
+        wedges, cell_zs, cell_xs = np.nonzero(overlap)
+        cell_chunks.append(cell_zs * GRID_CELLS + cell_xs)
+        wedge_chunks.append(wedges + (first_wedge + chunk_start))
+
+    cells = np.concatenate(cell_chunks)
+    wedges = np.concatenate(wedge_chunks)
+    grid_cells = GRID_CELLS
+    if build.base is not None:
+        # The new wedges are brought to the extended block's grid, and its wedges come first, so each 
+        # cell keeps its wedges in order
+        while grid_cells > build.base.cells.grid_cells:
+            cells, wedges = _merge_cells(cells, wedges, build.block.range_count, grid_cells)
+            grid_cells //= 2
+        base_cells, base_wedges = build.base.cells.pairs()
+        cells = np.concatenate([base_cells, cells])
+        wedges = np.concatenate([base_wedges, wedges])
+    return _cells_from_pairs(cells, wedges, build.block.range_count, grid_cells)
+
+# Helper for finding the arc of yaws (start, length) each cell spans as seen from each focal point
+#
+# Returns two N x GRID_CELLS x GRID_CELLS arrays indexed by [fp, z, x].
+def _cell_arcs(fps, flipped):
+    np = backends.numpy()
+    coords = MAP_MIN + np.arange(GRID_CELLS + 1, dtype=np.float64) * CELL_SIZE
+    yaws = raster.sample_yaws((fps[:, 0, None, None], fps[:, 1, None, None]),
+                              coords[None, None, :], coords[None, :, None], flipped).astype(np.int32)
+    corners = np.stack([yaws[:, :-1, :-1], yaws[:, :-1, 1:], yaws[:, 1:, :-1], yaws[:, 1:, 1:]])
+
+    # Signed offsets from the first corner's yaw bound the arc, like in raster.reaching_fps
+    offsets = ((corners - corners[0] + 32768) & 0xFFFF) - 32768
+    low = offsets.min(axis=0) - raster.REGION_YAW_MARGIN
+    high = offsets.max(axis=0) + raster.REGION_YAW_MARGIN
+
+    # From inside a cell, every yaw reaches it
+    cell_xs = np.floor((fps[:, 0] - MAP_MIN) / CELL_SIZE).astype(np.int64)
+    cell_zs = np.floor((fps[:, 1] - MAP_MIN) / CELL_SIZE).astype(np.int64)
+    everything = high - low >= 65535
+    for dx in (-1, 0):
+        for dz in (-1, 0):
+            # Focal points on a cell edge lie in the neighboring cells as well
+            xs = np.where((fps[:, 0] - MAP_MIN) % CELL_SIZE == 0, cell_xs + dx, cell_xs)
+            zs = np.where((fps[:, 1] - MAP_MIN) % CELL_SIZE == 0, cell_zs + dz, cell_zs)
+            valid = (0 <= xs) & (xs < GRID_CELLS) & (0 <= zs) & (zs < GRID_CELLS)
+            everything[np.flatnonzero(valid), zs[valid], xs[valid]] = True
+
+    arc_starts = np.where(everything, 0, (corners[0] + low) & 0xFFFF)
+    arc_lengths = np.where(everything, 65535, high - low)
+    return arc_starts, arc_lengths
+
+# Helper for storing (cell, wedge) pairs of a grid_cells x grid_cells grid as CellLists or CellBits
+#
+# Whichever takes less memory is used. While that is more than the block's
+# budget (MAX_BYTES_PER_RANGE per wedge), 2 x 2 cells are merged into one, 
+# down to an 8 x 8 grid, where one bit per cell and wedge always fits. Wedge
+# ids in lists are stored as uint16 when there are few enough wedges.
+def _cells_from_pairs(cells, wedges, wedge_count, grid_cells=GRID_CELLS):
+    np = backends.numpy()
+    id_type = np.uint16 if wedge_count <= 65536 else np.uint32
+    budget = max(MAX_BYTES_PER_RANGE * wedge_count, MIN_BLOCK_BUDGET)
+    while True:
+        list_bytes = len(wedges) * np.dtype(id_type).itemsize + 4 * (grid_cells**2 + 1)
+        bit_bytes = grid_cells**2 * ((wedge_count + 7) // 8)
+        if min(list_bytes, bit_bytes) <= budget or grid_cells <= 8:
+            break
+        cells, wedges = _merge_cells(cells, wedges, wedge_count, grid_cells)
+        grid_cells //= 2
+
+    if bit_bytes < list_bytes:
+        bits = np.zeros((grid_cells**2, wedge_count), dtype=bool)
+        bits[cells, wedges] = True
+        return CellBits(grid_cells, np.packbits(bits, axis=1, bitorder="little"), wedge_count)
+
+    # A stable sort keeps the wedges of each cell in the order they were added
+    order = np.argsort(cells, kind="stable")
+    offsets = np.searchsorted(cells[order], np.arange(grid_cells**2 + 1)).astype(np.uint32)
+    return CellLists(grid_cells, offsets, wedges[order].astype(id_type))
+
+# Helper for turning (cell, wedge) pairs into the pairs of a grid with half as many cells along each axis
+#
+# The pairs are returned ordered by cell and wedge, without duplicates.
+def _merge_cells(cells, wedges, wedge_count, grid_cells):
+    np = backends.numpy()
+    merged = (cells // grid_cells // 2) * (grid_cells // 2) + (cells % grid_cells) // 2
+    present = np.zeros(((grid_cells // 2)**2, wedge_count), dtype=bool)
+    present[merged, wedges] = True
+    return np.nonzero(present)
@@ -0,0 +1,270 @@
+from array import array
+from bisect import bisect_right
+from fpStore import FPStore, check_resizable
+import backends
+
+
+"""
+Per-focal-point index of acceptable yaws.
+
+The raw yaw ranges of a focal point may overlap and may wrap around from 65535
+to 0. Building a YawIndex splits wrap-around ranges at the 0/65535 boundary,
+merges overlapping and adjacent ranges, and stores what is left as sorted 
+parallel arrays of range starts and ends. Checking whether a yaw is accepted
+is then a single bisect instead of a walk over every raw range.
+
+The indices of all loaded focal points are kept in a YawIndexStore, which
+lays the merged ranges out in flat arrays like an FPStore (see fpStore.py)
+instead of holding one YawIndex object per focal point.
+"""
+
+# Spacing of the keys of consecutive focal points while merging ranges in bulk, 
+# leaving a gap so ranges of different focal points are never adjacent
+MERGE_KEY_SPACING = 131072
+
+# Helper for splitting yaw ranges at the wrap point and merging them into sorted, disjoint ranges
+def merge_yaw_ranges(yaw_ranges):
+    pieces = []
+    for start, end in yaw_ranges:
+        if start <= end:
+            pieces.append((start, end))
+        else:
+            pieces.append((start, 65535))
+            pieces.append((0, end))
+
+    merged = []
+    for start, end in sorted(pieces):
+        # Yaws outside [0, 65535] are never produced, so clip them away
+        start = max(start, 0)
+        end = min(end, 65535)
+        if start > end:
+            continue
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    return merged
+
+class YawIndex:
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, yaw_ranges):
+        merged = merge_yaw_ranges(yaw_ranges)
+        self.starts = array('H', [yaw_range[0] for yaw_range in merged])
+        self.ends = array('H', [yaw_range[1] for yaw_range in merged])
+
+    # Builds an index from arrays of ranges that are already sorted and merged
+    @classmethod
+    def from_merged(cls, starts, ends):
+        index = cls.__new__(cls)
+        index.starts = starts
+        index.ends = ends
+        return index
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Returns whether a yaw in [0, 65535] lies within any of the indexed ranges
+    def contains(self, yaw):
+        i = bisect_right(self.starts, yaw) - 1
+        return i >= 0 and yaw <= self.ends[i]
+
+# The yaw indices of many focal points in flat arrays:
+#
+#  - offsets: focal point i owns the merged ranges [offsets[i], offsets[i + 1])
+#  - starts:  uint16 start of every merged range
+#  - ends:    uint16 end of every merged range
+#
+# It behaves like the list of YawIndex objects it replaces: indexing returns 
+# a YawIndex with copies of one focal point's ranges, slices return a new 
+# store, and append/extend and slice assignment take YawIndex objects or stores.
+class YawIndexStore:
+    def __init__(self, yaw_indices=()):
+        self._offsets = array('Q', [0])
+        self._starts = array('H')
+        self._ends = array('H')
+        self.extend(yaw_indices)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    # Returns the total number of merged yaw ranges
+    def range_count(self):
+        return len(self._starts)
+
+    def append(self, yaw_index):
+        check_resizable((self._offsets, self._starts, self._ends))
+        self._starts.extend(yaw_index.starts)
+        self._ends.extend(yaw_index.ends)
+        self._offsets.append(len(self._starts))
+
+    # Adds the index of a focal point with the given raw yaw ranges
+    def append_yaw_ranges(self, yaw_ranges):
+        check_resizable((self._offsets, self._starts, self._ends))
+        for start, end in merge_yaw_ranges(yaw_ranges):
+            self._starts.append(start)
+            self._ends.append(end)
+        self._offsets.append(len(self._starts))
+
+    def extend(self, yaw_indices):
+        if isinstance(yaw_indices, YawIndexStore):
+            check_resizable((self._offsets, self._starts, self._ends))
+            base = self.range_count()
+            self._starts.extend(yaw_indices._starts)
+            self._ends.extend(yaw_indices._ends)
+            self._offsets.extend(base + offset for offset in yaw_indices._offsets[1:])
+            return
+        for yaw_index in yaw_indices:
+            self.append(yaw_index)
+
+    def clear(self):
+        check_resizable((self._offsets, self._starts, self._ends))
+        del self._starts[:]
+        del self._ends[:]
+        del self._offsets[1:]
+
+    def copy(self):
+        return self[:]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # Integers return a YawIndex, slices (without a step) a new YawIndexStore with copies of the arrays
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop = self._slice_bounds(key)
+            store = YawIndexStore()
+            first, last = self._offsets[start], self._offsets[stop]
+            store._starts = self._starts[first:last]
+            store._ends = self._ends[first:last]
+            store._offsets = array('Q', (offset - first for offset in self._offsets[start:stop + 1]))
+            return store
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("YawIndexStore index out of range")
+        first, last = self._offsets[key], self._offsets[key + 1]
+        return YawIndex.from_merged(self._starts[first:last], self._ends[first:last])
+
+    # Replaces a slice of focal points with the given yaw indices
+    def __setitem__(self, key, yaw_indices):
+        if not isinstance(key, slice):
+            raise TypeError("YawIndexStore only supports assigning to slices")
+        start, stop = self._slice_bounds(key)
+        check_resizable((self._offsets, self._starts, self._ends))
+        tail = self[stop:]
+        new = yaw_indices if isinstance(yaw_indices, YawIndexStore) else YawIndexStore(yaw_indices)
+        del self[start:]
+        self.extend(new)
+        self.extend(tail)
+
+    def __delitem__(self, key):
+        if not isinstance(key, slice):
+            index = key + len(self) if key < 0 else key
+            if not 0 <= index < len(self):
+                raise IndexError("YawIndexStore index out of range")
+            key = slice(index, index + 1)
+        start, stop = self._slice_bounds(key)
+        check_resizable((self._offsets, self._starts, self._ends))
+        tail = self[stop:] if stop < len(self) else None
+        first = self._offsets[start]
+        del self._starts[first:]
+        del self._ends[first:]
+        del self._offsets[start + 1:]
+        if tail is not None:
+            self.extend(tail)
+
+    # Helper for turning a slice into (start, stop) focal point indices
+    def _slice_bounds(self, key):
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("YawIndexStore slices cannot have a step")
+        return start, max(start, stop)
+
+    # Returns whether focal point i accepts a yaw in [0, 65535], without creating a YawIndex
+    def contains(self, i, yaw):
+        first = self._offsets[i]
+        j = bisect_right(self._starts, yaw, first, self._offsets[i + 1]) - 1
+        return j >= first and yaw <= self._ends[j]
+
+    # Returns the N + 1 range offsets as a uint64 NumPy array that shares memory with the store
+    #
+    # As with FPStore, views should not be kept around, as the store cannot be changed while they are alive.
+    def offset_array(self):
+        np = backends.numpy()
+        return np.frombuffer(self._offsets, dtype=np.uint64)
+
+    # Returns the range starts as a uint16 NumPy array that shares memory with the store
+    def start_array(self):
+        np = backends.numpy()
+        return np.frombuffer(self._starts, dtype=np.uint16)
+
+    # Returns the range ends as a uint16 NumPy array that shares memory with the store
+    def end_array(self):
+        np = backends.numpy()
+        return np.frombuffer(self._ends, dtype=np.uint16)
+
+    # Returns the bytes used by the arrays (not counting spare capacity)
+    def nbytes(self):
+        return sum(len(section) * section.itemsize for section in (self._offsets, self._starts, self._ends))
+
+# Helper for building the yaw indices of every focal point as a YawIndexStore
+#
+# The ranges of an FPStore are merged in bulk with NumPy when it is available.
+def build_yaw_indices(fps_and_yaws):
+    if isinstance(fps_and_yaws, FPStore) and backends.has_numpy():
+        return _build_yaw_indices_numpy(fps_and_yaws)
+    store = YawIndexStore()
+    for fp, yaw_ranges in fps_and_yaws:
+        store.append_yaw_ranges(yaw_ranges)
+    return store
+
+# Helper for merging the yaw ranges of every focal point of an FPStore at once (vectorized merge_yaw_ranges)
+def _build_yaw_indices_numpy(fps_and_yaws):
+    np = backends.numpy()
+    yaws = fps_and_yaws.yaw_array().astype(np.int64)
+    range_counts = np.diff(fps_and_yaws.offset_array()).astype(np.int64)
+    bases = np.repeat(np.arange(len(fps_and_yaws), dtype=np.int64) * MERGE_KEY_SPACING, range_counts)
+
+    # Wrap-around ranges are split at the 65535/0 boundary, as in merge_yaw_ranges
+    wrapping = yaws[:, 0] > yaws[:, 1]
+    starts = np.concatenate([bases + yaws[:, 0], bases[wrapping]])
+    ends = np.concatenate([bases + np.where(wrapping, 65535, yaws[:, 1]), bases[wrapping] + yaws[wrapping, 1]])
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = ends[order]
+
+    # A merged range starts wherever a piece begins after the end of every piece sorted before it
+    reach = np.maximum.accumulate(ends) if len(ends) > 0 else ends
+    firsts = np.flatnonzero(np.concatenate([[True], starts[1:] > reach[:-1] + 1])) if len(starts) > 0 else starts
+    lasts = np.append(firsts[1:] - 1, len(starts) - 1) if len(starts) > 0 else starts
+    merged_starts = starts[firsts]
+    merged_ends = reach[lasts]
+
+    counts = np.bincount(merged_starts // MERGE_KEY_SPACING, minlength=len(fps_and_yaws))
+    store = YawIndexStore()
+    store._offsets = array('Q', np.concatenate([[0], np.cumsum(counts)]).astype(np.uint64).tobytes())
+    store._starts = array('H', (merged_starts % MERGE_KEY_SPACING).astype(np.uint16).tobytes())
+    store._ends = array('H', (merged_ends % MERGE_KEY_SPACING).astype(np.uint16).tobytes())
+    return store
+
+# Helper for flattening yaw indices into one sorted NumPy array of range start keys and one of end keys
+#
+# The i-th index (counting from first_index) owns the keys [i * 65536, i * 65536 + 65535], 
+# so a single searchsorted call can look up yaws of many focal points at once.
+def flatten_yaw_indices(yaw_indices, first_index=0):
+    np = backends.numpy()
+    if isinstance(yaw_indices, YawIndexStore):
+        range_counts = np.diff(yaw_indices.offset_array()).astype(np.int64)
+        keys = np.repeat(np.arange(first_index, first_index + len(yaw_indices), dtype=np.int64) * 65536, range_counts)
+        return yaw_indices.start_array() + keys, yaw_indices.end_array() + keys
+    if len(yaw_indices) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    key_starts = [np.frombuffer(index.starts, dtype=np.uint16).astype(np.int64) + i * 65536 
+                  for i, index in enumerate(yaw_indices, first_index)]
+    key_ends = [np.frombuffer(index.ends, dtype=np.uint16).astype(np.int64) + i * 65536 
+                for i, index in enumerate(yaw_indices, first_index)]
+    return np.concatenate(key_starts), np.concatenate(key_ends)